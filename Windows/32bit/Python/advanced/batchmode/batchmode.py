@@ -0,0 +1,95 @@
+# Demo for access to HydraHarp 400 Hardware via HHLIB.DLL v 3.0.
+#
+# The program works through a measurement plan without any prompts:
+# histogramming, T2/T3 and continuous mode runs back to back, with as
+# little dead time between them as possible, and reports the duty cycle
+# achieved at the end. The plan below is hard coded, a plan in a JSON file
+# of the same structure can be given on the command line instead:
+#
+#   python batchmode.py plan.json
+#
+# Every run writes a file of its own, see hydraharp/batch.py.
+#
+# Tested with HHLib v.3.0.0.4 and Python 3.11.3
+#
+# Note: This is a console application (i.e. run in Windows cmd box).
+#
+# Note: With simulate = True the demo runs on synthetic data without a
+#       device, e.g. to try a plan on any machine.
+
+import sys
+import os
+
+# The hydraharp helper package resides next to this demo folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from hydraharp.batch import BatchRunner, loadPlan, checkPlan
+from hydraharp.device import HydraHarp, HHError, MAXDEVNUM, libraryVersion, LIB_VERSION
+from hydraharp.synth import SimulatedHydraHarp
+
+# Measurement plan, these are hardcoded since this is just a demo
+# mode: HIST, T2, T3 or CONT
+# tacq: measurement time of each run in millisec (histogram time in CONT)
+# runs: number of runs (blocks in CONT)
+# lenCode: histogram length code, meaningful only in HIST and CONT
+# settings: see DEFAULTSETTINGS in hydraharp/device.py
+plan = [
+    {"name": "histo", "mode": "HIST", "tacq": 1000, "runs": 5, "lenCode": 6},
+    {"name": "tttr", "mode": "T2", "tacq": 1000, "runs": 3},
+    # Each block holds the histograms of 100 ms, lenCode 0 for 1024 bins, up to 3 for 8192
+    {"name": "cont", "mode": "CONT", "tacq": 100, "runs": 20, "lenCode": 0,
+     "settings": {"binning": 0, "offset": 0}},
+]
+outputDir = "batchmodeout" # Directory the files of all runs go to
+simulate  = False # True runs on synthetic data without a device
+
+# In this demo we use the first HydraHarp device we find.
+def openFirstDevice():
+    for i in range(0, MAXDEVNUM):
+        device = HydraHarp(i)
+        try:
+            print("  %1d        S/N %s" % (i, device.open()))
+            return device
+        except HHError as exc:
+            print("  %1d        %s" % (i, "no device" if exc.retcode == -1 else exc))
+    return None
+
+try:
+    plan = loadPlan(sys.argv[1]) if len(sys.argv) > 1 else checkPlan(plan)
+except (OSError, ValueError) as exc:
+    print("Invalid plan: %s" % exc)
+    sys.exit(1)
+nRuns = sum(entry["runs"] for entry in plan)
+seconds = sum(entry["runs"] * entry["tacq"] for entry in plan) / 1000.0
+print("Plan: %d runs, %.1f s of measurement" % (nRuns, seconds))
+
+if simulate:
+    device = SimulatedHydraHarp(photonRate=1e6)
+else:
+    print("Library version is %s" % libraryVersion())
+    if libraryVersion() != LIB_VERSION:
+        print("Warning: The application was built for version %s" % LIB_VERSION)
+    print("\nSearching for HydraHarp devices...")
+    print("Devidx     Status")
+    device = openFirstDevice()
+    if device is None:
+        print("No device available.")
+        sys.exit(0)
+
+os.makedirs(outputDir, exist_ok=True)
+runner = BatchRunner(device, outputDir)
+
+def onRun(result):
+    print("%-12s run %4d  %5s  %12d %s"
+          % (result["name"], result["run"], result["mode"], result["counts"],
+             "counts" if result["mode"] in ("HIST", "CONT") else "records"))
+
+try:
+    print("\nRunning the plan...\n")
+    runner.run(plan, onRun)
+    print("\nDone\n")
+except HHError as exc:
+    print("%s. Aborted." % exc)
+finally:
+    runner.close()
+    device.close()
+print(runner.report())
@@ -0,0 +1,55 @@
+# HydraHarp 400  HHLIB v3.0  Python helper package for the advanced demos.
+#
+# Provides vectorized decoding of TTTR records with NumPy, either block by
+# block or as a stream with TTTRDecoder, into compact structured event
+# arrays. TimeBase converts event times to exact integer picoseconds.
+# RecordView decodes raw record buffers and files lazily, column by column.
+# SyntheticStream generates realistic record streams for testing without a
+# device, python -m hydraharp.throughput times all decoding paths on them.
+# AcquisitionEngine reads the FiFo of a HydraHarp (or SimulatedHydraHarp)
+# in a thread of its own into the preallocated buffers of a BufferPool and
+# processes the data in further threads, PollScheduler paces the reads,
+# FifoMonitor warns of impending FiFo overruns and a SpillQueue moves the
+# chunks the processing cannot take yet to disk. With recover set the engine
+# restarts the measurement after an overrun and marks the lost time by a Gap. MultiDeviceEngine runs
+# an AcquisitionEngine for each of several devices opened by serial number,
+# python -m hydraharp.multibench shows how the throughput scales.
+# EventMerger merges the event streams of several devices into one time
+# ordered stream, python -m hydraharp.mergebench times the merge.
+# AsyncHydraHarp offers the device, TTTR chunks, continuous mode blocks
+# (see ContModeBlock) and histograms to asyncio applications.
+# CompletionWaiter waits for the end of a measurement without spinning,
+# python -m hydraharp.waitbench compares it with polling. BatchRunner works
+# through a measurement plan of histogramming, T2/T3 and continuous mode
+# runs without prompts and reports the duty cycle achieved.
+# MappedWriter writes raw output into a preallocated, memory mapped file,
+# python -m hydraharp.writebench times raw record writes. SegmentedWriter
+# splits long runs into segment files that decode on their own.
+# BackgroundCompressor compresses raw records in worker threads into a
+# seekable file, python -m hydraharp.compressbench compares the codecs.
+
+from .decode import (decodeT2, decodeT3, TTTRDecoder, RecordFilter, collapseOverflows,
+                     countRecords,
+                     MODE_T2, MODE_T3, RECORD_PHOTONS, RECORD_MARKERS, RECORD_SYNC,
+                     RECORD_OVERFLOWS, RECORD_ALL)
+from .events import (T2EVENT, T3EVENT, EVENT_MARKER, toT2Events, toT3Events,
+                     selectPhotons, selectMarkers)
+from .timebase import TimeBase
+from .view import RecordView
+from .synth import SyntheticStream, SimulatedHydraHarp, syntheticRecords
+from .device import HydraHarp, HHError
+from .buffers import BufferPool
+from .polling import PollScheduler
+from .telemetry import FifoMonitor
+from .spill import SpillQueue
+from .engine import AcquisitionEngine, Gap
+from .multi import MultiDeviceEngine, openDevices
+from .merge import EventMerger, MERGEDEVENT, mergeStreams, fitClock
+from .completion import CompletionWaiter
+from .contmode import ContModeBlock
+from .aio import AsyncHydraHarp
+from .writers import MappedWriter
+from .segments import SegmentedWriter, Segment, findSegments
+from .compress import BackgroundCompressor, CompressedWriter, CompressedReader
+from .batch import BatchRunner, loadPlan
+from .sinks import EventSink, EventDispatcher, PerEventAdapter, TextWriter
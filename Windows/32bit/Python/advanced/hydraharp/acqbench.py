@@ -0,0 +1,147 @@
+# HydraHarp 400  HHLIB v3.0  Acquisition loop benchmark.
+#
+# Runs acquisitions on a SimulatedHydraHarp, so no device is needed, and
+# compares the single loop of the instant processing demo with the
+# threaded AcquisitionEngine when the processing stalls now and then, as
+# it does when the disk or the rest of the system is busy.
+# Then it lets the processing fall behind the data for good and shows how
+# long before the overrun the FifoMonitor warns, and how the threaded
+# engine avoids the overrun by skipping the processing on that warning.
+# Finally the processing stalls for longer than the queues can bridge, and
+# the threaded engine spills the chunks to disk instead of overrunning, or
+# recovers from the overrun by restarting the measurement.
+#
+# Usage: python -m hydraharp.acqbench [photonRate]
+
+import ctypes as ct
+import sys
+import threading
+import time
+import numpy as np
+
+from .decode import TTTRDecoder, TTREADMAX, MODE_T2
+from .device import FLAG_FIFOFULL
+from .engine import AcquisitionEngine
+from .synth import SimulatedHydraHarp
+from .telemetry import FifoMonitor
+from .timebase import TimeBase
+
+
+# stallingConsumer
+# Returns a function histogramming the events of a chunk by channel that
+# stalls for stall s once every stallEvery s, and the histogram.
+def stallingConsumer(stall=0.5, stallEvery=2.0):
+    histogram = np.zeros(256, dtype=np.int64)
+    nextStall = [None]
+    def consume(events):
+        if nextStall[0] is None:
+            nextStall[0] = time.perf_counter() + stallEvery
+        elif time.perf_counter() >= nextStall[0]:
+            time.sleep(stall)
+            nextStall[0] = time.perf_counter() + stallEvery
+        histogram[:] += np.bincount(events["channel"], minlength=256)
+    return consume, histogram
+
+# slowConsumer
+# Returns a function histogramming the events of a chunk that takes as
+# long as if it could handle only capacity events/s.
+def slowConsumer(capacity):
+    histogram = np.zeros(256, dtype=np.int64)
+    def consume(events):
+        time.sleep(len(events) / capacity)
+        histogram[:] += np.bincount(events["channel"], minlength=256)
+    return consume
+
+# singleLoop
+# The acquisition loop of the instant processing demo: read, then process.
+# Returns the records read and whether the FiFo overran.
+# monitor: FifoMonitor to pass every read to, if any
+def singleLoop(device, tacq, consume, monitor=None):
+    buffer = (ct.c_uint * TTREADMAX)()
+    decoder = TTTRDecoder(device.mode)
+    device.startMeas(tacq)
+    while True:
+        if device.getFlags() & FLAG_FIFOFULL:
+            device.stopMeas()
+            return decoder.recNum, True
+        nRecords = device.readFiFo(buffer, TTREADMAX)
+        if monitor is not None:
+            monitor.gotRecords(nRecords)
+        if nRecords > 0:
+            consume(decoder.feed(np.frombuffer(buffer, dtype=np.uint32, count=nRecords)))
+        elif device.ctcStatus():
+            device.stopMeas()
+            return decoder.recNum, False
+
+# threadedLoop
+# The same with the reader thread and decode and process stages.
+# shed: s to skip the process stage for whenever the FiFo monitor warns
+# spill: spill chunks to disk when the decode queue is full
+# recover: restart the measurement after an overrun, the decoder then
+#          continues at the restart
+def threadedLoop(device, tacq, consume, shed=None, spill=False, recover=False):
+    engine = AcquisitionEngine(device, spill=spill, recover=recover)
+    decoder = TTTRDecoder(device.mode)
+    timeBase = TimeBase.fromDevice(device.mode, device.getResolution())
+    engine.addStage("decode", decoder.feed, onGap=lambda gap: gap.resume(decoder, timeBase))
+    process = engine.addStage("process", consume)
+    if shed is not None:
+        def resume():
+            process.skip = False
+        def onWarning(monitor):
+            process.skip = True
+            threading.Timer(shed, resume).start()
+        engine.monitor.onWarning = onWarning
+    engine.run(tacq)
+    return engine
+
+def main(argv):
+    photonRate = float(argv[1]) if len(argv) > 1 else 4e6
+    tacq = 5000
+    settings = {"photonRate": photonRate, "fifoSize": 1024 * 1024}
+
+    print("Photon rate %.0f/s, FiFo of %d records, processing stalls 0.5 s every 2 s"
+          % (photonRate, settings["fifoSize"]))
+    nRecords, overrun = singleLoop(SimulatedHydraHarp(MODE_T2, **settings), tacq,
+                                   stallingConsumer()[0])
+    print("Single loop   : %10d records, %s" % (nRecords, "FiFo overrun!" if overrun else "ok"))
+    engine = threadedLoop(SimulatedHydraHarp(MODE_T2, **settings), tacq,
+                          stallingConsumer()[0])
+    print("Threaded      : %10d records, %s"
+          % (engine.nRecords, "FiFo overrun!" if engine.overrun else "ok"))
+    print(engine.report())
+
+    capacity = 0.6 * photonRate
+    settings["fifoSize"] = 4 * 1024 * 1024
+    print("\nProcessing limited to %.0f events/s, FiFo of %d records"
+          % (capacity, settings["fifoSize"]))
+    device = SimulatedHydraHarp(MODE_T2, **settings)
+    monitor = FifoMonitor(settings["fifoSize"], device=device)
+    nRecords, overrun = singleLoop(device, 3 * tacq, slowConsumer(capacity), monitor)
+    firstWarning = monitor.firstWarning if monitor.firstWarning is not None else float("nan")
+    print("Single loop   : %10d records, %s after %.1f s, first warning after %.1f s"
+          % (nRecords, "FiFo overrun" if overrun else "ok",
+             monitor.lastRead - monitor.startTime, firstWarning))
+    engine = threadedLoop(SimulatedHydraHarp(MODE_T2, **settings), 3 * tacq,
+                          slowConsumer(capacity), shed=1.0)
+    print("Threaded, skipping the processing for 1 s on a warning: %d records, %s"
+          % (engine.nRecords, "FiFo overrun!" if engine.overrun else "ok"))
+    print(engine.report())
+
+    settings["fifoSize"] = 1024 * 1024
+    print("\nProcessing stalls for 3 s after 1 s, FiFo of %d records" % settings["fifoSize"])
+    for label, spill, recover in (("", False, False), (", spilling", True, False),
+                                  (", recovering", False, True)):
+        consume, histogram = stallingConsumer(3.0, 1.0)
+        engine = threadedLoop(SimulatedHydraHarp(MODE_T2, **settings), tacq, consume,
+                              spill=spill, recover=recover)
+        print("Threaded%-14s: %10d records, %10d events processed, %s"
+              % (label, engine.nRecords, histogram.sum(),
+                 "FiFo overrun!" if engine.overrun else
+                 "%d overruns recovered" % len(engine.gaps) if engine.gaps else "ok"))
+        if spill or recover:
+            print(engine.report())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
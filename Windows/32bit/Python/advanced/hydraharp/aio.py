@@ -0,0 +1,230 @@
+# HydraHarp 400  HHLIB v3.0  asyncio interface.
+#
+# AsyncHydraHarp wraps a HydraHarp (or SimulatedHydraHarp) for use from an
+# asyncio event loop. Every HHLIB call runs in an executor with a single
+# thread of its own per device, so the calls for one device keep their
+# order, several devices work in parallel and the event loop never waits
+# for the library:
+#
+#   async with AsyncHydraHarp(HydraHarp(0)) as hh:
+#       await hh.open()
+#       await hh.setup(MODE_T2)
+#       async with hh.chunks(tacq) as chunks:
+#           async for events in chunks:
+#               ...
+#
+# chunks() streams decoded TTTR events through an AcquisitionEngine, whose
+# threads read and decode the FiFo, blocks() streams continuous mode
+# blocks and histogram() runs a histogramming measurement. The streams are
+# async iterators; used with async with they stop the measurement when
+# the block is left early.
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+from .completion import CompletionWaiter, MAXINTERVAL
+from .contmode import TContModeBlockBufType, ContModeBlock, MEASCTRL_CONT_CTC_RESTART
+from .decode import TTTRDecoder
+from .device import FLAG_FIFOFULL
+from .engine import AcquisitionEngine
+
+
+# AsyncStream
+# Async iterator over an async generator that can also be used with async
+# with, which closes the generator, and so ends the measurement, on exit.
+class AsyncStream:
+    def __init__(self, generator):
+        self.generator = generator
+        self.overrun = False
+        self.engine = None # the AcquisitionEngine of a chunks() stream
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self.generator.__anext__()
+
+    def aclose(self):
+        return self.generator.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, excType, exc, traceback):
+        await self.aclose()
+
+
+# LoopBridge
+# Last stage of an AcquisitionEngine, hands the items over to the event
+# loop. At most size items wait there, then the stage thread waits and
+# the engine queues fill up, as with any slow stage.
+class LoopBridge:
+    def __init__(self, loop, size):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.room = threading.Semaphore(size)
+        self.closed = False
+
+    # put
+    # Called in the stage thread.
+    def put(self, item):
+        while not self.room.acquire(timeout=0.1):
+            if self.closed:
+                return
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+    async def get(self):
+        item = await self.queue.get()
+        self.room.release()
+        return item
+
+
+# AsyncHydraHarp
+# device: HydraHarp or SimulatedHydraHarp
+class AsyncHydraHarp:
+    def __init__(self, device):
+        self.device = device
+        self.executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="hh-aio")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, excType, exc, traceback):
+        await self.close()
+
+    # call
+    # Runs func(*args), normally a method of the device, in the executor.
+    async def call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def open(self):
+        return await self.call(self.device.open)
+
+    # close
+    # Closes the device and shuts the executor down, waiting for it in
+    # another thread, so that the event loop goes on meanwhile.
+    async def close(self):
+        await self.call(self.device.close)
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+
+    async def setup(self, mode, settings=None, refSource=0):
+        await self.call(self.device.setup, mode, settings, refSource)
+
+    async def getResolution(self):
+        return await self.call(self.device.getResolution)
+
+    async def getSyncRate(self):
+        return await self.call(self.device.getSyncRate)
+
+    async def getCountRates(self):
+        return await self.call(lambda: [self.device.getCountRate(i)
+                                        for i in range(0, self.device.numChannels)])
+
+    # waitForCTC
+    # Returns once the acquisition time has expired, see CompletionWaiter.
+    # tacq: acquisition time in ms of the measurement started at the
+    #       earliest at started (a time.perf_counter()), so that the event
+    #       loop sleeps through most of it. None polls the CTC status with a
+    #       wait that doubles up to MAXINTERVAL instead.
+    async def waitForCTC(self, tacq=None, started=None):
+        await CompletionWaiter(self.device, tacq, started).waitAsync(self.call)
+
+    # histogram
+    # Measures for tacq ms in histogramming mode and returns the histograms
+    # of all channels as uint32 array (numChannels, histoLen).
+    # clear: clear the histogram memory first, else the counts add up
+    async def histogram(self, tacq, clear=True):
+        if clear:
+            await self.call(self.device.clearHistMem)
+        started = time.perf_counter()
+        await self.call(self.device.startMeas, tacq)
+        try:
+            await self.waitForCTC(tacq, started)
+        finally:
+            await self.call(self.device.stopMeas)
+        return await self.call(self.device.getHistograms)
+
+    # chunks
+    # Measures for tacq ms in T2 or T3 mode and returns an AsyncStream of the
+    # decoded event arrays, one per FiFo chunk. The reading and decoding run
+    # in the threads of an AcquisitionEngine, the device must not be used
+    # otherwise until the stream has ended. stream.overrun tells whether
+    # the FiFo overran, stream.engine gives the statistics.
+    # decoder: TTTRDecoder to use, e.g. with a RecordFilter
+    # queueSize: chunks each engine queue and the event loop hold at most
+    def chunks(self, tacq, decoder=None, queueSize=64):
+        stream = AsyncStream(None)
+        stream.generator = self._chunks(stream, tacq, decoder, queueSize)
+        return stream
+
+    async def _chunks(self, stream, tacq, decoder, queueSize):
+        loop = asyncio.get_running_loop()
+        engine = AcquisitionEngine(self.device, queueSize)
+        engine.addStage("decode", (decoder or TTTRDecoder(self.device.mode)).feed)
+        bridge = LoopBridge(loop, queueSize)
+        engine.addStage("deliver", bridge.put)
+        stream.engine = engine
+        end = object()
+        engine.start(tacq)
+        # The executor waits for the engine, so that no other call for the
+        # device runs meanwhile
+        done = loop.run_in_executor(self.executor, engine.wait)
+        done.add_done_callback(lambda future: bridge.queue.put_nowait(end))
+        try:
+            while True:
+                events = await bridge.get()
+                if events is end:
+                    break
+                yield events
+            await done
+        finally:
+            if not done.done():
+                engine.stop()
+                bridge.closed = True
+                await asyncio.wait([done])
+            stream.overrun = engine.overrun
+
+    # blocks
+    # Measures in continuous mode with a histogram time of tacq ms and
+    # returns an AsyncStream of ContModeBlocks, until nBlocks blocks have
+    # come (None for no limit) or the stream is closed.
+    # The device must have been set up for MODE_CONT with its histogram
+    # length set.
+    def blocks(self, tacq, nBlocks=None, measControl=MEASCTRL_CONT_CTC_RESTART):
+        stream = AsyncStream(None)
+        stream.generator = self._blocks(stream, tacq, nBlocks, measControl)
+        return stream
+
+    # Returns the next block, None if none is complete yet, or False if the
+    # FiFo overran
+    def _nextBlock(self, buffer):
+        if self.device.getFlags() & FLAG_FIFOFULL:
+            return False
+        nBytes = self.device.getContModeBlock(buffer)
+        return ContModeBlock(buffer, nBytes) if nBytes > 0 else None
+
+    async def _blocks(self, stream, tacq, nBlocks, measControl):
+        buffer = TContModeBlockBufType()
+        await self.call(self.device.setMeasControl, measControl)
+        await self.call(self.device.startMeas, tacq)
+        try:
+            n = 0
+            pollInterval = 0.001
+            while nBlocks is None or n < nBlocks:
+                block = await self.call(self._nextBlock, buffer)
+                if block is False:
+                    stream.overrun = True
+                    break
+                if block is None:
+                    # Wait longer the longer no block comes, up to a 20th
+                    # of the histogram time
+                    await asyncio.sleep(pollInterval)
+                    pollInterval = min(2 * pollInterval, MAXINTERVAL, tacq / 20000.0)
+                    continue
+                pollInterval = 0.001
+                n += 1
+                yield block
+        finally:
+            await self.call(self.device.stopMeas)
@@ -0,0 +1,84 @@
+# HydraHarp 400  HHLIB v3.0  asyncio responsiveness benchmark.
+#
+# Streams TTTR data from one and from two SimulatedHydraHarps at once
+# through AsyncHydraHarp.chunks, histogramming the events by channel in
+# the event loop, and measures meanwhile how late a task that wakes up
+# every 5 ms gets to run. Then does the same with continuous mode blocks.
+#
+# Usage: python -m hydraharp.aiobench [photonRate]
+
+import asyncio
+import sys
+import time
+import numpy as np
+
+from .aio import AsyncHydraHarp
+from .decode import MODE_T2
+from .device import MODE_CONT
+from .synth import SimulatedHydraHarp
+
+TICK = 0.005 # s
+
+
+# heartbeat
+# Wakes up every TICK s until stop is set and collects how late it woke.
+async def heartbeat(stop, lateness):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lateness.append(time.perf_counter() - start - TICK)
+
+async def idle(tacq):
+    await asyncio.sleep(tacq / 1000.0)
+    return 0, False
+
+async def streamChunks(device, tacq):
+    histogram = np.zeros(256, dtype=np.int64)
+    async with AsyncHydraHarp(device) as hh:
+        await hh.setup(MODE_T2)
+        async with hh.chunks(tacq) as chunks:
+            async for events in chunks:
+                histogram += np.bincount(events["channel"], minlength=256)
+        return int(histogram.sum()), chunks.overrun
+
+async def streamBlocks(device, tacq, nBlocks):
+    total = 0
+    async with AsyncHydraHarp(device) as hh:
+        await hh.setup(MODE_CONT)
+        await hh.call(device.setHistoLen, 3)
+        async with hh.blocks(tacq, nBlocks) as blocks:
+            async for block in blocks:
+                total += int(block.sums.sum())
+        return total, blocks.overrun
+
+async def measure(label, jobs):
+    stop = asyncio.Event()
+    lateness = []
+    beat = asyncio.ensure_future(heartbeat(stop, lateness))
+    start = time.perf_counter()
+    results = await asyncio.gather(*jobs)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    lateness = np.array(lateness[1:] or [0.0]) * 1000
+    print("%-34s %5.2fs %10d counts %-8s late by %5.2f ms mean, %5.2f ms 99%%, %5.2f ms max"
+          % (label, elapsed, sum(r[0] for r in results),
+             "overrun!" if any(r[1] for r in results) else "ok", lateness.mean(),
+             np.percentile(lateness, 99), lateness.max()))
+
+async def main(photonRate):
+    tacq = 3000
+    settings = {"photonRate": photonRate}
+    await measure("idle", [idle(tacq)])
+    await measure("1 device, T2 %.0e photons/s" % photonRate,
+                  [streamChunks(SimulatedHydraHarp(MODE_T2, **settings), tacq)])
+    await measure("2 devices, T2 %.0e photons/s each" % photonRate,
+                  [streamChunks(SimulatedHydraHarp(MODE_T2, seed=i, **settings), tacq)
+                   for i in range(2)])
+    await measure("2 devices, 30 cont. mode blocks",
+                  [streamBlocks(SimulatedHydraHarp(MODE_CONT, seed=i, **settings), 100, 30)
+                   for i in range(2)])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(float(sys.argv[1]) if len(sys.argv) > 1 else 4e6)))
@@ -0,0 +1,352 @@
+# HydraHarp 400  HHLIB v3.0  Unattended measurement sequences.
+#
+# The demos wait for RETURN before every measurement and take their
+# settings from module variables. BatchRunner works through a measurement
+# plan instead: a list of entries, each giving a mode, its settings and how
+# many runs of how long to make, e.g. loaded from a JSON file:
+#
+#   [{"name": "decay", "mode": "HIST", "tacq": 1000, "runs": 20, "lenCode": 6},
+#    {"name": "tttr", "mode": "T3", "tacq": 10000, "runs": 6,
+#     "settings": {"syncDivider": 8}},
+#    {"name": "scan", "mode": "CONT", "tacq": 100, "runs": 300, "lenCode": 2}]
+#
+# The runs follow each other with as little dead time as possible:
+# - the device is only set up again when the mode or the settings change,
+# - histograms are read out and cleared in one go and saved in the
+#   background while the next run measures,
+# - a T2/T3 run starts as soon as the FiFo of the previous one has been
+#   read, while its chunks are still being written,
+# - in continuous mode the runs are the blocks of one measurement, which
+#   the hardware restarts by itself.
+# report() gives the duty cycle achieved, the share of the time spent
+# measuring, per entry and overall.
+#
+# Output per run, named after the entry and the run number:
+# HIST: <name>_<run>.dat, one column per channel as in histomode.py
+# T2/T3: <name>_<run>_0000.out raw records with a JSON sidecar, see
+#        segments.py
+# CONT: <name>_<run>.npy, the histograms (channels, histoLen) of the block
+#
+# Usage: python -m hydraharp.batch plan.json [serial]
+
+import concurrent.futures
+import json
+import os
+import sys
+import time
+import numpy as np
+
+from .completion import CompletionWaiter, MAXINTERVAL
+from .contmode import (TContModeBlockBufType, ContModeBlock, MEASCTRL_SINGLESHOT_CTC,
+                       MEASCTRL_CONT_CTC_RESTART, MAXHISTLEN_CONT)
+from .decode import MODE_T2, MODE_T3
+from .device import HHError, MODE_HIST, MODE_CONT, MAXLENCODE, FLAG_FIFOFULL, FLAG_OVERFLOW
+from .engine import AcquisitionEngine
+from .multi import openDevices
+from .segments import SegmentedWriter
+from .timebase import TimeBase
+
+MODES = {"HIST": MODE_HIST, "T2": MODE_T2, "T3": MODE_T3, "CONT": MODE_CONT}
+MAXPENDING = 8 # result files being saved in the background at most
+
+
+# loadPlan
+# Reads a measurement plan from a JSON file and checks it.
+def loadPlan(filename):
+    with open(filename) as f:
+        return checkPlan(json.load(f))
+
+# checkPlan
+# Checks the entries of a plan and fills in the defaults: name (entry
+# number), settings (DEFAULTSETTINGS), runs (1) and lenCode (the longest
+# histograms in HIST, 1024 bins in CONT as in the contmode demo). Raises
+# ValueError for an invalid entry, before any device is touched.
+def checkPlan(plan):
+    checked = []
+    for n, entry in enumerate(plan):
+        entry = dict(entry)
+        if entry.get("mode") not in MODES:
+            raise ValueError("Plan entry %d: mode must be one of %s"
+                             % (n, ", ".join(MODES)))
+        entry.setdefault("name", "%s%02d" % (entry["mode"].lower(), n))
+        entry.setdefault("settings", {})
+        entry.setdefault("runs", 1)
+        # 1024 << lenCode bins, continuous mode takes fewer
+        maxLenCode = MAXLENCODE
+        if entry["mode"] == "CONT":
+            maxLenCode = (MAXHISTLEN_CONT // 1024).bit_length() - 1
+        entry.setdefault("lenCode", MAXLENCODE if entry["mode"] == "HIST" else 0)
+        if not isCount(entry.get("tacq"), 1):
+            raise ValueError("Plan entry %d: tacq must be a number of ms" % n)
+        if not isCount(entry["runs"], 1):
+            raise ValueError("Plan entry %d: runs must be a number of 1 or more" % n)
+        if not isCount(entry["lenCode"], 0, maxLenCode):
+            raise ValueError("Plan entry %d: lenCode must be a number from 0 to %d in %s"
+                             % (n, maxLenCode, entry["mode"]))
+        if not isinstance(entry["settings"], dict):
+            raise ValueError("Plan entry %d: settings must be a dict" % n)
+        checked.append(entry)
+    return checked
+
+# isCount
+# Whether value is an int (not a bool, as JSON true would give) from low
+# to high (None for no limit).
+def isCount(value, low, high=None):
+    return (isinstance(value, int) and not isinstance(value, bool) and value >= low
+            and (high is None or value <= high))
+
+
+# BatchRunner
+# device: opened HydraHarp (or SimulatedHydraHarp)
+# directory: where the output files go
+# engineSettings: passed on to the AcquisitionEngine of T2/T3 runs
+class BatchRunner:
+    def __init__(self, device, directory=".", **engineSettings):
+        self.device = device
+        self.directory = directory
+        self.engineSettings = engineSettings
+        self.configured = None # mode and settings the device is set up with
+        self.pool = None # FiFo buffers shared by the T2/T3 runs
+        self.saver = concurrent.futures.ThreadPoolExecutor(1)
+        self.saving = []
+        self.results = [] # one dict per run, see _result
+        self.onRun = None
+        self.setupTime = 0.0 # s spent setting up the device
+        self.startTime = None
+        self.endTime = None
+
+    # filename
+    # Path of the output of a run, without extension.
+    def filename(self, entry, run):
+        return os.path.join(self.directory, "%s_%04d" % (entry["name"], run))
+
+    # run
+    # Works through the plan, see checkPlan, and returns the results.
+    # onRun: optional function called with every result as it comes
+    def run(self, plan, onRun=None):
+        self.onRun = onRun
+        self.startTime = time.perf_counter()
+        try:
+            for entry in checkPlan(plan):
+                self.setup(entry)
+                mode = MODES[entry["mode"]]
+                if mode == MODE_HIST:
+                    self._histogramRuns(entry)
+                elif mode == MODE_CONT:
+                    self._contModeRuns(entry)
+                else:
+                    self._tttrRuns(entry)
+        finally:
+            for future in self.saving:
+                future.result()
+            self.saving = []
+            self.endTime = time.perf_counter()
+        return self.results
+
+    # setup
+    # Sets up the device for an entry, unless it is set up for the same mode
+    # and settings already.
+    def setup(self, entry):
+        mode = MODES[entry["mode"]]
+        wanted = (mode, json.dumps(entry["settings"], sort_keys=True))
+        start = time.perf_counter()
+        if wanted != self.configured:
+            self.configured = None
+            self.device.setup(mode, entry["settings"])
+            self.configured = wanted
+        if mode in (MODE_HIST, MODE_CONT):
+            self.device.setHistoLen(entry["lenCode"])
+            self.device.setMeasControl(MEASCTRL_CONT_CTC_RESTART if mode == MODE_CONT
+                                       else MEASCTRL_SINGLESHOT_CTC)
+            if mode == MODE_HIST:
+                self.device.clearHistMem()
+        self.setupTime += time.perf_counter() - start
+
+    # Records the result of a run
+    # start, end: time.perf_counter() at the start and end of the measurement
+    # measured: s of the run the device actually measured
+    # more: counts (histogram counts or records), overflow (histogram
+    #       overflow), overrun (FiFo overrun), ...
+    def _result(self, entry, run, start, end, measured, **more):
+        result = {"name": entry["name"], "mode": entry["mode"], "run": run,
+                  "tacq": entry["tacq"], "start": start, "end": end, "measured": measured}
+        result.update(more)
+        self.results.append(result)
+        if self.onRun is not None:
+            self.onRun(result)
+        return result
+
+    # Saves a result file in the background, waiting while too many are
+    # pending
+    def _save(self, func, *args):
+        self.saving = [future for future in self.saving if not future.done()]
+        while len(self.saving) >= MAXPENDING:
+            self.saving.pop(0).result()
+        self.saving.append(self.saver.submit(func, *args))
+
+    def _histogramRuns(self, entry):
+        device, tacq = self.device, entry["tacq"]
+        for run in range(entry["runs"]):
+            waiter = CompletionWaiter(device, tacq)
+            device.startMeas(tacq)
+            start = time.perf_counter()
+            waiter.wait()
+            end = waiter.ended
+            device.stopMeas()
+            # Reading with clear leaves the memory cleared for the next run
+            histograms = device.getHistograms(1)
+            overflow = bool(device.getFlags() & FLAG_OVERFLOW)
+            self._save(np.savetxt, self.filename(entry, run) + ".dat", histograms.T, "%5d")
+            self._result(entry, run, start, end, tacq / 1000.0,
+                         counts=int(histograms.sum(dtype=np.int64)), overflow=overflow,
+                         overrun=False)
+
+    # In continuous mode a run is one block. The blocks of all runs come
+    # from one measurement without gaps.
+    def _contModeRuns(self, entry):
+        device, tacq = self.device, entry["tacq"]
+        buffer = TContModeBlockBufType()
+        device.startMeas(tacq)
+        start = time.perf_counter()
+        try:
+            run = 0
+            pollInterval = 0.001
+            while run < entry["runs"]:
+                if device.getFlags() & FLAG_FIFOFULL:
+                    # The blocks are lost, so are the remaining runs
+                    self._result(entry, run, start, time.perf_counter(), 0.0, counts=0,
+                                 overflow=False, overrun=True)
+                    break
+                nBytes = device.getContModeBlock(buffer)
+                if nBytes == 0:
+                    time.sleep(pollInterval)
+                    pollInterval = min(2 * pollInterval, MAXINTERVAL, tacq / 20000.0)
+                    continue
+                pollInterval = 0.001
+                block = ContModeBlock(buffer, nBytes)
+                end = time.perf_counter()
+                self._save(np.save, self.filename(entry, run) + ".npy", block.histograms)
+                self._result(entry, run, start, end, block.ctcTime / 1e9,
+                             counts=int(block.sums.sum()), overflow=False, overrun=False,
+                             blockNum=block.blockNum)
+                start = end
+                run += 1
+        finally:
+            device.stopMeas()
+
+    # A T2/T3 run starts as soon as the reader of the previous one is done,
+    # the stages of the previous one finish meanwhile. The runs share their
+    # FiFo buffers.
+    def _tttrRuns(self, entry):
+        device, tacq = self.device, entry["tacq"]
+        mode = MODES[entry["mode"]]
+        syncPeriod = 1.0 / device.getSyncRate() if mode == MODE_T3 else None
+        timeBase = TimeBase.fromDevice(mode, device.getResolution(), syncPeriod)
+        previous = None
+        for run in range(entry["runs"]):
+            writer = SegmentedWriter(self.filename(entry, run), mode, timeBase,
+                                     info={"plan": entry, "run": run})
+            engine = AcquisitionEngine(device, **self.engineSettings)
+            engine.pool = self.pool
+            engine.addStage("write", writer.write)
+            engine.start(tacq)
+            self.pool = engine.pool
+            engine.reader.join()
+            if previous is not None:
+                self._tttrDone(*previous)
+            previous = (entry, run, engine, writer)
+        if previous is not None:
+            self._tttrDone(*previous)
+
+    def _tttrDone(self, entry, run, engine, writer):
+        try:
+            engine.wait()
+        finally:
+            writer.close()
+        start = engine.measStart if engine.measStart is not None else engine.endTime
+        measured = min(engine.endTime - start, entry["tacq"] / 1000.0)
+        self._result(entry, run, start, engine.endTime, measured,
+                     counts=engine.nRecords, overflow=False, overrun=engine.overrun)
+
+    # summary
+    # Per entry name and for all runs ("all"): runs, measured (s), elapsed
+    # (s from the start of the first to the end of the last run), dutyCycle
+    # (measured / elapsed), deadTime and maxDeadTime (mean and longest s
+    # between the end of a run and the start of the next).
+    def summary(self):
+        groups = {}
+        for result in self.results:
+            groups.setdefault(result["name"], []).append(result)
+        summary = {name: self._summarize(results) for name, results in groups.items()}
+        total = self._summarize(self.results)
+        if self.startTime is not None and self.endTime is not None:
+            # Overall the setups and the time before the first run count too
+            total["elapsed"] = self.endTime - self.startTime
+            total["dutyCycle"] = total["measured"] / total["elapsed"] if total["elapsed"] else 0.0
+        summary["all"] = total
+        return summary
+
+    def _summarize(self, results):
+        if not results:
+            return {"runs": 0, "measured": 0.0, "elapsed": 0.0, "dutyCycle": 0.0,
+                    "deadTime": 0.0, "maxDeadTime": 0.0}
+        results = sorted(results, key=lambda result: result["start"])
+        measured = sum(result["measured"] for result in results)
+        elapsed = results[-1]["end"] - results[0]["start"]
+        gaps = [max(b["start"] - a["end"], 0.0) for a, b in zip(results, results[1:])]
+        return {"runs": len(results), "measured": measured, "elapsed": elapsed,
+                "dutyCycle": measured / elapsed if elapsed else 0.0,
+                "deadTime": sum(gaps) / len(gaps) if gaps else 0.0,
+                "maxDeadTime": max(gaps) if gaps else 0.0}
+
+    # report
+    # Returns the summary as printable table.
+    def report(self):
+        lines = ["%-16s %6s %10s %10s %7s %12s %12s"
+                 % ("entry", "runs", "measured", "elapsed", "duty", "dead time", "max dead")]
+        for name, s in self.summary().items():
+            lines.append("%-16s %6d %9.3fs %9.3fs %6.1f%% %10.2fms %10.2fms"
+                         % (name, s["runs"], s["measured"], s["elapsed"],
+                            100 * s["dutyCycle"], 1000 * s["deadTime"],
+                            1000 * s["maxDeadTime"]))
+        lines.append("Setting up the device took %.3fs" % self.setupTime)
+        for result in self.results:
+            if result["overrun"] or result["overflow"]:
+                lines.append("%s run %d: %s" % (result["name"], result["run"],
+                                                "FiFo overrun" if result["overrun"]
+                                                else "histogram overflow"))
+        return "\n".join(lines)
+
+    def close(self):
+        self.saver.shutdown()
+
+
+def main(argv):
+    if len(argv) < 2:
+        print("Usage: python -m hydraharp.batch plan.json [serial]")
+        return 1
+    plan = loadPlan(argv[1])
+    try:
+        devices = openDevices([argv[2]] if len(argv) > 2 else None)
+    except ValueError as exc:
+        print("%s." % exc)
+        return 1
+    if not devices:
+        print("No device available.")
+        return 1
+    for device in devices[1:]:
+        device.close()
+    runner = BatchRunner(devices[0])
+    try:
+        runner.run(plan, lambda r: print("%-16s run %4d  %12d counts" % (r["name"], r["run"],
+                                                                        r["counts"])))
+    except HHError as exc:
+        print("%s. Aborted." % exc)
+    finally:
+        runner.close()
+        devices[0].close()
+    print(runner.report())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
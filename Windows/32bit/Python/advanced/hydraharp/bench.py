@@ -0,0 +1,294 @@
+# HydraHarp 400  HHLIB v3.0  Decoder throughput benchmark.
+#
+# Compares the string based ProcessT2/ProcessT3 routines of the instant
+# processing demo with the vectorized decoders and checks that both agree
+# exactly. No device is needed, the records are generated randomly.
+#
+# Usage: python -m hydraharp.bench [nRecords]
+
+import io
+import sys
+import time
+import numpy as np
+
+from .decode import (decodeT2, decodeT3, TTTRDecoder, RecordFilter, collapseOverflows,
+                     T2WRAPAROUND_V2, T3WRAPAROUND, TTREADMAX, MODE_T2, MODE_T3,
+                     OVERFLOWRECORD, RECORD_PHOTONS)
+from .sinks import EventSink, EventDispatcher, PerEventAdapter, TextWriter
+from .view import RecordView
+
+# referenceT2
+# The per record ProcessT2 of the instant processing demo, collecting the
+# events instead of writing them to a file.
+def referenceT2(records, oflcorrection=0):
+    events = []
+    for TTTRRecord in records:
+        recordDatabinary = "{0:0{1}b}".format(TTTRRecord, 32)
+        special = int(recordDatabinary[0:1], base=2)
+        channel = int(recordDatabinary[1:7], base=2)
+        timeTag = int(recordDatabinary[7:32], base=2)
+        if special == 1:
+            if channel == 0x3F:
+                oflcorrection += T2WRAPAROUND_V2 * timeTag
+            if channel >= 1 and channel <= 15:
+                events.append(("MK", channel, oflcorrection + T2WRAPAROUND_V2 * timeTag))
+            if channel == 0:
+                events.append(("CH", 0, oflcorrection + timeTag))
+        else:
+            events.append(("CH", channel + 1, oflcorrection + timeTag))
+    return events, oflcorrection
+
+# referenceT3
+# The per record ProcessT3 of the instant processing demo, collecting the
+# events instead of writing them to a file.
+def referenceT3(records, oflcorrection=0):
+    events = []
+    for TTTRRecord in records:
+        recordDatabinary = "{0:0{1}b}".format(TTTRRecord, 32)
+        special = int(recordDatabinary[0:1], base=2)
+        channel = int(recordDatabinary[1:7], base=2)
+        dTime = int(recordDatabinary[7:22], base=2)
+        nSync = int(recordDatabinary[22:32], base=2)
+        if special == 1:
+            if channel == 0x3F:
+                oflcorrection += T3WRAPAROUND * nSync
+            if channel >= 1 and channel <= 15:
+                events.append(("MK", channel, oflcorrection + T3WRAPAROUND * nSync, 0))
+        else:
+            events.append(("CH", channel + 1, oflcorrection + nSync, dTime))
+    return events, oflcorrection
+
+# vectorizedT2
+# Brings the output of decodeT2 into the shape produced by referenceT2.
+def vectorizedT2(records, oflcorrection=0):
+    channel, timetag, photon, marker, oflcorrection = decodeT2(records, oflcorrection)
+    keep = photon | marker
+    kinds = np.where(marker[keep], "MK", "CH").tolist()
+    events = list(zip(kinds, channel[keep].tolist(), timetag[keep].tolist()))
+    return events, oflcorrection
+
+# vectorizedT3
+# Brings the output of decodeT3 into the shape produced by referenceT3.
+def vectorizedT3(records, oflcorrection=0):
+    nsync, dtime, channel, photon, marker, oflcorrection = decodeT3(records, oflcorrection)
+    keep = photon | marker
+    kinds = np.where(marker[keep], "MK", "CH").tolist()
+    dtime = np.where(marker, 0, dtime)
+    events = list(zip(kinds, channel[keep].tolist(), nsync[keep].tolist(),
+                      dtime[keep].tolist()))
+    return events, oflcorrection
+
+# randomRecords
+# Random records with a mix of photons, sync (T2 only), markers and overflows.
+def randomRecords(mode, nRecords, seed=0):
+    rng = np.random.default_rng(seed)
+    special = rng.random(nRecords) < 0.2
+    channel = rng.integers(0, 8, nRecords, dtype=np.uint32)
+    kind = rng.integers(0, 3, nRecords)
+    channel[special & (kind == 0)] = 0x3F # overflow
+    channel[special & (kind == 1)] = 0 # sync in T2, ignored in T3
+    channel[special & (kind == 2)] = rng.integers(1, 16, int(np.sum(special & (kind == 2))))
+    overflows = special & (channel == 0x3F)
+    if mode == "T2":
+        data = rng.integers(0, T2WRAPAROUND_V2, nRecords, dtype=np.uint32)
+    else:
+        data = rng.integers(0, 1 << 25, nRecords, dtype=np.uint32) # dtime and nsync
+        data[overflows] = 0
+    data[overflows] |= rng.integers(1, 4, int(np.sum(overflows)), dtype=np.uint32)
+    return (special.astype(np.uint32) << 31) | (channel << 25) | data
+
+# timeit
+# Returns records/s of func applied chunkwise like in the acquisition loop.
+def timeit(func, records, chunk=TTREADMAX):
+    oflcorrection = 0
+    start = time.perf_counter()
+    for i in range(0, len(records), chunk):
+        oflcorrection = func(records[i:i + chunk], oflcorrection)[-1]
+    return len(records) / (time.perf_counter() - start)
+
+# report
+# Prints one result line, all aligned.
+def report(label, rate, note=""):
+    print("%-42s : %12.0f records/s%s" % (label, rate, ", " + note if note else ""))
+
+# writeText
+# Runs records through an EventDispatcher with the given sink factory like
+# the instant processing demo does and returns the text output and the
+# throughput in records/s.
+def writeText(mode, records, makeSink, chunk=TTREADMAX, recordFilter=None):
+    outputfile = io.StringIO()
+    dispatcher = EventDispatcher(TTTRDecoder(mode, recordFilter=recordFilter))
+    dispatcher.register(makeSink(outputfile))
+    start = time.perf_counter()
+    for i in range(0, len(records), chunk):
+        dispatcher.process(records[i:i + chunk])
+    return outputfile.getvalue(), len(records) / (time.perf_counter() - start)
+
+# benchSinks
+# Compares the text output of the instant processing demo written by its
+# per event GotPhoton/GotMarker functions (via PerEventAdapter) with the
+# batched TextWriter.
+def benchSinks(mode, records, resolution=1.0, syncPeriod=12.5e-9):
+    def perEventSink(outputfile):
+        if mode == MODE_T2:
+            def GotPhotonT2(timeTag, channel):
+                outputfile.write("CH %2d %14.0lf\n" % (channel, timeTag * resolution))
+            def GotMarkerT2(timeTag, markers):
+                outputfile.write("MK %2d %14.0lf\n" % (markers, timeTag * resolution))
+            return PerEventAdapter(mode, GotPhotonT2, GotMarkerT2)
+        def GotPhotonT3(truensync, channel, dTime):
+            outputfile.write("CH %2d %10.8lf %8.0lf\n"
+                             % (channel, truensync * syncPeriod, dTime * resolution))
+        def GotMarkerT3(truensync, markers):
+            outputfile.write("MK %2d %10.8lf\n" % (markers, truensync * syncPeriod))
+        return PerEventAdapter(mode, GotPhotonT3, GotMarkerT3)
+
+    textRef, rateRef = writeText(mode, records, perEventSink)
+    text, rate = writeText(mode, records,
+                           lambda f: TextWriter(f, mode, resolution, syncPeriod))
+    if text != textRef:
+        print("Mismatch between per event and batched text output!")
+        return False
+    report("Text output, per event GotPhoton/GotMarker", rateRef)
+    report("Text output, batched TextWriter", rate)
+    return True
+
+# benchHistogram
+# Compares T3 histogramming as in the instant histogramming demo, once per
+# photon via PerEventAdapter and once per chunk with np.bincount.
+def benchHistogram(records, nChannels=8, nBins=32768, chunk=TTREADMAX):
+    histRef = np.zeros((nChannels, nBins))
+    def GotPhotonT3(truensync, channel, dTime):
+        histRef[channel - 1, dTime] = histRef[channel - 1, dTime] + 1
+    hist = np.zeros((nChannels, nBins))
+    def GotPhotonsT3(photons):
+        bins = (photons["channel"].astype(np.intp) - 1) * nBins + photons["dtime"]
+        np.add(hist, np.bincount(bins, minlength=hist.size).reshape(hist.shape), out=hist)
+
+    rates = []
+    for sink in [PerEventAdapter(MODE_T3, GotPhotonT3, lambda truensync, markers: None),
+                 EventSink(gotPhotons=GotPhotonsT3)]:
+        dispatcher = EventDispatcher(TTTRDecoder(MODE_T3))
+        dispatcher.register(sink)
+        start = time.perf_counter()
+        for i in range(0, len(records), chunk):
+            dispatcher.process(records[i:i + chunk])
+        rates.append(len(records) / (time.perf_counter() - start))
+    if not np.array_equal(hist, histRef):
+        print("Mismatch between per photon and batched histogram!")
+        return False
+    report("Histogram, per photon GotPhotonT3", rates[0])
+    report("Histogram, batched np.bincount", rates[1])
+    return True
+
+# benchFilter
+# Decoding and text output when only some input channels are of interest,
+# once filtering the events after decoding and once with a RecordFilter
+# dropping the other records at decode time.
+def benchFilter(mode, records, channels=(1, 2), resolution=1.0, syncPeriod=12.5e-9):
+    recordFilter = RecordFilter(mode, channels, RECORD_PHOTONS)
+    decoder = TTTRDecoder(mode)
+    def decodeAndSelect(chunk, oflcorrection):
+        events = decoder.feed(chunk)
+        return events[np.isin(events["channel"], channels) & (events["flags"] == 0)], 0
+    filtered = TTTRDecoder(mode, recordFilter=recordFilter)
+    rateAfter = timeit(decodeAndSelect, records)
+    rateFilter = timeit(lambda r, o: (filtered.feed(r), 0), records)
+
+    makeSink = lambda f: TextWriter(f, mode, resolution, syncPeriod)
+    rateText = writeText(mode, records, makeSink, recordFilter=recordFilter)[1]
+    kept = np.count_nonzero(recordFilter.mask(records)) / len(records)
+    report("Channels %s, selected after decoding" % list(channels), rateAfter)
+    report("Channels %s, RecordFilter" % list(channels), rateFilter,
+           "%.0f%% kept" % (100 * kept))
+    report("Channels %s, text output filtered" % list(channels), rateText)
+    return True
+
+# benchView
+# Quick look at raw records: counts per channel from a RecordView, which
+# decodes only the channel column, compared with decoding everything.
+def benchView(mode, records):
+    start = time.perf_counter()
+    counts = np.bincount(TTTRDecoder(mode).feed(records)["channel"], minlength=256)
+    rateFull = len(records) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    view = RecordView(records, mode)
+    counts = np.bincount(view.channel[view.photon | view.marker], minlength=256)
+    rateView = len(records) / (time.perf_counter() - start)
+    if not np.array_equal(counts, np.bincount(TTTRDecoder(mode).feed(records)["channel"],
+                                              minlength=256)):
+        print("Mismatch between RecordView and TTTRDecoder!")
+        return False
+    report("Channel counts, full decoding", rateFull)
+    report("Channel counts, RecordView", rateView, "decoded " + ", ".join(view.decoded()))
+    return True
+
+# benchSparse
+# A sparse measurement where most records are overflows with count 1:
+# decoding as is, collapsing the overflow runs and decoding the collapsed
+# records, which must give the same events.
+def benchSparse(mode, records, overflowShare=0.95, seed=1):
+    rng = np.random.default_rng(seed)
+    records = records.copy()
+    records[rng.random(len(records)) < overflowShare] = OVERFLOWRECORD << 25 | 1 # count 1
+
+    decoder = TTTRDecoder(mode)
+    rate = timeit(lambda r, o: (decoder.feed(r), 0), records)
+    start = time.perf_counter()
+    collapsed = [collapseOverflows(records[i:i + TTREADMAX], mode)[0]
+                 for i in range(0, len(records), TTREADMAX)]
+    rateCollapse = len(records) / (time.perf_counter() - start)
+    collapsed = np.concatenate(collapsed)
+    if not np.array_equal(TTTRDecoder(mode).feed(collapsed), TTTRDecoder(mode).feed(records)):
+        print("Mismatch after collapsing overflow runs!")
+        return False
+    report("Sparse, %.0f%% overflows, decoding" % (100 * overflowShare), rate)
+    report("Sparse, collapsing overflow runs", rateCollapse,
+           "%d of %d records left" % (len(collapsed), len(records)))
+    return True
+
+def main(argv):
+    nRecords = int(argv[1]) if len(argv) > 1 else 1000000
+    paths = [("T2", MODE_T2, referenceT2, vectorizedT2, decodeT2),
+             ("T3", MODE_T3, referenceT3, vectorizedT3, decodeT3)]
+
+    for mode, modeCode, reference, vectorized, decode in paths:
+        records = randomRecords(mode, nRecords)
+
+        # The reference is slow, compare on a subset, split into several
+        # chunks so that the overflow correction is carried across them
+        nCheck = min(nRecords, 200000)
+        expected = reference(records[:nCheck].tolist())[0]
+        events, oflcorrection = [], 0
+        for i in range(0, nCheck, 65536):
+            chunkEvents, oflcorrection = vectorized(records[i:min(i + 65536, nCheck)],
+                                                    oflcorrection)
+            events += chunkEvents
+        if events != expected:
+            print("Mismatch between Process%s and decode%s!" % (mode, mode))
+            return 1
+        print("decode%s matches Process%s on %d records" % (mode, mode, nCheck))
+
+        rateRef = timeit(lambda r, o: reference(r.tolist(), o), records[:nCheck])
+        rateVec = timeit(decode, records)
+        decoder = TTTRDecoder(modeCode)
+        rateEvents = timeit(lambda r, o: (decoder.feed(r), 0), records)
+        report("Process%s (string based)" % mode, rateRef)
+        report("decode%s (vectorized)" % mode, rateVec)
+        report("TTTRDecoder.feed (events)", rateEvents,
+               "%d bytes/event" % decoder.feed(records[:1]).itemsize)
+        print("%-42s : %12.1f" % ("Speedup", rateVec / rateRef))
+        if not benchSinks(modeCode, records[:nCheck]):
+            return 1
+        if modeCode == MODE_T3 and not benchHistogram(records[:nCheck]):
+            return 1
+        benchFilter(modeCode, records)
+        if not benchView(modeCode, records):
+            return 1
+        if not benchSparse(modeCode, records):
+            return 1
+        print("")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,93 @@
+# HydraHarp 400  HHLIB v3.0  Continuous mode blocks.
+#
+# In continuous mode HH_GetContModeBlock delivers one block per histogram
+# time: a header of fixed structure followed, for every enabled channel,
+# by the histogram and its sum. The contmode demo walks through a block
+# with pointers, here the histograms and sums are taken out of it as NumPy
+# arrays in one go.
+
+import ctypes as ct
+import numpy as np
+
+# From hhdefin.h
+MAXHISTLEN_CONT   = 8192   # Max number of histogram bins in continuous mode
+MAXLENCODE_CONT   = 5      # Max length code in continuous mode
+MAXCONTMODEBUFLEN = 262272 # Max bytes of buffer needed for HH_GetContModeBlock
+
+MEASCTRL_SINGLESHOT_CTC         = 0
+MEASCTRL_C1_GATED               = 1
+MEASCTRL_C1_START_CTC_STOP      = 2
+MEASCTRL_C1_START_C2_STOP       = 3
+MEASCTRL_CONT_C1_GATED          = 4
+MEASCTRL_CONT_C1_START_CTC_STOP = 5
+MEASCTRL_CONT_CTC_RESTART       = 6
+
+EDGE_RISING  = 1
+EDGE_FALLING = 0
+
+
+# The header structure is fixed and must not be changed, the data that
+# follows depends on the number of enabled channels and the histogram
+# length. The buffer is large enough for the max case.
+class TContModeBlockBufType(ct.Structure):
+    _pack_ = 1
+    _fields_ = [
+        ("channels"    , ct.c_uint16),
+        ("histoLen"    , ct.c_uint16),
+        ("blockNum"    , ct.c_uint32),
+        ("startTime"   , ct.c_uint64),
+        ("ctcTime"     , ct.c_uint64),
+        ("firstM1Time" , ct.c_uint64),
+        ("firstM2Time" , ct.c_uint64),
+        ("firstM3Time" , ct.c_uint64),
+        ("firstM4Time" , ct.c_uint64),
+        ("sumM1"       , ct.c_uint16),
+        ("sumM2"       , ct.c_uint16),
+        ("sumM3"       , ct.c_uint16),
+        ("sumM4"       , ct.c_uint16),
+        ("data"        , (ct.c_byte * MAXCONTMODEBUFLEN))
+    ]
+
+HEADERSIZE = TContModeBlockBufType.data.offset
+
+
+# blockSize
+# Bytes of a block with channels enabled channels and histoLen bins each:
+# the header, then per channel the histogram (32 bit bins) and its sum
+# (64 bit).
+def blockSize(channels, histoLen):
+    return HEADERSIZE + channels * (4 * histoLen + 8)
+
+
+# ContModeBlock
+# One continuous mode block taken out of the buffer, so that the buffer
+# can be reused for the next one.
+# blockNum: counts up from 0 with every block
+# startTime, ctcTime: start and duration of the histogram time in ns
+# firstMarkerTimes: time of the first marker 1..4 within the block in ns
+# markerSums: number of markers 1..4 within the block
+# histograms: uint32 array (channels, histoLen), one row per enabled channel
+# sums: uint64 array of the histogram sums the hardware computed
+class ContModeBlock:
+    def __init__(self, buffer, nBytes):
+        if nBytes != blockSize(buffer.channels, buffer.histoLen):
+            raise ValueError("Unexpected continuous mode block size %d" % nBytes)
+        self.channels = buffer.channels
+        self.histoLen = buffer.histoLen
+        self.blockNum = buffer.blockNum
+        self.startTime = buffer.startTime
+        self.ctcTime = buffer.ctcTime
+        self.firstMarkerTimes = (buffer.firstM1Time, buffer.firstM2Time, buffer.firstM3Time,
+                                 buffer.firstM4Time)
+        self.markerSums = (buffer.sumM1, buffer.sumM2, buffer.sumM3, buffer.sumM4)
+        # Per channel histoLen bins followed by the sum in two more dwords
+        data = np.frombuffer(buffer.data, dtype=np.uint32,
+                             count=self.channels * (self.histoLen + 2))
+        data = data.reshape(self.channels, self.histoLen + 2)
+        self.histograms = data[:, :self.histoLen].copy()
+        self.sums = data[:, self.histoLen:].copy().view(np.uint64)[:, 0]
+
+    # check
+    # Returns True if every histogram adds up to the sum the hardware gave.
+    def check(self):
+        return bool(np.array_equal(self.histograms.sum(axis=1, dtype=np.uint64), self.sums))
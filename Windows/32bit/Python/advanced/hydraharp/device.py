@@ -0,0 +1,274 @@
+# HydraHarp 400  HHLIB v3.0  Device access.
+#
+# A thin object wrapper around the HHLIB calls the demos make, so that the
+# acquisition engines can work with a device object instead of globals.
+# Every call checks the return code and raises HHError with the text from
+# HH_GetErrorString, where the demos print it and close all devices.
+# SimulatedHydraHarp in synth.py offers the same interface without a device.
+#
+# Note: At the API level channel numbers are indexed 0..N-1
+#       where N is the number of channels the device has.
+
+import ctypes as ct
+from ctypes import byref
+import os
+import time
+import numpy as np
+
+from .decode import MODE_T2, MODE_T3, TTREADMAX
+from .contmode import EDGE_RISING
+
+# From hhdefin.h
+LIB_VERSION   = "3.0"
+MAXDEVNUM     = 8
+MODE_HIST     = 0
+MODE_CONT     = 8
+MAXLENCODE    = 6
+MAXHISTLEN    = 65536
+FLAG_OVERFLOW = 0x0001
+FLAG_FIFOFULL = 0x0002
+
+# Measurement settings as used by the demos, applied by HydraHarp.setup
+DEFAULTSETTINGS = {
+    "binning": 0,              # meaningful only in T3 and histogramming mode
+    "offset": 0,               # meaningful only in T3 and histogramming mode
+    "syncDivider": 1,          # observe mode! READ MANUAL!
+    "syncCFDZeroCross": 10,    # in mV
+    "syncCFDLevel": 50,        # in mV
+    "syncChannelOffset": 0,    # in ps, like a cable delay
+    "inputCFDZeroCross": 10,   # in mV
+    "inputCFDLevel": 50,       # in mV
+    "inputChannelOffset": 0,   # in ps, like a cable delay
+}
+
+hhlib = None
+
+
+# loadLibrary
+# Loads HHLIB on first use, so that importing this module needs no DLL.
+def loadLibrary():
+    global hhlib
+    if hhlib is None:
+        if os.name == "nt":
+            hhlib = ct.WinDLL("hhlib.dll")
+        else:
+            hhlib = ct.CDLL("libhh400.so")
+    return hhlib
+
+# libraryVersion
+def libraryVersion():
+    libVersion = ct.create_string_buffer(b"", 8)
+    loadLibrary().HH_GetLibraryVersion(libVersion)
+    return libVersion.value.decode("utf-8")
+
+# errorString
+# Returns the text for an HHLIB error code.
+def errorString(retcode):
+    text = ct.create_string_buffer(b"", 40)
+    loadLibrary().HH_GetErrorString(text, ct.c_int(retcode))
+    return text.value.decode("utf-8")
+
+
+# HHError
+# Raised when an HHLIB call returns an error code.
+class HHError(Exception):
+    def __init__(self, funcName, retcode):
+        Exception.__init__(self, "HH_%s error %d (%s)"
+                           % (funcName, retcode, errorString(retcode)))
+        self.funcName = funcName
+        self.retcode = retcode
+
+
+# HydraHarp
+# devidx: device index 0..MAXDEVNUM-1 as used by HH_OpenDevice
+class HydraHarp:
+    def __init__(self, devidx):
+        self.devidx = devidx
+        self.serial = None
+        self.mode = None
+        self.settings = None
+        self.numChannels = 0
+        self.histoLen = MAXHISTLEN
+        self.lib = loadLibrary()
+        self._flags = ct.c_int()
+        self._nRecords = ct.c_int()
+        self._ctcstatus = ct.c_int()
+
+    # Calls HH_<funcName> for this device and raises HHError on failure
+    def _call(self, funcName, *args):
+        retcode = getattr(self.lib, "HH_" + funcName)(ct.c_int(self.devidx), *args)
+        if retcode < 0:
+            raise HHError(funcName, retcode)
+        return retcode
+
+    # open
+    # Opens the device and returns its serial number.
+    def open(self):
+        hwSerial = ct.create_string_buffer(b"", 8)
+        self._call("OpenDevice", hwSerial)
+        self.serial = hwSerial.value.decode("utf-8")
+        return self.serial
+
+    def close(self):
+        self.lib.HH_CloseDevice(ct.c_int(self.devidx))
+
+    # initialize
+    # mode: MODE_HIST, MODE_T2, MODE_T3 or MODE_CONT
+    # refSource: 0 = internal clock, 1 = external
+    def initialize(self, mode, refSource=0):
+        self._call("Initialize", ct.c_int(mode), ct.c_int(refSource))
+        self.mode = mode
+        numChannels = ct.c_int()
+        self._call("GetNumOfInputChannels", byref(numChannels))
+        self.numChannels = numChannels.value
+
+    def hardwareInfo(self):
+        hwModel = ct.create_string_buffer(b"", 16)
+        hwPartno = ct.create_string_buffer(b"", 8)
+        hwVersion = ct.create_string_buffer(b"", 8)
+        self._call("GetHardwareInfo", hwModel, hwPartno, hwVersion)
+        return (hwModel.value.decode("utf-8"), hwPartno.value.decode("utf-8"),
+                hwVersion.value.decode("utf-8"))
+
+    def calibrate(self):
+        self._call("Calibrate")
+
+    # setup
+    # Initializes, calibrates and configures the device as the demos do.
+    # settings: dict overriding DEFAULTSETTINGS
+    # The mode and settings are kept so that the same setup can be repeated.
+    def setup(self, mode, settings=None, refSource=0):
+        merged = dict(DEFAULTSETTINGS)
+        merged.update(settings or {})
+        self.initialize(mode, refSource)
+        self.calibrate()
+        self._call("SetSyncDiv", ct.c_int(merged["syncDivider"]))
+        self._call("SetSyncCFD", ct.c_int(merged["syncCFDLevel"]),
+                   ct.c_int(merged["syncCFDZeroCross"]))
+        self._call("SetSyncChannelOffset", ct.c_int(merged["syncChannelOffset"]))
+        # We use the same input settings for all channels
+        for i in range(0, self.numChannels):
+            self._call("SetInputCFD", ct.c_int(i), ct.c_int(merged["inputCFDLevel"]),
+                       ct.c_int(merged["inputCFDZeroCross"]))
+            self._call("SetInputChannelOffset", ct.c_int(i),
+                       ct.c_int(merged["inputChannelOffset"]))
+        if mode != MODE_T2:
+            self._call("SetBinning", ct.c_int(merged["binning"]))
+            self._call("SetOffset", ct.c_int(merged["offset"]))
+        self.settings = merged
+        # After Init or SetSyncDiv allow >100 ms for valid count rate readings
+        time.sleep(0.2)
+
+    def setInputChannelEnable(self, channel, enable=True):
+        self._call("SetInputChannelEnable", ct.c_int(channel), ct.c_int(int(enable)))
+
+    # setMeasControl
+    # control: one of the MEASCTRL_ values in contmode.py
+    def setMeasControl(self, control, startEdge=EDGE_RISING, stopEdge=EDGE_RISING):
+        self._call("SetMeasControl", ct.c_int(control), ct.c_int(startEdge),
+                   ct.c_int(stopEdge))
+
+    # setHistoLen
+    # lenCode: the histograms get 1024 * 2**lenCode bins
+    # Returns the histogram length.
+    def setHistoLen(self, lenCode=MAXLENCODE):
+        histoLen = ct.c_int()
+        self._call("SetHistoLen", ct.c_int(lenCode), byref(histoLen))
+        self.histoLen = histoLen.value
+        return self.histoLen
+
+    # setStopOverflow
+    # Stops the histogramming when a bin reaches stopCount, if stop is set.
+    def setStopOverflow(self, stop, stopCount):
+        self._call("SetStopOverflow", ct.c_int(int(stop)), ct.c_int(stopCount))
+
+    def clearHistMem(self):
+        self._call("ClearHistMem")
+
+    # getHistogram
+    # Returns the histogram of channel as uint32 array of histoLen bins.
+    # clear: 1 clears the histogram memory afterwards
+    def getHistogram(self, channel, clear=0):
+        counts = (ct.c_uint * self.histoLen)()
+        self._call("GetHistogram", byref(counts), ct.c_int(channel), ct.c_int(clear))
+        return np.frombuffer(counts, dtype=np.uint32).copy()
+
+    # getHistograms
+    # The histograms of all channels as uint32 array (numChannels, histoLen).
+    # clear: 1 clears the histogram memory on the way, so that the next
+    #        measurement needs no ClearHistMem
+    def getHistograms(self, clear=0):
+        return np.array([self.getHistogram(i, clear) for i in range(0, self.numChannels)],
+                        dtype=np.uint32).reshape(self.numChannels, self.histoLen)
+
+    # getElapsedMeasTime
+    # ms the last measurement ran, e.g. when it was ended by an external signal.
+    def getElapsedMeasTime(self):
+        elapsed = ct.c_double()
+        self._call("GetElapsedMeasTime", byref(elapsed))
+        return elapsed.value
+
+    # getContModeBlock
+    # block: TContModeBlockBufType from contmode.py
+    # Returns the number of bytes received, 0 while no block is complete.
+    def getContModeBlock(self, block):
+        nBytes = ct.c_int()
+        self._call("GetContModeBlock", byref(block), byref(nBytes))
+        return nBytes.value
+
+    def getResolution(self):
+        resolution = ct.c_double()
+        self._call("GetResolution", byref(resolution))
+        return resolution.value
+
+    def getSyncRate(self):
+        syncRate = ct.c_int()
+        self._call("GetSyncRate", byref(syncRate))
+        return syncRate.value
+
+    def getCountRate(self, channel):
+        countRate = ct.c_int()
+        self._call("GetCountRate", ct.c_int(channel), byref(countRate))
+        return countRate.value
+
+    # getSyncPeriod
+    # Sync period in s, T3 only, valid two sync periods after startMeas.
+    def getSyncPeriod(self):
+        syncPeriod = ct.c_double()
+        self._call("GetSyncPeriod", byref(syncPeriod))
+        return syncPeriod.value
+
+    def getWarnings(self):
+        warnings = ct.c_int()
+        self._call("GetWarnings", byref(warnings))
+        if warnings.value == 0:
+            return ""
+        warningstext = ct.create_string_buffer(b"", 16384)
+        self._call("GetWarningsText", warningstext, warnings)
+        return warningstext.value.decode("utf-8")
+
+    # startMeas
+    # tacq: acquisition time in ms
+    def startMeas(self, tacq):
+        self._call("StartMeas", ct.c_int(tacq))
+
+    def stopMeas(self):
+        self._call("StopMeas")
+
+    def getFlags(self):
+        self._call("GetFlags", byref(self._flags))
+        return self._flags.value
+
+    # readFiFo
+    # buffer: ctypes array of at least count c_uint
+    # Returns the number of records read into the buffer. ctypes releases
+    # the GIL for the duration of the call.
+    def readFiFo(self, buffer, count=TTREADMAX):
+        self._call("ReadFiFo", byref(buffer), count, byref(self._nRecords))
+        return self._nRecords.value
+
+    # ctcStatus
+    # Returns True once the acquisition time has expired.
+    def ctcStatus(self):
+        self._call("CTCStatus", byref(self._ctcstatus))
+        return self._ctcstatus.value > 0
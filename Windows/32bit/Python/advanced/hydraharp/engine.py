@@ -0,0 +1,404 @@
+# HydraHarp 400  HHLIB v3.0  Threaded TTTR acquisition engine.
+#
+# The instant processing demo reads the FiFo and processes the data in one
+# loop, so any stall in the processing delays the next HH_ReadFiFo and may
+# overrun the FiFo. Here a dedicated reader thread does nothing but call
+# HH_ReadFiFo and put the filled buffers into a bounded queue. Consumer
+# stages, each in its own thread with its own bounded input queue, decode,
+# process and write the chunks in the order they were read. ctypes
+# releases the GIL during HH_ReadFiFo, so reading continues while the
+# consumers run Python code.
+#
+#   device -> reader -> queue -> stage 1 -> queue -> stage 2 -> ...
+#
+# The reader reads into the preallocated buffers of a BufferPool, the first
+# stage returns each buffer to the pool as soon as its function has
+# returned. So the first stage must not keep the records it gets (decoding
+# copies them into new event arrays anyway), a stage that wants to keep raw
+# records has to copy them. A PollScheduler paces the reads to the data
+# rate, see polling.py. With spill set, chunks that do not fit into the
+# first queue go to a spill file instead of making the reader wait, see
+# spill.py. With recover set, a FiFo overrun does not end the acquisition:
+# the reader stops the measurement and starts it again right away, the
+# device keeps its settings and calibration, and a Gap passes through the
+# stages where the data is missing.
+#
+# Queue depths and per stage throughput are available at any time via
+# stats(), also while the acquisition is running.
+
+import queue
+import threading
+import time
+
+from .buffers import BufferPool
+from .device import FLAG_FIFOFULL
+from .polling import PollScheduler
+from .spill import SpillQueue
+from .telemetry import FifoMonitor, FIFOSIZE
+
+
+# Gap
+# Passes through the stages in order with the chunks where the FiFo overran
+# and the engine restarted the measurement. The records from the overrun
+# up to the restart are lost, the records of the new measurement count
+# their time from the restart.
+# number: gaps so far, from 1
+# lastRead: time.perf_counter() the last records before the overrun came
+# detected: time.perf_counter() the overrun was seen
+# restart: time.perf_counter() HH_StartMeas returned again
+# elapsed: s from the first start of the measurement to the restart, the
+#          time the new records count from
+class Gap:
+    def __init__(self, number, lastRead, detected, restart, elapsed):
+        self.number = number
+        self.lastRead = lastRead
+        self.detected = detected
+        self.restart = restart
+        self.elapsed = elapsed
+
+    # latency
+    # s from seeing the overrun to measuring again.
+    @property
+    def latency(self):
+        return self.restart - self.detected
+
+    # duration
+    # s without data at least, from the last read before the overrun to
+    # the restart. The lost stretch starts earlier, with the first record
+    # that was still in the FiFo.
+    @property
+    def duration(self):
+        return self.restart - self.lastRead
+
+    # ticks
+    # The restart in units of the event time (T2 timetag or T3 nsync) of
+    # timeBase, see TimeBase.tickPeriod.
+    def ticks(self, timeBase):
+        return int(self.elapsed * 1e12 / float(timeBase.tickPeriod()))
+
+    # resume
+    # Lets decoder continue with the records after the gap on the time axis
+    # of the first measurement: their times start at the restart.
+    def resume(self, decoder, timeBase):
+        decoder.oflcorrection = max(decoder.oflcorrection, self.ticks(timeBase))
+
+
+# Stage
+# One consumer thread with its bounded input queue.
+# name: shown in the statistics
+# func: called with every item in order. Whatever it returns (unless None)
+#       is handed on to the next stage.
+# queueSize: number of items the input queue holds before the producer waits
+# onGap: optional function called with every Gap, which then goes on to
+#        the next stage in any case
+class Stage:
+    def __init__(self, name, func, queueSize, onGap=None):
+        self.name = name
+        self.func = func
+        self.onGap = onGap
+        self.queue = queue.Queue(queueSize)
+        self.next = None
+        self.pool = None # set for the first stage, which releases the buffers
+        self.skip = False # set to drop items unprocessed, e.g. to shed load
+        self.thread = None
+        self.nChunks = 0
+        self.nRecords = 0 # len() of the items processed
+        self.busy = 0.0 # s spent in func
+        self.blocked = 0.0 # s the producer waited for room in the queue
+        self.maxDepth = 0
+        self.nSkipped = 0
+
+    # put
+    # Hands an item to this stage, waiting while the queue is full unless
+    # the engine failed. None ends the stage.
+    def put(self, item, engine):
+        start = time.perf_counter()
+        while True:
+            try:
+                self.queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                if engine.error is not None and item is not None:
+                    if not isinstance(item, Gap): # a Gap holds no buffer
+                        self.done(item)
+                    return
+        self.blocked += time.perf_counter() - start
+        self.maxDepth = max(self.maxDepth, self.queue.qsize())
+
+    # done
+    # Returns the buffer of an item to the pool, if the items are buffers.
+    def done(self, item):
+        if self.pool is not None:
+            self.pool.release(item)
+
+    def run(self, engine):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if isinstance(item, Gap):
+                try:
+                    if self.onGap is not None and engine.error is None:
+                        self.onGap(item)
+                except Exception as exc:
+                    engine.fail(exc)
+                if self.next is not None:
+                    self.next.put(item, engine)
+                continue
+            if engine.error is not None:
+                self.done(item)
+                continue # drain after an error
+            if self.skip:
+                self.done(item)
+                self.nSkipped += 1
+                continue
+            start = time.perf_counter()
+            try:
+                result = self.func(item)
+            except Exception as exc:
+                engine.fail(exc)
+                continue
+            finally:
+                self.done(item)
+            self.busy += time.perf_counter() - start
+            self.nChunks += 1
+            self.nRecords += len(item)
+            if self.next is not None and result is not None:
+                self.next.put(result, engine)
+        if self.next is not None:
+            self.next.put(None, engine)
+
+
+# AcquisitionEngine
+# device: HydraHarp or SimulatedHydraHarp, set up for T2 or T3 mode
+# queueSize: capacity of each stage's input queue in chunks. The reader
+#            waits when the first queue is full, the data then piles up in
+#            the hardware FiFo.
+# nBuffers: number of FiFo read buffers, by default enough to fill the first
+#           queue with one more chunk being processed and one being read
+# scheduler: PollScheduler pacing the reads, by default one with the
+#            default settings
+# monitor: FifoMonitor watching the reads, by default one taking the input
+#          rate from the device, for the FiFo size of a SimulatedHydraHarp
+#          or the default size. Set its onWarning to be warned of an
+#          impending overrun.
+# spill: spill chunks to disk when the first queue is full instead of
+#        waiting. Its chunks in memory are then limited to nBuffers - 2.
+# spillDir: directory of the spill file, None for the temp directory
+# recover: restart the measurement after a FiFo overrun instead of ending,
+#          for the rest of tacq, see Gap. overrun is then only set if the
+#          restart failed or maxRestarts were used up.
+# maxRestarts: restarts per acquisition at most, None for no limit
+class AcquisitionEngine:
+    def __init__(self, device, queueSize=64, nBuffers=None, scheduler=None, monitor=None,
+                 spill=False, spillDir=None, recover=False, maxRestarts=None):
+        self.device = device
+        self.queueSize = queueSize
+        self.nBuffers = nBuffers
+        self.scheduler = scheduler or PollScheduler()
+        self.monitor = monitor or FifoMonitor(getattr(device, "fifoSize", FIFOSIZE),
+                                              device=device)
+        self.spill = spill
+        self.spillDir = spillDir
+        self.recover = recover
+        self.maxRestarts = maxRestarts
+        self.gaps = []
+        self.pool = None
+        self.spillQueue = None
+        self.stages = []
+        self.reader = None
+        self.stopping = threading.Event()
+        self.error = None
+        self.overrun = False
+        self.startTime = None
+        self.measStart = None # time.perf_counter() once HH_StartMeas returned
+        self.endTime = None
+        self.nReads = 0
+        self.nRecords = 0
+        self.readTime = 0.0 # s spent in HH_ReadFiFo
+        self.bufferWait = 0.0 # s the reader waited for a free buffer
+
+    # addStage
+    # Appends a consumer stage, see Stage. Returns the stage.
+    def addStage(self, name, func, queueSize=None, onGap=None):
+        stage = Stage(name, func, queueSize or self.queueSize, onGap)
+        if self.stages:
+            self.stages[-1].next = stage
+        self.stages.append(stage)
+        return stage
+
+    # fail
+    # Records the first error of any thread and stops the acquisition.
+    def fail(self, exc):
+        if self.error is None:
+            self.error = exc
+        self.stopping.set()
+
+    # start
+    # Starts the consumer threads and the measurement, returns at once.
+    # tacq: acquisition time in ms
+    def start(self, tacq):
+        if not self.stages:
+            raise ValueError("AcquisitionEngine needs at least one stage")
+        if self.pool is None:
+            self.pool = BufferPool(self.nBuffers or self.stages[0].queue.maxsize + 2)
+        self.stages[0].pool = self.pool
+        if self.spill and self.spillQueue is None:
+            # One buffer is being processed and one read at a time
+            maxsize = min(self.stages[0].queue.maxsize, len(self.pool) - 2)
+            if maxsize < 1:
+                raise ValueError("Spilling needs at least 3 buffers")
+            self.spillQueue = SpillQueue(self.pool, maxsize, self.spillDir)
+            self.stages[0].queue = self.spillQueue
+        for stage in self.stages:
+            stage.thread = threading.Thread(target=stage.run, args=(self,),
+                                            name="hh-" + stage.name, daemon=True)
+            stage.thread.start()
+        self.startTime = time.perf_counter()
+        self.reader = threading.Thread(target=self._read, args=(tacq,), name="hh-reader",
+                                       daemon=True)
+        self.reader.start()
+
+    # stop
+    # Ends the measurement early, the chunks read so far are still processed.
+    def stop(self):
+        self.stopping.set()
+
+    # running
+    def running(self):
+        return any(thread.is_alive() for thread in self.threads())
+
+    def threads(self):
+        return [t for t in [self.reader] + [s.thread for s in self.stages] if t is not None]
+
+    # wait
+    # Waits until all chunks have passed all stages. Raises the first error
+    # that occurred in any thread.
+    def wait(self, timeout=None):
+        for thread in self.threads():
+            thread.join(timeout)
+        if self.error is not None:
+            raise self.error
+        return not self.running()
+
+    # run
+    # start and wait in one.
+    def run(self, tacq):
+        self.start(tacq)
+        return self.wait()
+
+    def _read(self, tacq):
+        device, first, pool = self.device, self.stages[0], self.pool
+        scheduler, monitor = self.scheduler, self.monitor
+        try:
+            device.startMeas(tacq)
+            self.measStart = lastRead = time.perf_counter()
+            while not self.stopping.is_set():
+                if scheduler.checkFlags() and device.getFlags() & FLAG_FIFOFULL:
+                    if not self.recover or not self._restart(tacq, lastRead):
+                        self.overrun = True
+                        break
+                    continue
+                # With all buffers in flight we wait, the data then piles
+                # up in the hardware FiFo as with a full queue
+                start = time.perf_counter()
+                i = pool.acquire(0.1)
+                self.bufferWait += time.perf_counter() - start
+                if i is None:
+                    continue
+                start = time.perf_counter()
+                nRecords = device.readFiFo(pool.buffer(i), pool.size)
+                self.readTime += time.perf_counter() - start
+                self.nReads += 1
+                monitor.gotRecords(nRecords)
+                if nRecords > 0:
+                    lastRead = time.perf_counter()
+                    self.nRecords += nRecords
+                    first.put(pool.records(i, nRecords), self)
+                else:
+                    pool.release(i)
+                    if device.ctcStatus():
+                        break
+                scheduler.gotRecords(nRecords)
+                scheduler.wait()
+            device.stopMeas()
+        except Exception as exc:
+            self.fail(exc)
+        finally:
+            self.endTime = time.perf_counter()
+            first.put(None, self)
+
+    # Stops the measurement after an overrun and starts it again for the
+    # rest of tacq, with nothing else in between. Returns False if there is
+    # nothing left to measure, no restart left or the engine is stopping,
+    # e.g. after an error in a stage.
+    def _restart(self, tacq, lastRead):
+        detected = time.perf_counter()
+        self.device.stopMeas()
+        remaining = int(tacq - 1000 * (detected - self.measStart))
+        if (remaining <= 0 or self.stopping.is_set()
+                or (self.maxRestarts is not None and len(self.gaps) >= self.maxRestarts)):
+            return False
+        self.device.startMeas(remaining)
+        restart = time.perf_counter()
+        gap = Gap(len(self.gaps) + 1, lastRead, detected, restart, restart - self.measStart)
+        self.gaps.append(gap)
+        self.monitor.restarted()
+        self.stages[0].put(gap, self)
+        return True
+
+    # stats
+    # Returns the current statistics as a list of dicts, the reader first,
+    # then the stages in order:
+    # name, chunks, records, busy (s), rate (records/s while busy),
+    # throughput (records/s over the elapsed time), queue (current depth),
+    # maxQueue (deepest so far), blocked (s the producer had to wait) and
+    # skipped (items dropped while skip was set).
+    # For the reader queue and maxQueue are the buffers in flight and their
+    # high-water mark, blocked the time it waited for a free buffer.
+    def stats(self):
+        end = self.endTime if self.endTime is not None else time.perf_counter()
+        elapsed = max(end - self.startTime, 1e-9) if self.startTime else 1e-9
+        result = [{"name": "reader", "chunks": self.nReads, "records": self.nRecords,
+                   "busy": self.readTime,
+                   "rate": self.nRecords / self.readTime if self.readTime else 0.0,
+                   "throughput": self.nRecords / elapsed,
+                   "queue": self.pool.inFlight if self.pool else 0,
+                   "maxQueue": self.pool.highWater if self.pool else 0,
+                   "blocked": self.bufferWait, "skipped": 0}]
+        for stage in self.stages:
+            result.append({"name": stage.name, "chunks": stage.nChunks,
+                           "records": stage.nRecords, "busy": stage.busy,
+                           "rate": stage.nRecords / stage.busy if stage.busy else 0.0,
+                           "throughput": stage.nRecords / elapsed,
+                           "queue": stage.queue.qsize(), "maxQueue": stage.maxDepth,
+                           "blocked": stage.blocked, "skipped": stage.nSkipped})
+        return result
+
+    # report
+    # Returns the statistics as printable table.
+    def report(self):
+        lines = ["%-10s %8s %12s %14s %14s %6s %6s %8s"
+                 % ("stage", "chunks", "records", "records/s busy", "records/s", "queue",
+                    "max", "waited")]
+        for s in self.stats():
+            lines.append("%-10s %8d %12d %14.0f %14.0f %6d %6d %7.3fs"
+                         % (s["name"], s["chunks"], s["records"], s["rate"],
+                            s["throughput"], s["queue"], s["maxQueue"], s["blocked"]))
+        fifo = self.monitor.summary()
+        lines.append("FiFo: reads %.0f%% full on average, longest gap %.3fs, backlog up to "
+                     "%.0f records (estimated), %d warnings"
+                     % (100 * fifo["meanFill"], fifo["maxGap"], fifo["maxBacklog"],
+                        fifo["warnings"]))
+        if self.gaps:
+            latencies = [gap.latency for gap in self.gaps]
+            lines.append("Overruns: %d recovered, %.3fs without data, restart took %.2fms on "
+                         "average, %.2fms at most"
+                         % (len(self.gaps), sum(gap.duration for gap in self.gaps),
+                            1000 * sum(latencies) / len(latencies), 1000 * max(latencies)))
+        if self.spillQueue is not None:
+            spill = self.spillQueue
+            lines.append("Spill: %d chunks (%.1f MB) spilled, up to %.1f MB on disk at once, "
+                         "%.3fs writing" % (spill.nSpilled, spill.spilledBytes / 1e6,
+                                            spill.maxSpillBytes / 1e6, spill.spillTime))
+        return "\n".join(lines)
@@ -0,0 +1,211 @@
+# HydraHarp 400  HHLIB v3.0  Time aligned merge of several event streams.
+#
+# Several HydraHarps recording the same experiment each count time from
+# their own start and with their own clock. EventMerger brings the
+# decoded event arrays of N devices or files onto one time axis, applying
+# a per stream offset and clock rate correction, and merges them into one
+# time ordered stream of MERGEDEVENTs tagged with stream and channel.
+#
+# The merge works chunk by chunk and vectorized: every chunk fed is
+# converted to global picoseconds in one go, and whatever lies before the
+# watermark, the earliest time any stream that has not ended can still
+# deliver, is emitted after one stable sort. Each stream must be time
+# ordered by itself as the hardware delivers it, in T3 mode up to the sync
+# period: the watermark of a T3 stream is the start of its latest sync
+# period. A stream that does not deliver holds the merge back, the events
+# wait until it does or ends.
+#
+# Markers: the decoders keep the marker time arithmetic of the demos, which
+# does not give the marker time on the photon time axis in T2 mode. A
+# marker is therefore placed at the time of the last photon before it in
+# its stream, which keeps it in arrival order.
+
+import threading
+import numpy as np
+
+from .events import EVENT_MARKER
+
+# Merged event, 13 bytes
+# time: global time in ps, after offset and clock rate correction
+# dtime: T3 dtime in units of the stream's resolution, 0 in T2
+# stream: index of the stream (device or file) the event came from
+# channel, flags: as in T2EVENT/T3EVENT
+MERGEDEVENT = np.dtype([("time", "<i8"), ("dtime", "<u2"), ("stream", "u1"),
+                        ("channel", "u1"), ("flags", "u1")])
+
+INT64MIN = np.iinfo(np.int64).min
+
+# The same 13 bytes as one opaque item. NumPy copies packed structured
+# items field by field, selecting and reordering whole items through this
+# view is several times faster.
+MERGEDRAW = np.dtype((np.void, MERGEDEVENT.itemsize))
+
+
+# fitClock
+# reference: times in ps of common events (e.g. a shared marker signal)
+#            on the reference time axis
+# local: times in ps of the same events on the axis of another device
+# Returns offset (ps) and ppm for EventMerger, which map the local onto
+# the reference axis as reference = local + local * ppm * 1e-6 + offset,
+# from a least squares fit.
+def fitClock(reference, local):
+    reference = np.asarray(reference, dtype=np.float64)
+    local = np.asarray(local, dtype=np.float64)
+    if len(local) < 2:
+        return int(round(reference[0] - local[0])) if len(local) else 0, 0.0
+    # Fit relative to the first event to keep the float64 precision
+    slope, intercept = np.polyfit(local - local[0], reference - local[0], 1)
+    ppm = (slope - 1.0) * 1e6
+    offset = intercept - local[0] * (slope - 1.0)
+    return int(round(offset)), float(ppm)
+
+
+# EventMerger
+# timeBases: one TimeBase per stream, giving its resolution and sync period
+# offsets: per stream offset in ps added to its times, default 0
+# ppm: per stream clock rate correction in parts per million, a stream
+#      whose clock runs slow by x ppm gets +x, default 0
+# onEvents: optional function called with every merged array in order,
+#           also when feed is called from several threads at once
+# feed and finish can be called from several threads, e.g. from one stage
+# per device of a MultiDeviceEngine.
+class EventMerger:
+    def __init__(self, timeBases, offsets=None, ppm=None, onEvents=None):
+        n = len(timeBases)
+        self.timeBases = list(timeBases)
+        self.offsets = list(offsets) if offsets is not None else [0] * n
+        self.ppm = list(ppm) if ppm is not None else [0.0] * n
+        self.onEvents = onEvents
+        self.lock = threading.Lock()
+        self.pending = [] # converted chunks of events after the watermark
+        self.nPending = 0
+        self.latest = [None] * n # global time no later event of a stream precedes
+        self.lastPhoton = [0] * n # local ps of the latest photon per stream
+        self.bound = [0] * n # local ps no later event of a stream precedes
+        self.finished = [False] * n
+        self.nIn = 0
+        self.nOut = 0
+        self.maxPending = 0
+
+    # globalTimes
+    # Returns the global times in ps of an event array of stream i.
+    def globalTimes(self, i, events):
+        timeBase = self.timeBases[i]
+        local = np.asarray(timeBase.eventPicoseconds(events), dtype=np.int64)
+        marker = (events["flags"] & EVENT_MARKER) != 0
+        if marker.any():
+            before = np.maximum.accumulate(np.where(marker, INT64MIN, local))
+            np.maximum(before, self.lastPhoton[i], out=before)
+            local = np.where(marker, before, local)
+        if len(local) > 0:
+            self.lastPhoton[i] = int(local[-1])
+        return self.correct(i, local)
+
+    # correct
+    # Applies the clock rate correction and offset of stream i to local
+    # times in ps.
+    def correct(self, i, local):
+        local = np.asarray(local, dtype=np.int64)
+        if self.ppm[i] != 0.0:
+            local = local + np.rint(local * (self.ppm[i] * 1e-6)).astype(np.int64)
+        return local + self.offsets[i]
+
+    # Returns the local time in ps no later event of stream i precedes, given
+    # the events of its latest non-empty chunk: the time of its last photon
+    # in T2, the start of that photon's sync period in T3. A chunk of
+    # markers only leaves the bound where it was: in T3, photons of the
+    # same sync period with a smaller dtime may still follow.
+    def _bound(self, i, events):
+        timeBase = self.timeBases[i]
+        photons = np.flatnonzero((events["flags"] & EVENT_MARKER) == 0)
+        if len(photons) > 0:
+            ticks = events["nsync" if "nsync" in events.dtype.names else "timetag"]
+            self.bound[i] = int(timeBase.toPicoseconds(ticks[photons[-1:]])[0])
+        return self.bound[i]
+
+    # Converts an event array of stream i into MERGEDEVENTs
+    def _convert(self, i, events):
+        merged = np.empty(len(events), dtype=MERGEDEVENT)
+        merged["time"] = self.globalTimes(i, events)
+        merged["dtime"] = events["dtime"] if "dtime" in events.dtype.names else 0
+        merged["stream"] = i
+        merged["channel"] = events["channel"]
+        merged["flags"] = events["flags"]
+        return merged
+
+    # Hands out the pending events up to the watermark in time order
+    def _emit(self):
+        active = [t for t, done in zip(self.latest, self.finished) if not done]
+        if any(t is None for t in active):
+            return np.empty(0, dtype=MERGEDEVENT) # a stream has not delivered yet
+        watermark = min(active) if active else None # None once all streams ended
+        taken, kept = [], []
+        for chunk in self.pending:
+            if watermark is None:
+                taken.append(chunk)
+                continue
+            due = chunk["time"] <= watermark
+            if due.all():
+                taken.append(chunk)
+            elif due.any():
+                raw = chunk.view(MERGEDRAW)
+                taken.append(raw[due].view(MERGEDEVENT))
+                kept.append(raw[~due].view(MERGEDEVENT))
+            else:
+                kept.append(chunk)
+        self.pending = kept
+        self.nPending = sum(len(chunk) for chunk in kept)
+        self.maxPending = max(self.maxPending, self.nPending)
+        if not taken:
+            return np.empty(0, dtype=MERGEDEVENT)
+        out = np.concatenate([chunk.view(MERGEDRAW) for chunk in taken])
+        # A stable sort keeps the order within a stream for equal times
+        order = np.argsort(out.view(MERGEDEVENT)["time"], kind="stable")
+        out = out[order].view(MERGEDEVENT)
+        self.nOut += len(out)
+        if self.onEvents is not None:
+            self.onEvents(out)
+        return out
+
+    # feed
+    # i: index of the stream
+    # events: next T2EVENT or T3EVENT array of the stream
+    # Returns the merged events that are complete now as MERGEDEVENT array
+    # (often empty, the events then wait for the other streams).
+    def feed(self, i, events):
+        with self.lock:
+            incoming = self._convert(i, events)
+            self.nIn += len(incoming)
+            if len(incoming) > 0:
+                self.pending.append(incoming)
+                self.latest[i] = int(self.correct(i, self._bound(i, events)))
+            return self._emit()
+
+    # finish
+    # Marks stream i as ended, it no longer holds the merge back. Returns
+    # the merged events that are complete now, all remaining ones once all
+    # streams have ended.
+    def finish(self, i):
+        with self.lock:
+            self.finished[i] = True
+            return self._emit()
+
+
+# mergeStreams
+# streams: one iterable of event arrays per stream, e.g. a generator
+#          decoding the Segments of each device
+# merger: EventMerger for the streams
+# Yields the merged events chunk by chunk. The next chunk is always taken
+# from the stream that is furthest behind, so few events have to wait.
+def mergeStreams(streams, merger):
+    iterators = [iter(stream) for stream in streams]
+    while not all(merger.finished):
+        # Streams that have not delivered yet come first
+        i = min((j for j in range(len(iterators)) if not merger.finished[j]),
+                key=lambda j: (merger.latest[j] is not None, merger.latest[j] or 0))
+        try:
+            merged = merger.feed(i, next(iterators[i]))
+        except StopIteration:
+            merged = merger.finish(i)
+        if len(merged) > 0:
+            yield merged
@@ -0,0 +1,93 @@
+# HydraHarp 400  HHLIB v3.0  Event stream merge benchmark.
+#
+# Decodes synthetic T2 and T3 streams of 1 to 4 devices, each with its own
+# offset and clock rate error, merges them with an EventMerger and shows
+# the merge rate, how many events had to wait for the other streams at
+# most, and whether the result equals a full sort of all events at once.
+# Also checks a T3 stream with a chunk of markers only between photons of
+# one sync period.
+#
+# Usage: python -m hydraharp.mergebench [photonRate]
+
+import sys
+import time
+import numpy as np
+
+from .decode import TTTRDecoder, TTREADMAX, MODE_T2, MODE_T3
+from .events import T3EVENT, EVENT_MARKER
+from .merge import EventMerger, mergeStreams
+from .synth import syntheticRecords
+from .timebase import TimeBase
+
+MAXSTREAMS = 4
+NCHUNKS = 16
+OFFSETS = [0, 123456789, -5000, 987654] # ps
+PPM = [0.0, 12.5, -3.0, 0.8]
+
+
+# decodedStreams
+# Returns the decoded chunks and the TimeBase of n synthetic streams.
+def decodedStreams(mode, n, photonRate):
+    streams, timeBases = [], []
+    for i in range(n):
+        decoder = TTTRDecoder(mode)
+        records = syntheticRecords(mode, NCHUNKS * TTREADMAX, photonRate=photonRate, seed=i)
+        # Chunk boundaries differ between the streams as they would in practice
+        streams.append([decoder.feed(chunk) for chunk in np.array_split(records, NCHUNKS + i)])
+        if mode == MODE_T2:
+            timeBases.append(TimeBase(MODE_T2, 1))
+        else:
+            timeBases.append(TimeBase(MODE_T3, 25, 12500))
+    return streams, timeBases
+
+# fullSort
+# The reference result: all events of all streams converted and sorted at
+# once.
+def fullSort(streams, timeBases, offsets, ppm):
+    merger = EventMerger(timeBases, offsets, ppm)
+    merged = np.concatenate([merger._convert(i, np.concatenate(stream))
+                             for i, stream in enumerate(streams)])
+    return merged[np.argsort(merged["time"], kind="stable")]
+
+# markerOnlyStream
+# Returns the chunks and TimeBase of a T3 stream in which a chunk of
+# markers only comes between photons of the same sync period, the later
+# one with the smaller dtime.
+def markerOnlyStream():
+    def chunk(*events):
+        return np.array(list(events), dtype=T3EVENT)
+    stream = [chunk((10, 400, 1, 0)),
+              chunk((10, 0, 1, EVENT_MARKER)),
+              chunk((10, 5, 2, 0), (11, 0, 1, 0))]
+    return [stream], [TimeBase(MODE_T3, 25, 12500)]
+
+# same
+# Whether merged equals the full sort reference.
+def same(merged, reference):
+    # Events of equal time may come in another order across streams
+    return (np.array_equal(merged["time"], reference["time"])
+            and np.array_equal(np.sort(merged, order=["stream", "time"]),
+                               np.sort(reference, order=["stream", "time"])))
+
+def main(photonRate):
+    print("%-4s %7s  %10s  %10s  %12s  %s" % ("mode", "streams", "events", "M events/s",
+                                             "max pending", "same as full sort"))
+    for mode in (MODE_T2, MODE_T3):
+        for n in range(1, MAXSTREAMS + 1):
+            streams, timeBases = decodedStreams(mode, n, photonRate)
+            merger = EventMerger(timeBases, OFFSETS[:n], PPM[:n])
+            start = time.perf_counter()
+            merged = np.concatenate(list(mergeStreams(streams, merger)))
+            elapsed = time.perf_counter() - start
+            reference = fullSort(streams, timeBases, OFFSETS[:n], PPM[:n])
+            print("T%d   %7d  %10d  %10.2f  %12d  %s"
+                  % (mode, n, len(merged), len(merged) / elapsed / 1e6,
+                     merger.maxPending, same(merged, reference)))
+    streams, timeBases = markerOnlyStream()
+    merged = np.concatenate(list(mergeStreams(streams, EventMerger(timeBases))))
+    print("T3 chunk of markers only within a sync period: same as full sort %s"
+          % same(merged, fullSort(streams, timeBases, [0], [0.0])))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(float(sys.argv[1]) if len(sys.argv) > 1 else 1e6))
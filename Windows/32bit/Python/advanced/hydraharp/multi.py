@@ -0,0 +1,153 @@
+# HydraHarp 400  HHLIB v3.0  Parallel acquisition from several devices.
+#
+# The demos note that several devices can be used in parallel but only use
+# the first one, and close all device indices at the end. openDevices
+# opens just the devices with the given serial numbers, MultiDeviceEngine
+# configures them concurrently and runs one AcquisitionEngine per device,
+# each with its own FiFo reader thread, its own stages and so its own
+# decoder state and output. HHLIB calls release the GIL, as do the NumPy
+# operations the decoding mostly consists of, so the devices are read and
+# processed side by side on a multi-core machine:
+#
+#   engine = MultiDeviceEngine(openDevices(["1012345", "1012346"]))
+#   engine.setup(MODE_T2, settings)
+#   engine.addStage("decode", lambda device: TTTRDecoder(device.mode).feed)
+#   engine.addStage("count", lambda device: EventSink(countPhotons).gotEvents)
+#   engine.run(tacq)
+#   engine.close()
+
+import concurrent.futures
+
+from .device import HydraHarp, HHError, MAXDEVNUM
+from .engine import AcquisitionEngine
+
+
+# openDevices
+# serials: serial numbers of the devices to open, None for all found
+# Returns the opened HydraHarps in the order of serials (in the order of
+# their device index for None). Devices that are not wanted are closed
+# again, the others stay untouched. Raises ValueError if a serial number
+# was not found.
+def openDevices(serials=None):
+    found = {}
+    for i in range(0, MAXDEVNUM):
+        device = HydraHarp(i)
+        try:
+            serial = device.open()
+        except HHError:
+            continue # no device at this index or in use
+        if serials is None or serial in serials:
+            found[serial] = device
+        else:
+            device.close()
+    missing = [serial for serial in serials or [] if serial not in found]
+    if missing:
+        for device in found.values():
+            device.close()
+        raise ValueError("HydraHarp %s not found" % ", ".join(missing))
+    if serials is None:
+        return list(found.values())
+    return [found[serial] for serial in serials]
+
+
+# MultiDeviceEngine
+# devices: opened HydraHarps (or SimulatedHydraHarps)
+# queueSize, engineSettings: passed on to the AcquisitionEngine of every
+#                            device (nBuffers, spill, ...)
+class MultiDeviceEngine:
+    def __init__(self, devices, queueSize=64, **engineSettings):
+        if not devices:
+            raise ValueError("MultiDeviceEngine needs at least one device")
+        self.devices = list(devices)
+        self.queueSize = queueSize
+        self.engineSettings = engineSettings
+        self.engines = [AcquisitionEngine(device, queueSize, **engineSettings)
+                        for device in self.devices]
+
+    # each
+    # Calls func(device) for all devices concurrently and returns the
+    # results in the order of the devices, e.g. each(HydraHarp.getSyncRate).
+    # args: further lists with one entry per device, passed along
+    def each(self, func, *args):
+        with concurrent.futures.ThreadPoolExecutor(len(self.devices)) as executor:
+            return list(executor.map(func, self.devices, *args))
+
+    # setup
+    # Sets up all devices concurrently, see HydraHarp.setup. The calibration
+    # and the settling time then pass once instead of once per device.
+    # settings: dict for all devices, or list with one dict per device
+    def setup(self, mode, settings=None, refSource=0):
+        if not isinstance(settings, (list, tuple)):
+            settings = [settings] * len(self.devices)
+        self.each(lambda device, s: device.setup(mode, s, refSource), settings)
+
+    # addStage
+    # Appends a stage to the engine of every device.
+    # factory: called with each device, returns the stage function for it,
+    #          e.g. lambda device: TTTRDecoder(device.mode).feed
+    def addStage(self, name, factory, queueSize=None):
+        return [engine.addStage(name, factory(engine.device), queueSize)
+                for engine in self.engines]
+
+    # start
+    # Starts the measurements of all devices, returns at once.
+    def start(self, tacq):
+        for engine in self.engines:
+            engine.start(tacq)
+
+    # stop
+    # Ends all measurements early.
+    def stop(self):
+        for engine in self.engines:
+            engine.stop()
+
+    def running(self):
+        return any(engine.running() for engine in self.engines)
+
+    # wait
+    # Waits for all engines. An error in one engine stops all of them, the
+    # error of the first device that had one is raised once all have ended.
+    def wait(self, timeout=None):
+        for engine in self.engines:
+            try:
+                engine.wait(timeout)
+            except Exception:
+                self.stop()
+        for engine in self.engines:
+            if engine.error is not None:
+                raise engine.error
+        return not self.running()
+
+    def run(self, tacq):
+        self.start(tacq)
+        return self.wait()
+
+    # overrun
+    # List of the devices whose FiFo overran.
+    @property
+    def overrun(self):
+        return [engine.device for engine in self.engines if engine.overrun]
+
+    # throughput
+    # Records/s read from all devices together over the measurement.
+    def throughput(self):
+        return sum(engine.stats()[0]["throughput"] for engine in self.engines)
+
+    # report
+    # Returns the reports of all engines, headed by the serial numbers, and
+    # the aggregate throughput.
+    def report(self):
+        lines = []
+        for engine in self.engines:
+            lines.append("HydraHarp %s%s" % (engine.device.serial,
+                                             ", FiFo overrun!" if engine.overrun else ""))
+            lines.append(engine.report())
+        lines.append("All devices: %d records, %.0f records/s"
+                     % (sum(engine.nRecords for engine in self.engines), self.throughput()))
+        return "\n".join(lines)
+
+    # close
+    # Closes the devices of this engine, and only these.
+    def close(self):
+        for device in self.devices:
+            device.close()
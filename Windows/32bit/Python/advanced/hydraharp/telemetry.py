@@ -0,0 +1,177 @@
+# HydraHarp 400  HHLIB v3.0  FiFo backlog telemetry.
+#
+# FLAG_FIFOFULL tells of an overrun only once data has been lost. The
+# FifoMonitor instead watches every HH_ReadFiFo: the records it returned,
+# how full the chunk was and the time since the previous read. From these
+# it estimates how many records are still waiting in the hardware FiFo:
+#
+# - A read that returns less than a full chunk has emptied the FiFo, its
+#   records over the time since the previous read give the input rate.
+# - A full chunk may have left records behind. Of those that came in since
+#   the previous read at the input rate, all but the chunk are added to the
+#   backlog.
+#
+# When the reads keep coming back full, their size tells nothing about the
+# input rate any more. Given the device, the monitor therefore also takes
+# the input rate from its count rates, once every rateInterval s.
+#
+# From the backlog and its growth over the last reads the monitor predicts
+# when the FiFo would overrun. When that is less than horizon s ahead, or
+# the backlog passes threshold of the FiFo, it calls onWarning, so that the
+# application can shed load (skip analysis stages, pause displays) while
+# no data has been lost yet.
+
+import math
+import time
+import numpy as np
+
+from .decode import TTREADMAX, T2WRAPAROUND_V2, T3WRAPAROUND, MODE_T2
+
+FIFOSIZE = 2 * 1024 * 1024 # records, assumed FiFo depth, pass that of your device
+HISTORY  = 4096            # reads kept in the per read history
+
+
+# inputRecordRate
+# Records/s a HydraHarp (or SimulatedHydraHarp) in T2 or T3 mode puts into
+# its FiFo according to its count rates: the photons, in T2 the syncs, and
+# at most one overflow record per wraparound. Markers are not counted.
+def inputRecordRate(device):
+    rate = float(sum(device.getCountRate(i) for i in range(device.numChannels)))
+    syncRate = device.getSyncRate() / float((device.settings or {}).get("syncDivider", 1))
+    if device.mode == MODE_T2:
+        rate += syncRate + 1e12 / T2WRAPAROUND_V2
+    else:
+        rate += syncRate / T3WRAPAROUND
+    return rate
+
+
+# FifoMonitor
+# fifoSize: depth of the hardware FiFo in records
+# chunkSize: records requested per HH_ReadFiFo
+# horizon: s ahead at which a predicted overrun causes a warning
+# threshold: fraction of the FiFo at which the backlog causes a warning
+# onWarning: called with the monitor when a warning begins
+# smoothing: weight of the newest read in the rate and growth averages
+# device: HydraHarp to take the input rate from, see inputRecordRate. It is
+#         called from gotRecords, i.e. in the thread reading the FiFo.
+# rateInterval: s between two updates of the input rate from the device
+class FifoMonitor:
+    def __init__(self, fifoSize=FIFOSIZE, chunkSize=TTREADMAX, horizon=2.0, threshold=0.5,
+                 onWarning=None, smoothing=0.2, device=None, rateInterval=1.0):
+        self.fifoSize = fifoSize
+        self.chunkSize = chunkSize
+        self.horizon = horizon
+        self.threshold = threshold
+        self.onWarning = onWarning
+        self.smoothing = smoothing
+        self.device = device
+        self.rateInterval = rateInterval
+        self.inputRate = 0.0 # records/s according to the device, if any
+        self.rateTime = None
+        # Per read history, the last HISTORY reads in a ring
+        self.history = np.zeros(HISTORY, dtype=[("time", np.float64), ("records", np.int32),
+                                                ("gap", np.float64), ("backlog", np.float64)])
+        self.startTime = None
+        self.lastRead = None
+        self.nReads = 0
+        self.nRecords = 0
+        self.nFull = 0
+        self.maxGap = 0.0
+        self.rate = 0.0 # input rate in records/s estimated from partial reads
+        self.backlog = 0.0 # estimated records waiting in the FiFo
+        self.maxBacklog = 0.0
+        self.growth = 0.0 # records/s the backlog grows by
+        self.warning = False
+        self.nWarnings = 0
+        self.firstWarning = None # s after the first read
+
+    # restarted
+    # To be called when a restart of the measurement emptied the FiFo.
+    def restarted(self):
+        self.backlog = 0.0
+        self.growth = 0.0
+
+    # gotRecords
+    # To be called after every read with the number of records it returned.
+    # Returns True while a warning is on.
+    def gotRecords(self, nRecords, now=None):
+        if now is None:
+            now = time.perf_counter()
+        if self.lastRead is None:
+            self.startTime = now
+            gap = 0.0
+        else:
+            gap = now - self.lastRead
+        self.lastRead = now
+        self.nReads += 1
+        self.nRecords += nRecords
+        self.maxGap = max(self.maxGap, gap)
+        if self.device is not None and (self.rateTime is None
+                                        or now - self.rateTime >= self.rateInterval):
+            self.inputRate = inputRecordRate(self.device)
+            self.rateTime = now
+        backlog = self.backlog
+        if nRecords < self.chunkSize:
+            if gap > 0:
+                self._average("rate", nRecords / gap)
+            self.backlog = 0.0
+        else:
+            self.nFull += 1
+            if self.rate == 0 and gap > 0:
+                # No partial read yet, the input is at least this fast
+                self.rate = nRecords / gap
+            rate = self.inputRate or self.rate
+            self.backlog = max(0.0, self.backlog + rate * gap - nRecords)
+        if gap > 0:
+            self._average("growth", (self.backlog - backlog) / gap)
+        self.maxBacklog = max(self.maxBacklog, self.backlog)
+        self.history[(self.nReads - 1) % HISTORY] = (now, nRecords, gap, self.backlog)
+        self._check(now)
+        return self.warning
+
+    def _average(self, name, value):
+        old = getattr(self, name)
+        setattr(self, name, old + self.smoothing * (value - old))
+
+    # timeToOverrun
+    # Predicted s until the FiFo overruns at the current growth, inf if the
+    # backlog does not grow.
+    def timeToOverrun(self):
+        if self.growth <= 0:
+            return math.inf
+        return max(0.0, self.fifoSize - self.backlog) / self.growth
+
+    def _check(self, now):
+        warning = (self.backlog >= self.threshold * self.fifoSize
+                   or self.timeToOverrun() < self.horizon)
+        started = warning and not self.warning
+        self.warning = warning
+        if started:
+            self.nWarnings += 1
+            if self.firstWarning is None:
+                self.firstWarning = now - self.startTime
+            if self.onWarning is not None:
+                self.onWarning(self)
+
+    # recent
+    # The per read history of the last n reads, oldest first: time, records,
+    # gap (s since the previous read) and backlog (estimated).
+    def recent(self, n=HISTORY):
+        n = min(n, self.nReads, HISTORY)
+        return self.history[np.arange(self.nReads - n, self.nReads) % HISTORY]
+
+    # summary
+    # Returns the statistics so far as dict: reads, records, meanRecords,
+    # meanFill (fraction of chunkSize), fullReads, meanGap, maxGap (s), rate
+    # (records/s, from the device if given), backlog, maxBacklog (records), growth (records/s),
+    # timeToOverrun (s) and warnings.
+    def summary(self):
+        elapsed = self.lastRead - self.startTime if self.nReads > 1 else 0.0
+        meanRecords = self.nRecords / self.nReads if self.nReads else 0.0
+        return {"reads": self.nReads, "records": self.nRecords, "meanRecords": meanRecords,
+                "meanFill": meanRecords / self.chunkSize, "fullReads": self.nFull,
+                "meanGap": elapsed / (self.nReads - 1) if self.nReads > 1 else 0.0,
+                "maxGap": self.maxGap, "rate": self.inputRate or self.rate,
+                "backlog": self.backlog,
+                "maxBacklog": self.maxBacklog, "growth": self.growth,
+                "timeToOverrun": self.timeToOverrun(), "warnings": self.nWarnings}
@@ -0,0 +1,111 @@
+# HydraHarp 400  HHLIB v3.0  Decoder throughput suite.
+#
+# Times every decoding path on synthetic T2 and T3 record streams of
+# 1M, 10M and 100M records (see synth.py) and reports records/s and the
+# raw data rate in bytes/s, to be compared with the rate the FiFo has to
+# be emptied at. The streams are generated block by block and only the
+# decoding is timed. No device is needed.
+#
+# Usage: python -m hydraharp.throughput [--sizes 1e6,1e7,1e8] [--mode T2|T3]
+#                                       [--photon-rate 5e6] [--sync-rate ...]
+#                                       [--marker-rate 100] [--reference 2e5]
+
+import argparse
+import sys
+import time
+import numpy as np
+
+from .decode import (decodeT2, decodeT3, TTTRDecoder, RecordFilter, collapseOverflows,
+                     TTREADMAX, CHANNELSHIFT, OVERFLOWRECORD, MODE_T2, MODE_T3,
+                     RECORD_PHOTONS)
+from .view import RecordView
+from .synth import SyntheticStream
+from .bench import referenceT2, referenceT3, report
+
+BLOCK = 8 * TTREADMAX # records generated at once
+
+
+# decoderPaths
+# Returns (name, function) for every decoding path, each function taking
+# the next chunk of the stream and carrying its own state.
+def decoderPaths(mode):
+    reference = referenceT2 if mode == MODE_T2 else referenceT3
+    decode = decodeT2 if mode == MODE_T2 else decodeT3
+    name = "T2" if mode == MODE_T2 else "T3"
+    state = {"reference": 0, "decode": 0, "view": 0}
+
+    def referencePath(chunk):
+        state["reference"] = reference(chunk.tolist(), state["reference"])[1]
+
+    def decodePath(chunk):
+        state["decode"] = decode(chunk, state["decode"])[-1]
+
+    def viewPath(chunk):
+        view = RecordView(chunk, mode, state["view"])
+        view.channel, view.timetag # decodes just these columns
+        state["view"] = view.endOflcorrection
+
+    decoder = TTTRDecoder(mode)
+    filtered = TTTRDecoder(mode, recordFilter=RecordFilter(mode, (1, 2), RECORD_PHOTONS))
+    return [("Process%s (string based)" % name, referencePath),
+            ("decode%s (vectorized)" % name, decodePath),
+            ("TTTRDecoder.feed (events)", decoder.feed),
+            ("TTTRDecoder.feed, channels 1 and 2", filtered.feed),
+            ("RecordView, channel and timetag", viewPath),
+            ("collapseOverflows", lambda chunk: collapseOverflows(chunk, mode))]
+
+# runSize
+# Decodes nRecords records of the stream with every path and prints the
+# throughput. The string based reference only sees the first nReference.
+def runSize(mode, nRecords, nReference, settings):
+    stream = SyntheticStream(mode, **settings)
+    paths = decoderPaths(mode)
+    elapsed = [0.0] * len(paths)
+    counted = [0] * len(paths)
+    nOverflows = 0
+    for first in range(0, nRecords, BLOCK):
+        block = stream.read(min(BLOCK, nRecords - first))
+        nOverflows += int(np.count_nonzero((block >> CHANNELSHIFT) == OVERFLOWRECORD))
+        for i, (name, path) in enumerate(paths):
+            todo = block if i > 0 else block[:max(0, nReference - first)]
+            start = time.perf_counter()
+            for j in range(0, len(todo), TTREADMAX):
+                path(todo[j:j + TTREADMAX])
+            elapsed[i] += time.perf_counter() - start
+            counted[i] += len(todo)
+
+    print("%s, %d records, %.1f%% overflows, %.3f s of measurement"
+          % ("T2" if mode == MODE_T2 else "T3", nRecords, 100.0 * nOverflows / nRecords,
+             stream.time * 1e-12))
+    for (name, path), seconds, n in zip(paths, elapsed, counted):
+        if n > 0:
+            rate = n / seconds
+            report(name, rate, "%7.1f MB/s" % (4 * rate / 1e6))
+    print("")
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m hydraharp.throughput",
+                                     description="Decoder throughput on synthetic records")
+    parser.add_argument("--sizes", default="1e6,1e7,1e8",
+                        help="comma separated numbers of records per run")
+    parser.add_argument("--mode", choices=["T2", "T3"], action="append",
+                        help="mode to run, default both")
+    parser.add_argument("--photon-rate", type=float, default=5e6, help="photons per s")
+    parser.add_argument("--sync-rate", type=float, default=None,
+                        help="sync rate in Hz, default 100 kHz (T2) or 80 MHz (T3)")
+    parser.add_argument("--marker-rate", type=float, default=100.0, help="markers per s")
+    parser.add_argument("--channels", type=int, default=8, help="input channels in use")
+    parser.add_argument("--reference", type=float, default=2e5,
+                        help="records to run through the slow string based reference")
+    args = parser.parse_args(argv[1:])
+
+    settings = {"photonRate": args.photon_rate, "syncRate": args.sync_rate,
+                "markerRate": args.marker_rate, "nChannels": args.channels}
+    modes = [MODE_T2 if mode == "T2" else MODE_T3 for mode in args.mode or ["T2", "T3"]]
+    for mode in modes:
+        for size in args.sizes.split(","):
+            runSize(mode, int(float(size)), int(args.reference), settings)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,186 @@
+# HydraHarp 400  HHLIB v3.0  Lazy decoded view over raw TTTR records.
+#
+# RecordView wraps a block of raw records, e.g. the HH_ReadFiFo buffer or a
+# region of a raw file as written by tttrmode.py, without decoding anything
+# up front. Each column is decoded on first access and then cached, so a
+# quick look at the channels does not pay for the overflow correction of
+# the timetags. Slices are views on the same memory and share the columns
+# already decoded.
+#
+# The columns have one entry per record, including overflow records, with
+# the same values decodeT2/decodeT3 return for them.
+
+import numpy as np
+
+from .decode import (splitRecords, overflowCorrection, T2WRAPAROUND_V2, T2TIMEMASK,
+                     T3WRAPAROUND, T3NSYNCMASK, T3DTIMESHIFT, T3DTIMEMASK,
+                     CHANNELSHIFT, SPECIALSHIFT, OVERFLOWRECORD, MAXMARKER,
+                     MODE_T2, MODE_T3)
+from .events import toT2Events, toT3Events
+
+COLUMNS = ("special", "channel", "photon", "marker", "markers", "timetag", "dtime")
+
+
+# RecordView
+# records: raw records as uint32 array (not copied if it already is one)
+# mode: MODE_T2 or MODE_T3
+# oflcorrection: overflow correction valid before the first record
+class RecordView:
+    __slots__ = ("records", "mode", "_oflcorrection", "_parent", "_start", "_cache")
+
+    def __init__(self, records, mode, oflcorrection=0):
+        if mode not in (MODE_T2, MODE_T3):
+            raise ValueError("RecordView supports only MODE_T2 and MODE_T3, not %r" % mode)
+        self.records = np.asarray(records, dtype=np.uint32)
+        self.mode = mode
+        self._oflcorrection = oflcorrection
+        self._parent = None # view this one was sliced from, see oflcorrection
+        self._start = 0
+        self._cache = {}
+
+    # fromFile
+    # Maps a region of a raw record file (e.g. tttrmode.out) into memory.
+    # Nothing is read from the file before a column is accessed.
+    # offset: number of records to skip at the start of the file
+    # count: number of records in the view, None for all up to the end
+    @classmethod
+    def fromFile(cls, filename, mode, offset=0, count=None, oflcorrection=0):
+        records = np.memmap(filename, dtype="<u4", mode="r", offset=4 * offset,
+                            shape=None if count is None else (count,))
+        return cls(records, mode, oflcorrection)
+
+    def __len__(self):
+        return len(self.records)
+
+    # Slicing returns a view on the same records, only contiguous slices are
+    # supported since the overflow correction runs along the records.
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError("RecordView supports only slicing, not %r" % type(index))
+        start, stop, step = index.indices(len(self.records))
+        if step != 1:
+            raise ValueError("RecordView supports only contiguous slices")
+        stop = max(start, stop)
+        view = RecordView(self.records[start:stop], self.mode)
+        view._parent, view._start = self, start
+        for name, column in self._cache.items():
+            view._cache[name] = column[start:stop]
+        return view
+
+    # oflcorrection
+    # Overflow correction valid before the first record. For a slice it is
+    # taken from the view it was sliced from when first needed.
+    @property
+    def oflcorrection(self):
+        if self._parent is not None:
+            parent, start = self._parent, self._start
+            if start > 0:
+                self._oflcorrection = parent.oflcorrectionAt(start)
+            else:
+                self._oflcorrection = parent.oflcorrection
+            self._parent = None
+        return self._oflcorrection
+
+    # oflcorrectionAt
+    # Overflow correction after the first index records, from the cached
+    # timetags if available, otherwise from the overflow records alone.
+    def oflcorrectionAt(self, index):
+        if index == 0:
+            return self.oflcorrection
+        if "timetag" in self._cache:
+            return self._ofl(index)
+        records = self.records[:index]
+        overflow = (records >> CHANNELSHIFT) == OVERFLOWRECORD
+        counts = records[overflow] & (T2TIMEMASK if self.mode == MODE_T2 else T3NSYNCMASK)
+        wraparound = T2WRAPAROUND_V2 if self.mode == MODE_T2 else T3WRAPAROUND
+        return self.oflcorrection + int(counts.astype(np.int64).sum()) * wraparound
+
+    # endOflcorrection
+    # Overflow correction after the last record, to continue decoding with
+    # TTTRDecoder or another view on the following records.
+    @property
+    def endOflcorrection(self):
+        return self.oflcorrectionAt(len(self.records))
+
+    def _ofl(self, index):
+        # Correction after record index - 1 taken from the decoded timetag
+        # column, only called with index > 0 and the timetags cached
+        self._column("timetag")
+        return self._cache["_ofl"][index - 1].item()
+
+    def _column(self, name):
+        column = self._cache.get(name)
+        if column is None:
+            column = getattr(self, "_decode_" + name)()
+            self._cache[name] = column
+        return column
+
+    def _decode_special(self):
+        return (self.records >> SPECIALSHIFT).astype(bool)
+
+    def _decode_channel(self):
+        channel = splitRecords(self.records)[2]
+        channel[~self._column("special")] += 1 # We encode the regular channels as 1..N
+        return channel
+
+    def _decode_photon(self):
+        special = self._column("special")
+        if self.mode == MODE_T2:
+            return ~special | (self._column("channel") == 0) # Sync counts as photon
+        return ~special
+
+    def _decode_marker(self):
+        channel = self._column("channel")
+        return self._column("special") & (channel >= 1) & (channel <= MAXMARKER)
+
+    def _decode_markers(self):
+        return np.where(self._column("marker"), self._column("channel"), 0).astype(np.uint8)
+
+    def _decode_timetag(self):
+        if self.mode == MODE_T2:
+            timetag = (self.records & T2TIMEMASK).astype(np.int64)
+            wraparound = T2WRAPAROUND_V2
+        else:
+            timetag = (self.records & T3NSYNCMASK).astype(np.int64)
+            wraparound = T3WRAPAROUND
+        overflow = (self.records >> CHANNELSHIFT) == OVERFLOWRECORD
+        ofl = overflowCorrection(overflow, timetag, wraparound, self.oflcorrection)[0]
+        self._cache["_ofl"] = ofl
+        # Same arithmetic as decodeT2/decodeT3, including the marker scaling
+        timetag[self._column("marker")] *= wraparound
+        timetag += ofl
+        return timetag
+
+    def _decode_dtime(self):
+        if self.mode != MODE_T3:
+            raise AttributeError("T2 records have no dtime")
+        return ((self.records >> T3DTIMESHIFT) & T3DTIMEMASK).astype(np.uint16)
+
+    # Columns, decoded on first access
+    # special: special record flags
+    # channel: 0 = Sync (T2), 1..N = regular input channel, marker bitfield
+    #          for markers, 0x3F for overflows
+    # photon, marker: masks as returned by decodeT2/decodeT3
+    # markers: marker bitfield of marker records, 0 for all other records
+    # timetag: overflow-corrected T2 timetag or T3 nsync
+    # dtime: T3 only, arrival time after the last sync
+    special = property(lambda self: self._column("special"))
+    channel = property(lambda self: self._column("channel"))
+    photon = property(lambda self: self._column("photon"))
+    marker = property(lambda self: self._column("marker"))
+    markers = property(lambda self: self._column("markers"))
+    timetag = property(lambda self: self._column("timetag"))
+    nsync = timetag
+    dtime = property(lambda self: self._column("dtime"))
+
+    # decoded
+    # Returns the names of the columns decoded so far.
+    def decoded(self):
+        return [name for name in COLUMNS if name in self._cache]
+
+    # events
+    # Returns the photons and markers of the view as T2EVENT or T3EVENT array.
+    def events(self):
+        if self.mode == MODE_T2:
+            return toT2Events(self.channel, self.timetag, self.photon, self.marker)
+        return toT3Events(self.timetag, self.dtime, self.channel, self.photon, self.marker)
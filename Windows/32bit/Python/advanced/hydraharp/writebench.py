@@ -0,0 +1,94 @@
+# HydraHarp 400  HHLIB v3.0  Raw record write benchmark.
+#
+# Measures the sustained throughput of writing full FiFo chunks to a raw
+# file the way tttrmode.py does, before and after switching to zero-copy
+# writes. Once to the null device, which shows the CPU cost of each way
+# alone, and once to a real file.
+# Then writes a longer run through a buffered file and a MappedWriter and
+# compares their bandwidth and the time the individual writes take.
+#
+# Usage: python -m hydraharp.writebench [directory [megarecords]]
+
+import ctypes as ct
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+from .decode import TTREADMAX
+from .synth import syntheticRecords, MODE_T2
+from .writers import MappedWriter
+
+
+# copyWrite
+# The former tttrmode.py write: slicing the ctypes buffer gives a python
+# list which is converted back into a new ctypes array.
+def copyWrite(outputfile, buffer, nRecords):
+    outputfile.write((ct.c_uint * nRecords)(*buffer[0:nRecords]))
+
+# viewWrite
+# The zero-copy write: a memoryview slice of the ctypes buffer.
+def viewWrite(outputfile, buffer, nRecords):
+    outputfile.write(memoryview(buffer)[0:nRecords])
+
+# timeWrites
+# Writes nChunks full chunks from buffer with write and returns records/s.
+def timeWrites(filename, write, buffer, nChunks):
+    outputfile = open(filename, "wb+")
+    start = time.perf_counter()
+    for i in range(nChunks):
+        write(outputfile, buffer, TTREADMAX)
+    outputfile.flush()
+    if filename != os.devnull:
+        os.fsync(outputfile.fileno())
+    elapsed = time.perf_counter() - start
+    outputfile.close()
+    return nChunks * TTREADMAX / elapsed
+
+# timeLatencies
+# Writes nChunks full chunks to outputfile, closes it and returns records/s
+# including the close and the time each write took.
+def timeLatencies(outputfile, buffer, nChunks):
+    latencies = np.empty(nChunks)
+    start = time.perf_counter()
+    for i in range(nChunks):
+        t = time.perf_counter()
+        outputfile.write(memoryview(buffer)[0:TTREADMAX])
+        latencies[i] = time.perf_counter() - t
+    outputfile.close()
+    return nChunks * TTREADMAX / (time.perf_counter() - start), latencies
+
+def main(argv):
+    directory = argv[1] if len(argv) > 1 else tempfile.gettempdir()
+    nLong = max(1, int(float(argv[2]) * 1e6 / TTREADMAX)) if len(argv) > 2 else 2048
+    nChunks = min(nLong, 80)
+    buffer = (ct.c_uint * TTREADMAX)()
+    ct.memmove(buffer, syntheticRecords(MODE_T2, TTREADMAX).tobytes(), 4 * TTREADMAX)
+
+    filename = os.path.join(directory, "writebench.out")
+    print("%d chunks of %d records, %.0f MB per run" % (nChunks, TTREADMAX,
+                                                        4.0 * nChunks * TTREADMAX / 1e6))
+    for target, name in [(os.devnull, "null device"), (filename, "file")]:
+        for label, write in [("list + ctypes copy", copyWrite), ("memoryview", viewWrite)]:
+            rate = timeWrites(target, write, buffer, nChunks)
+            print("%-12s %-20s : %12.0f records/s, %8.1f MB/s"
+                  % (name, label, rate, 4 * rate / 1e6))
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    print("\n%d chunks, %.0f MB per run, time per write of %.0f kB"
+          % (nLong, 4.0 * nLong * TTREADMAX / 1e6, 4.0 * TTREADMAX / 1e3))
+    for label, create in [("buffered file", lambda: open(filename, "wb+")),
+                          ("MappedWriter", lambda: MappedWriter(filename))]:
+        rate, latencies = timeLatencies(create(), buffer, nLong)
+        if os.path.getsize(filename) != 4 * nLong * TTREADMAX:
+            print("Error: %s wrote %d bytes" % (label, os.path.getsize(filename)))
+        os.remove(filename)
+        p50, p99, p999 = np.percentile(latencies, [50, 99, 99.9]) * 1000
+        print("%-14s : %8.1f MB/s, %6.2f ms median, %6.2f ms 99%%, %6.2f ms 99.9%%, "
+              "%7.2f ms max" % (label, 4 * rate / 1e6, p50, p99, p999, 1000 * latencies.max()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,107 @@
+# Demo for access to HydraHarp 400 Hardware via HHLIB.DLL v 3.0.
+#
+# The program performs a TTTR measurement based on hard coded settings like
+# the threaded demo, but from an asyncio event loop, as it would run
+# inside an asyncio based control software. The library calls run in an
+# executor and the FiFo is read and decoded in threads of their own, so
+# the event loop stays free for other tasks. Here such a task prints the
+# progress while the measurement task counts the events per channel.
+#
+# Tested with HHLib v.3.0.0.4 and Python 3.11.3
+#
+# Note: This is a console application (i.e. run in Windows cmd box).
+#
+# Note: With simulate = True the demo runs on synthetic data without a
+#       device, e.g. to try the API on any machine.
+
+import asyncio
+import sys
+import os
+import numpy as np
+
+# The hydraharp helper package resides next to this demo folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from hydraharp.aio import AsyncHydraHarp
+from hydraharp.decode import MODE_T2, MODE_T3
+from hydraharp.events import selectPhotons
+from hydraharp.device import HydraHarp, HHError, MAXDEVNUM, libraryVersion, LIB_VERSION
+from hydraharp.synth import SimulatedHydraHarp
+
+# Measurement parameters, these are hardcoded since this is just a demo
+mode     = MODE_T2 # you can also set _T3 but observe suitable Sync divider and Range
+tacq     = 1000 # Measurement time in millisec, you can change this
+simulate = False # True runs on synthetic data without a device
+settings = {
+    "binning": 0,                # You can change this, meaningful only in T3 mode
+    "offset": 0,                 # You can change this, meaningful only in T3 mode
+    "syncDivider": 1,            # You can change this, observe mode! READ MANUAL!
+    "syncCFDZeroCross": 10,      # You can change this (in mV)
+    "syncCFDLevel": 50,          # You can change this (in mV)
+    "syncChannelOffset": 0,      # You can change this (in ps, like a cable delay)
+    "inputCFDZeroCross": 10,     # You can change this (in mV)
+    "inputCFDLevel": 50,         # You can change this (in mV)
+    "inputChannelOffset": 5000,  # You can change this (in ps, like a cable delay)
+}
+
+# In this demo we use the first HydraHarp device we find.
+async def openFirstDevice():
+    for i in range(0, MAXDEVNUM):
+        hh = AsyncHydraHarp(HydraHarp(i))
+        try:
+            print("  %1d        S/N %s" % (i, await hh.open()))
+            return hh
+        except HHError as exc:
+            print("  %1d        %s" % (i, "no device" if exc.retcode == -1 else exc))
+            await hh.close()
+    return None
+
+# Stands in for the other work of an application, prints the progress
+async def showProgress(counts, done):
+    while not done.is_set():
+        sys.stdout.write("\rProgress:%9u events" % counts.sum())
+        sys.stdout.flush()
+        await asyncio.sleep(0.1)
+
+async def main():
+    if simulate:
+        hh = AsyncHydraHarp(SimulatedHydraHarp(mode, photonRate=1e6))
+    else:
+        print("Library version is %s" % libraryVersion())
+        if libraryVersion() != LIB_VERSION:
+            print("Warning: The application was built for version %s" % LIB_VERSION)
+        print("\nSearching for HydraHarp devices...")
+        print("Devidx     Status")
+        hh = await openFirstDevice()
+        if hh is None:
+            print("No device available.")
+            return
+
+    async with hh:
+        try:
+            print("\nInitializing the device...")
+            await hh.setup(mode, settings)
+            print("Resolution is %1.1lfps" % await hh.getResolution())
+            print("\nSyncrate=%1d/s" % await hh.getSyncRate())
+            for i, countRate in enumerate(await hh.getCountRates()):
+                print("Countrate[%1d]=%1d/s" % (i, countRate))
+
+            print("\nStarting data collection...\n")
+            counts = np.zeros(64, dtype=np.int64)
+            done = asyncio.Event()
+            progress = asyncio.ensure_future(showProgress(counts, done))
+            async with hh.chunks(tacq) as chunks:
+                async for events in chunks:
+                    photons = selectPhotons(events)
+                    counts += np.bincount(photons["channel"], minlength=64)
+            done.set()
+            await progress
+
+            if chunks.overrun:
+                print("\nFiFo Overrun!")
+            print("\nDone\n")
+            for i in np.flatnonzero(counts):
+                print("Counts[%1d]=%1d" % (i, counts[i]))
+        except HHError as exc:
+            print("%s. Aborted." % exc)
+
+asyncio.run(main())
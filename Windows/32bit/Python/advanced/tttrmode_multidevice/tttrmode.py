@@ -0,0 +1,155 @@
+# Demo for access to HydraHarp 400 Hardware via HHLIB.DLL v 3.0.
+#
+# The program performs a TTTR measurement based on hard coded settings like
+# the threaded demo, but with several devices at once. The devices are
+# chosen by their serial numbers and set up concurrently. Each device has
+# its own FiFo reader thread and its own decoding and counting threads,
+# and its raw records go into segment files of its own, named after its
+# serial number. With merge = True the events of all devices are also merged
+# into one time ordered stream of MERGEDEVENTs, written to
+# tttrmode_merged.out. The devices are assumed to be started together, set
+# offsets and ppm per device if their times need to be aligned further.
+#
+# Tested with HHLib v.3.0.0.4 and Python 3.11.3
+#
+# Note: This is a console application (i.e. run in Windows cmd box).
+#
+# Note: With simulate = True the demo runs on synthetic data of
+#       nSimulated devices, e.g. to try the engine on any machine.
+
+import sys
+import os
+import time
+import numpy as np
+
+# The hydraharp helper package resides next to this demo folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from hydraharp.decode import TTTRDecoder, MODE_T2, MODE_T3
+from hydraharp.device import HHError, libraryVersion, LIB_VERSION
+from hydraharp.events import selectPhotons
+from hydraharp.merge import EventMerger
+from hydraharp.multi import MultiDeviceEngine, openDevices
+from hydraharp.segments import SegmentedWriter
+from hydraharp.synth import SimulatedHydraHarp
+from hydraharp.timebase import TimeBase
+
+# Measurement parameters, these are hardcoded since this is just a demo
+serials        = [] # Serial numbers of the devices to use, empty for all found
+mode           = MODE_T2 # you can also set _T3 but observe suitable Sync divider and Range
+tacq           = 1000 # Measurement time in millisec, you can change this
+segmentSeconds = 600 # Raw records go into a new segment file after this time
+merge          = True # Merge the events of all devices into tttrmode_merged.out
+offsets        = None # Per device time offset in ps for the merge, None for all 0
+ppm            = None # Per device clock rate correction for the merge, None for all 0
+simulate       = False # True runs on synthetic data without a device
+nSimulated     = 2 # Number of devices to simulate
+settings = {
+    "binning": 0,                # You can change this, meaningful only in T3 mode
+    "offset": 0,                 # You can change this, meaningful only in T3 mode
+    "syncDivider": 1,            # You can change this, observe mode! READ MANUAL!
+    "syncCFDZeroCross": 10,      # You can change this (in mV)
+    "syncCFDLevel": 50,          # You can change this (in mV)
+    "syncChannelOffset": 0,      # You can change this (in ps, like a cable delay)
+    "inputCFDZeroCross": 10,     # You can change this (in mV)
+    "inputCFDLevel": 50,         # You can change this (in mV)
+    "inputChannelOffset": 5000,  # You can change this (in ps, like a cable delay)
+}
+
+if simulate:
+    devices = [SimulatedHydraHarp(mode, serial="SIM%05d" % (i + 1), seed=i, photonRate=1e6)
+               for i in range(nSimulated)]
+else:
+    print("Library version is %s" % libraryVersion())
+    if libraryVersion() != LIB_VERSION:
+        print("Warning: The application was built for version %s" % LIB_VERSION)
+    print("\nSearching for HydraHarp devices...")
+    try:
+        devices = openDevices(serials or None)
+    except ValueError as exc:
+        print("%s." % exc)
+        sys.exit(0)
+    if not devices:
+        print("No device available.")
+        sys.exit(0)
+print("Using HydraHarp %s" % ", ".join(device.serial for device in devices))
+
+engine = MultiDeviceEngine(devices)
+try:
+    print("\nInitializing the devices...")
+    engine.setup(mode, settings)
+    resolutions = engine.each(lambda device: device.getResolution())
+    syncRates = engine.each(lambda device: device.getSyncRate())
+    for device, resolution, syncRate in zip(devices, resolutions, syncRates):
+        print("%s: Resolution is %1.1lfps, Syncrate=%1d/s"
+              % (device.serial, resolution, syncRate))
+
+    timeBases = [TimeBase.fromDevice(mode, resolution, 1.0 / syncRate)
+                 for resolution, syncRate in zip(resolutions, syncRates)]
+
+    # Per device: raw segments, decoder and counts
+    writers = {}
+    counts = {}
+    def storeAndDecode(device):
+        i = devices.index(device)
+        writer = SegmentedWriter("tttrmode_%s" % device.serial, mode, timeBases[i],
+                                 maxSeconds=segmentSeconds,
+                                 info={"serial": device.serial, "settings": settings,
+                                       "tacq": tacq})
+        writers[device.serial] = writer
+        decoder = TTTRDecoder(mode)
+
+        # The records are stored before they are decoded, since the buffer
+        # they are in goes back to the reader afterwards
+        def store(records):
+            writer.write(records)
+            return decoder.feed(records)
+        return store
+
+    def counter(device):
+        deviceCounts = counts[device.serial] = np.zeros(64, dtype=np.int64)
+        def count(events):
+            photons = selectPhotons(events)
+            deviceCounts[:] += np.bincount(photons["channel"], minlength=64)
+            return events
+        return count
+
+    engine.addStage("decode", storeAndDecode)
+    engine.addStage("count", counter)
+
+    if merge:
+        # The merger calls write in time order, from the merge stage of
+        # whichever device completed the events
+        mergedFile = open("tttrmode_merged.out", "wb")
+        merger = EventMerger(timeBases, offsets, ppm, onEvents=mergedFile.write)
+        def mergeStage(device):
+            i = devices.index(device)
+            return lambda events: merger.feed(i, events)
+        engine.addStage("merge", mergeStage)
+
+    print("\nStarting data collection...\n")
+    engine.start(tacq)
+    while engine.running():
+        sys.stdout.write("\rProgress:" + "  ".join("%s %9u" % (e.device.serial, e.nRecords)
+                                                    for e in engine.engines))
+        sys.stdout.flush()
+        time.sleep(0.1)
+    engine.wait()
+    if merge:
+        for i in range(len(devices)):
+            merger.finish(i)
+        mergedFile.close()
+        print("\nMerged %d events into tttrmode_merged.out" % merger.nOut)
+
+    for device in engine.overrun:
+        print("\n%s: FiFo Overrun!" % device.serial)
+    print("\nDone\n")
+    print(engine.report())
+    for device in devices:
+        writers[device.serial].close()
+        print("\n%s:" % device.serial)
+        for i in np.flatnonzero(counts[device.serial]):
+            print("Counts[%1d]=%1d" % (i, counts[device.serial][i]))
+except HHError as exc:
+    print("%s. Aborted." % exc)
+finally:
+    engine.close()
@@ -0,0 +1,162 @@
+# Demo for access to HydraHarp 400 Hardware via HHLIB.DLL v 3.0.
+#
+# The program performs a TTTR measurement based on hard coded settings like
+# the instant processing demo, but reads the FiFo in a thread of its own.
+# The chunks read are passed through a bounded queue to a decoding thread
+# and from there to a thread writing the events as text, so that stalls in
+# decoding or writing do not hold up the FiFo reads. The decoding thread
+# also stores the raw records in segment files of limited duration, which
+# can be analysed while the measurement goes on, e.g. with
+# python -m hydraharp.segments tttrmodeout
+# With recover = True a FiFo overrun does not end the measurement: it is
+# restarted at once with the same settings, the gap is marked in the text
+# output and in the sidecar of the next segment, and the times after it
+# continue from the restart.
+#
+# Tested with HHLib v.3.0.0.4 and Python 3.11.3
+#
+# Note: This is a console application (i.e. run in Windows cmd box).
+#
+# Note: With simulate = True the demo runs on synthetic data without a
+#       device, e.g. to try the engine on any machine.
+
+import sys
+import os
+import time
+
+# The hydraharp helper package resides next to this demo folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from hydraharp.decode import TTTRDecoder, MODE_T2, MODE_T3
+from hydraharp.device import HydraHarp, HHError, MAXDEVNUM, libraryVersion, LIB_VERSION
+from hydraharp.engine import AcquisitionEngine
+from hydraharp.segments import SegmentedWriter
+from hydraharp.sinks import TextWriter
+from hydraharp.synth import SimulatedHydraHarp
+from hydraharp.timebase import TimeBase
+
+# Measurement parameters, these are hardcoded since this is just a demo
+mode           = MODE_T2 # you can also set _T3 but observe suitable Sync divider and Range
+tacq           = 1000 # Measurement time in millisec, you can change this
+queueSize      = 64 # FiFo chunks each queue holds before the producer has to wait
+spill          = True # True puts chunks beyond the first queue into a spill file meanwhile
+recover        = True # True restarts the measurement after a FiFo overrun
+segmentSeconds = 600 # Raw records go into a new segment file after this time
+simulate       = False # True runs on synthetic data without a device
+settings = {
+    "binning": 0,                # You can change this, meaningful only in T3 mode
+    "offset": 0,                 # You can change this, meaningful only in T3 mode
+    "syncDivider": 1,            # You can change this, observe mode! READ MANUAL!
+    "syncCFDZeroCross": 10,      # You can change this (in mV)
+    "syncCFDLevel": 50,          # You can change this (in mV)
+    "syncChannelOffset": 0,      # You can change this (in ps, like a cable delay)
+    "inputCFDZeroCross": 10,     # You can change this (in mV)
+    "inputCFDLevel": 50,         # You can change this (in mV)
+    "inputChannelOffset": 5000,  # You can change this (in ps, like a cable delay)
+}
+
+# In this demo we use the first HydraHarp device we find.
+def openFirstDevice():
+    for i in range(0, MAXDEVNUM):
+        device = HydraHarp(i)
+        try:
+            print("  %1d        S/N %s" % (i, device.open()))
+            return device
+        except HHError as exc:
+            print("  %1d        %s" % (i, "no device" if exc.retcode == -1 else exc))
+    return None
+
+if simulate:
+    device = SimulatedHydraHarp(mode, photonRate=1e6)
+else:
+    print("Library version is %s" % libraryVersion())
+    if libraryVersion() != LIB_VERSION:
+        print("Warning: The application was built for version %s" % LIB_VERSION)
+    print("\nSearching for HydraHarp devices...")
+    print("Devidx     Status")
+    device = openFirstDevice()
+    if device is None:
+        print("No device available.")
+        sys.exit(0)
+
+segments = None
+try:
+    print("\nInitializing the device...")
+    device.setup(mode, settings)
+    print("Found Model %s Part no %s Version %s" % device.hardwareInfo())
+    resolution = device.getResolution()
+    print("Resolution is %1.1lfps" % resolution)
+    print("\nSyncrate=%1d/s" % device.getSyncRate())
+    for i in range(0, device.numChannels):
+        print("Countrate[%1d]=%1d/s" % (i, device.getCountRate(i)))
+
+    outputfile = open("tttrmodeout.txt", "w+")
+    if mode == MODE_T2:
+        outputfile.write("ev chn time/ps\n\n")
+        syncPeriod = 0.0
+    else:
+        outputfile.write("ev chn   ttag/s   dtime/ps\n\n")
+        # The measurement starts in the reader thread, so we take the sync
+        # period from the sync rate instead of HH_GetSyncPeriod
+        syncPeriod = 1.0 / device.getSyncRate()
+    timeBase = TimeBase.fromDevice(mode, resolution, syncPeriod)
+
+    # The sidecar of each segment holds what is needed to decode it on its
+    # own, the settings are added for reference
+    segments = SegmentedWriter("tttrmodeout", mode, timeBase, maxSeconds=segmentSeconds,
+                               info={"settings": settings, "tacq": tacq})
+    decoder = TTTRDecoder(mode)
+
+    # The records are stored before they are decoded, since the buffer they
+    # are in goes back to the reader afterwards
+    def storeAndDecode(records):
+        segments.write(records)
+        return decoder.feed(records)
+
+    # After an overrun the records of the restarted measurement count their
+    # time from the restart
+    def onGap(gap):
+        segments.gap(gap)
+        gap.resume(decoder, timeBase)
+
+    # Reader thread -> decode thread -> write thread
+    engine = AcquisitionEngine(device, queueSize, spill=spill, recover=recover)
+    engine.addStage("decode", storeAndDecode, onGap=onGap)
+    writer = TextWriter(outputfile, mode, resolution, syncPeriod)
+    engine.addStage("write", writer.gotEvents, onGap=writer.gotGap)
+
+    # Called in the reader thread when the FiFo is predicted to overrun. An
+    # application could shed load here, e.g. by setting the skip flag of a
+    # stage that only does analysis.
+    def onWarning(monitor):
+        print("\nWarning: about %d records waiting in the FiFo, overrun in %.1f s"
+              % (monitor.backlog, monitor.timeToOverrun()))
+    engine.monitor.onWarning = onWarning
+
+    print("\nStarting data collection...\n")
+    engine.start(tacq)
+    while engine.running():
+        reader, decode, write = engine.stats()
+        sys.stdout.write("\rProgress:%9u  buffers in use %3d  queued %3d/%3d chunks"
+                         % (reader["records"], reader["queue"], decode["queue"],
+                            write["queue"]))
+        sys.stdout.flush()
+        time.sleep(0.1)
+    engine.wait()
+
+    if engine.overrun:
+        print("\nFiFo Overrun!")
+    for gap in engine.gaps:
+        print("\nFiFo overrun, measurement restarted after %.2f ms, no data for %.3f s"
+              % (1000 * gap.latency, gap.duration))
+    print("\nDone\n")
+    print(engine.report())
+    outputfile.close()
+    print("Raw records in %d segment files tttrmodeout_*.out" % segments.nSegments)
+except HHError as exc:
+    print("%s. Aborted." % exc)
+finally:
+    # Marks the last segment also after an error, so that the segments
+    # of the run can be told complete
+    if segments is not None:
+        segments.close()
+    device.close()
@@ -0,0 +1,80 @@
+# HydraHarp 400  HHLIB v3.0  Pool of FiFo read buffers.
+#
+# The demos read every chunk into one global buffer, so the next
+# HH_ReadFiFo has to wait until the previous chunk has been consumed. A
+# BufferPool preallocates a fixed number of buffers up front which the
+# reader acquires, fills and hands on, and the consumer releases when it is
+# done with them. Nothing is allocated while the acquisition runs.
+#
+# The free buffers are kept last in first out, so the reader gets the one
+# released most recently, which is the most likely to still be cached.
+
+import ctypes as ct
+import queue
+import threading
+import numpy as np
+
+from .decode import TTREADMAX
+
+
+# BufferPool
+# nBuffers: number of buffers, this bounds the chunks in flight
+# size: records per buffer
+class BufferPool:
+    def __init__(self, nBuffers, size=TTREADMAX):
+        if nBuffers < 1:
+            raise ValueError("BufferPool needs at least one buffer")
+        self.size = size
+        self.buffers = [(ct.c_uint * size)() for i in range(nBuffers)]
+        self.arrays = [np.frombuffer(b, dtype=np.uint32) for b in self.buffers]
+        self.index = dict((a.ctypes.data, i) for i, a in enumerate(self.arrays))
+        self.free = queue.LifoQueue()
+        for i in range(nBuffers):
+            self.free.put(i)
+        self.lock = threading.Lock()
+        self.inFlight = 0
+        self.highWater = 0
+        self.nAcquired = 0
+        self.nWaits = 0 # acquire calls that found no free buffer
+
+    def __len__(self):
+        return len(self.buffers)
+
+    # acquire
+    # Returns the index of a free buffer, waiting at most timeout s for one
+    # (None waits for ever). Returns None if none became free in time.
+    def acquire(self, timeout=None):
+        try:
+            i = self.free.get_nowait()
+        except queue.Empty:
+            self.nWaits += 1
+            try:
+                i = self.free.get(timeout=timeout)
+            except queue.Empty:
+                return None
+        with self.lock:
+            self.inFlight += 1
+            self.highWater = max(self.highWater, self.inFlight)
+            self.nAcquired += 1
+        return i
+
+    # buffer
+    # The ctypes array of buffer i, to pass to HH_ReadFiFo.
+    def buffer(self, i):
+        return self.buffers[i]
+
+    # records
+    # The first nRecords records of buffer i as uint32 array. This is a view,
+    # it is overwritten once the buffer has been released and reused.
+    def records(self, i, nRecords):
+        return self.arrays[i][:nRecords]
+
+    # release
+    # Returns a buffer to the pool, given either by its index or by an array
+    # returned by records().
+    def release(self, item):
+        if not isinstance(item, int):
+            item = self.index[item.ctypes.data]
+        with self.lock:
+            self.inFlight -= 1
+        self.free.put(item)
@@ -0,0 +1,144 @@
+# HydraHarp 400  HHLIB v3.0  Waiting for the end of a measurement.
+#
+# The histogramming demos wait for the CTC by calling HH_CTCStatus over and
+# over for the whole acquisition time. But the CTC of a measurement cannot
+# expire before tacq has passed since its start. CompletionWaiter therefore
+# sleeps through most of the acquisition time at once and only polls the
+# CTC status from leadTime before the expected end on, every pollInterval,
+# which bounds how late the end is noticed. A measurement so costs a few
+# driver calls and no CPU time, whatever tacq is. The waiter can block, call
+# back from a thread of its own or be awaited:
+#
+#   waiter = CompletionWaiter(device, tacq)
+#   device.startMeas(tacq)
+#   waiter.wait()                      # or
+#   waiter.then(lambda waiter: ...)    # or, in a coroutine,
+#   await waiter
+#
+# Where the end is not known in advance (tacq None, e.g. a measurement
+# stopped by C2) the waiter polls with a wait that starts at pollInterval
+# and doubles up to MAXINTERVAL, as the demos do.
+#
+# python -m hydraharp.waitbench compares the ways of waiting.
+
+import asyncio
+import threading
+import time
+
+LEADTIME     = 0.05  # s before the expected end the polling starts
+POLLINTERVAL = 0.002 # s between polls near the end
+MAXINTERVAL  = 0.01  # s longest wait between polls when the end is not known
+
+
+# CompletionWaiter
+# device: HydraHarp (or SimulatedHydraHarp) the measurement runs on
+# tacq: acquisition time in ms, None if the end is not known in advance
+# started: time.perf_counter() at which the measurement started at the
+#          earliest, default now. Create the waiter before startMeas, or
+#          right after it: leadTime covers the duration of the call.
+#          For a start by C1, the time of the last poll that had not seen
+#          the start yet.
+# leadTime: s before the expected end the polling starts, should cover how
+#           much longer than asked a sleep can take on the system
+# pollInterval: s between polls near the end
+class CompletionWaiter:
+    def __init__(self, device, tacq, started=None, leadTime=LEADTIME,
+                 pollInterval=POLLINTERVAL):
+        self.device = device
+        self.tacq = tacq
+        self.started = time.perf_counter() if started is None else started
+        self.leadTime = leadTime
+        self.pollInterval = pollInterval
+        self.interval = pollInterval # current wait while the end is not known
+        self.done = False
+        self.ended = None # time.perf_counter() at which the end was seen
+        self.nPolls = 0
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+
+    # expected
+    # time.perf_counter() before which the measurement cannot end, None if
+    # not known.
+    @property
+    def expected(self):
+        if self.tacq is None:
+            return None
+        return self.started + self.tacq / 1000.0
+
+    # late
+    # s between the expected end and when the waiter saw it.
+    @property
+    def late(self):
+        if self.ended is None or self.expected is None:
+            return None
+        return self.ended - self.expected
+
+    # delay
+    # Returns the time in s to wait before the next poll.
+    def delay(self):
+        if self.expected is None:
+            delay, self.interval = self.interval, min(2 * self.interval, MAXINTERVAL)
+            return delay
+        return max(self.expected - self.leadTime - time.perf_counter(), self.pollInterval)
+
+    # poll
+    # Polls the CTC status once, returns True once the measurement ended.
+    def poll(self):
+        with self.lock:
+            if not self.done:
+                self.nPolls += 1
+                if self.device.ctcStatus():
+                    self.done = True
+                    self.ended = time.perf_counter()
+            return self.done
+
+    # cancel
+    # Makes wait return False and drops a pending callback, e.g. when the
+    # measurement is stopped early.
+    def cancel(self):
+        self.cancelled.set()
+
+    # wait
+    # Blocks until the measurement ended, returns True then. Returns False
+    # once timeout s have passed first (None for no limit) or on cancel.
+    def wait(self, timeout=None):
+        limit = None if timeout is None else time.perf_counter() + timeout
+        while not self.done:
+            delay = self.delay()
+            if limit is not None:
+                delay = min(delay, limit - time.perf_counter())
+                if delay < 0:
+                    return False
+            if self.cancelled.wait(delay):
+                return False
+            self.poll()
+        return True
+
+    # then
+    # Waits in a daemon thread of its own and calls callback(waiter) from
+    # it once the measurement ended (not on cancel). Returns the thread.
+    def then(self, callback):
+        def notify():
+            if self.wait():
+                callback(self)
+        thread = threading.Thread(target=notify, name="CompletionWaiter", daemon=True)
+        thread.start()
+        return thread
+
+    # waitAsync
+    # Coroutine returning once the measurement ended, also await waiter.
+    # call: coroutine function running a device call outside the event loop,
+    #       e.g. AsyncHydraHarp.call, default the loop's default executor
+    async def waitAsync(self, call=None):
+        if call is None:
+            loop = asyncio.get_running_loop()
+            call = lambda func: loop.run_in_executor(None, func)
+        while not self.done:
+            await asyncio.sleep(self.delay())
+            if self.cancelled.is_set():
+                return False
+            await call(self.poll)
+        return True
+
+    def __await__(self):
+        return self.waitAsync().__await__()
@@ -0,0 +1,428 @@
+# HydraHarp 400  HHLIB v3.0  Compressed raw record files.
+#
+# Raw T2/T3 records compress well once the timetags are delta encoded:
+# within a chunk the times grow monotonically and only a few channels
+# occur. encodeChunk splits each record into its top byte (special flag
+# and channel) and its time field, replaces the time (T2 timetag, T3
+# nsync) by the difference to the previous event record and stores the
+# fields as separate byte planes, which zlib and lzma then pack tightly.
+#
+# A compressed file is a short file header followed by one frame per
+# chunk. Every frame header holds the codec, the record counts and the
+# overflow correction at the start of the frame, so each frame can be
+# decoded on its own. An index of the frames is appended on close, a file
+# cut short by a crash is read by walking the frame headers instead.
+#
+# BackgroundCompressor compresses in a pool of threads (zlib and lzma
+# release the GIL while they work) and writes the frames in order in a
+# thread of its own. Its put() only copies the chunk: if compression falls
+# behind, chunks are stored uncompressed until it has caught up, so it can
+# be an AcquisitionEngine stage without holding up the FiFo reader. Only if
+# the disk cannot keep up either does put() wait, once the chunks not yet
+# written hold maxBytes of records, so the memory they use stays bounded.
+# The engine's queue then fills up as with any slow stage.
+
+import concurrent.futures
+import lzma
+import queue
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+
+from .decode import (countRecords, CHANNELSHIFT, OVERFLOWRECORD, T2TIMEMASK,
+                     T3NSYNCMASK, MODE_T2, MODE_T3)
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+
+FIELDMASK   = (1 << CHANNELSHIFT) - 1
+FILEMAGIC   = b"HHZ1"
+FRAMEMAGIC  = b"HHZF"
+INDEXMAGIC  = b"HHZI"
+FILEHEADER  = struct.Struct("<4sB3x") # magic, mode
+# magic, codec, records, payload bytes, crc32, records before, oflcorrection
+FRAMEHEADER = struct.Struct("<4sB3xIIIQq")
+# magic, frames, then per frame records before, file offset, oflcorrection
+INDEXHEADER = struct.Struct("<4sQ")
+TRAILER     = struct.Struct("<4sQ") # magic, file offset of the index
+
+DEFAULTLEVEL = {CODEC_NONE: 0, CODEC_ZLIB: 1, CODEC_LZMA: 0}
+MAXPENDINGBYTES = 256 * 1024 * 1024 # raw bytes BackgroundCompressor queues at most
+
+
+# encodeChunk
+# records: block of raw T2 or T3 records
+# mode: MODE_T2 or MODE_T3
+# Returns the delta encoded byte planes of the block as bytes.
+def encodeChunk(records, mode):
+    records = np.asarray(records, dtype=np.uint32)
+    timeMask = T2TIMEMASK if mode == MODE_T2 else T3NSYNCMASK
+    top = (records >> CHANNELSHIFT).astype(np.uint8)
+    field = records & FIELDMASK
+    # Overflow records keep their count, the other ones get the time
+    # difference to the previous one, modulo the wraparound
+    events = top != OVERFLOWRECORD
+    times = field[events]
+    delta = np.diff(times & timeMask, prepend=np.uint32(0)) & timeMask
+    field[events] = (times & ~np.uint32(timeMask)) | delta
+    planes = field.view(np.uint8).reshape(-1, 4).T
+    return top.tobytes() + planes.tobytes()
+
+# decodeChunk
+# data: bytes as returned by encodeChunk
+# nRecords: number of records encoded
+# Returns the raw records as uint32 array.
+def decodeChunk(data, nRecords, mode):
+    timeMask = T2TIMEMASK if mode == MODE_T2 else T3NSYNCMASK
+    top = np.frombuffer(data, dtype=np.uint8, count=nRecords)
+    planes = np.frombuffer(data, dtype=np.uint8, offset=nRecords).reshape(4, nRecords)
+    field = np.array(planes.T, order="C").view(np.uint32).ravel()
+    events = top != OVERFLOWRECORD
+    deltas = field[events]
+    times = np.cumsum(deltas & timeMask, dtype=np.uint32) & timeMask
+    field[events] = (deltas & ~np.uint32(timeMask)) | times
+    return top.astype(np.uint32) << CHANNELSHIFT | field
+
+# compressChunk
+# Delta encodes and compresses a block of records with the given codec.
+# Returns the payload, its crc32 and what countRecords returns for the
+# block, everything the frame needs, so the work can be done anywhere.
+def compressChunk(records, mode, codec=CODEC_ZLIB, level=None):
+    records = np.asarray(records, dtype=np.uint32)
+    level = DEFAULTLEVEL[codec] if level is None else level
+    if codec == CODEC_NONE:
+        payload = records.tobytes()
+    elif codec == CODEC_ZLIB:
+        payload = zlib.compress(encodeChunk(records, mode), level)
+    elif codec == CODEC_LZMA:
+        payload = lzma.compress(encodeChunk(records, mode), format=lzma.FORMAT_XZ,
+                                check=lzma.CHECK_NONE, preset=level)
+    else:
+        raise ValueError("Unknown codec %r" % codec)
+    return payload, zlib.crc32(payload), countRecords(records, mode)
+
+# decompressChunk
+# Returns the records of a frame's payload as uint32 array.
+def decompressChunk(payload, codec, nRecords, mode):
+    if codec == CODEC_NONE:
+        return np.frombuffer(payload, dtype="<u4", count=nRecords).copy()
+    if codec == CODEC_ZLIB:
+        data = zlib.decompress(payload)
+    elif codec == CODEC_LZMA:
+        data = lzma.decompress(payload, format=lzma.FORMAT_XZ)
+    else:
+        raise ValueError("Unknown codec %r" % codec)
+    return decodeChunk(data, nRecords, mode)
+
+
+# CompressedWriter
+# Writes frames in order into a compressed file.
+# filename: the output file, an existing file is overwritten
+# mode: MODE_T2 or MODE_T3
+# codec, level: used by write(), level None for DEFAULTLEVEL
+class CompressedWriter:
+    def __init__(self, filename, mode, codec=CODEC_ZLIB, level=None):
+        if mode not in (MODE_T2, MODE_T3):
+            raise ValueError("CompressedWriter supports only MODE_T2 and MODE_T3, not %r" % mode)
+        self.mode = mode
+        self.codec = codec
+        self.level = level
+        self.file = open(filename, "wb")
+        self.file.write(FILEHEADER.pack(FILEMAGIC, mode))
+        self.index = [] # records before, file offset and oflcorrection per frame
+        self.recNum = 0
+        self.oflcorrection = 0
+        self.rawBytes = 0
+        self.nBytes = FILEHEADER.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, exc, traceback):
+        self.close()
+
+    # writeFrame
+    # Appends a frame with a payload and counts as compressChunk returns them.
+    def writeFrame(self, codec, nRecords, payload, crc, counts):
+        self.index.append((self.recNum, self.nBytes, self.oflcorrection))
+        self.file.write(FRAMEHEADER.pack(FRAMEMAGIC, codec, nRecords, len(payload), crc,
+                                         self.recNum, self.oflcorrection))
+        self.file.write(payload)
+        self.recNum += nRecords
+        self.oflcorrection += counts[3]
+        self.rawBytes += 4 * nRecords
+        self.nBytes += FRAMEHEADER.size + len(payload)
+
+    # write
+    # Compresses a block of records in the calling thread and appends it.
+    def write(self, records):
+        records = np.asarray(records, dtype=np.uint32)
+        self.writeFrame(self.codec, len(records),
+                        *compressChunk(records, self.mode, self.codec, self.level))
+        return len(records)
+
+    # close
+    # Appends the index and closes the file.
+    def close(self):
+        if self.file.closed:
+            return
+        index = np.array(self.index, dtype=np.int64).reshape(-1, 3)
+        self.file.write(INDEXHEADER.pack(INDEXMAGIC, len(index)))
+        self.file.write(index.tobytes())
+        self.file.write(TRAILER.pack(INDEXMAGIC, self.nBytes))
+        self.file.close()
+
+
+# BackgroundCompressor
+# Compresses blocks of records in worker threads into a compressed file.
+# filename, mode, codec, level: as for CompressedWriter
+# workers: number of compressing threads
+# maxPending: chunks that may wait for compression, beyond that chunks are
+#             stored uncompressed
+# maxBytes: raw bytes of the chunks put and not yet written at most, put
+#           waits until the writer has made room for more
+class BackgroundCompressor:
+    def __init__(self, filename, mode, codec=CODEC_ZLIB, level=None, workers=2,
+                 maxPending=16, maxBytes=MAXPENDINGBYTES):
+        self.writer = CompressedWriter(filename, mode, codec, level)
+        self.maxPending = maxPending
+        self.maxBytes = maxBytes
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers,
+                                                          thread_name_prefix="hh-compress")
+        self.frames = queue.Queue() # futures in file order, None ends the writer
+        self.pending = 0 # chunks put and not yet written
+        self.pendingBytes = 0 # their raw bytes
+        self.lock = threading.Lock()
+        self.written = threading.Condition(self.lock)
+        self.error = None
+        self.nChunks = 0
+        self.nStored = 0 # chunks stored uncompressed since compression fell behind
+        self.maxPendingSeen = 0
+        self.maxBytesSeen = 0
+        self.nWaits = 0 # puts that waited for the writer
+        self.waited = 0.0 # s put waited for the writer
+        self.busy = 0.0 # s the workers spent compressing
+        self.startTime = None
+        self.endTime = None
+        self.thread = threading.Thread(target=self._write, name="hh-compress-writer",
+                                       daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, exc, traceback):
+        self.close()
+
+    def _compress(self, records, codec):
+        start = time.perf_counter()
+        result = compressChunk(records, self.writer.mode, codec, self.writer.level)
+        with self.lock:
+            self.busy += time.perf_counter() - start
+        return (codec, len(records)) + result
+
+    def _write(self):
+        while True:
+            future = self.frames.get()
+            if future is None:
+                break
+            nBytes = 0
+            try:
+                frame = future.result()
+                nBytes = 4 * frame[1]
+                if self.error is None:
+                    self.writer.writeFrame(*frame)
+            except Exception as exc:
+                self.error = exc
+            with self.written:
+                self.pending -= 1
+                self.pendingBytes -= nBytes
+                self.written.notify()
+
+    # put
+    # records: block of raw records, copied before put returns, so it can
+    #          be called with a FiFo buffer that is reused afterwards.
+    # Waits only while the chunks not yet written hold maxBytes. Returns
+    # None, so as an AcquisitionEngine stage it ends the chain.
+    def put(self, records):
+        if self.error is not None:
+            raise self.error
+        records = np.array(records, dtype=np.uint32)
+        if self.startTime is None:
+            self.startTime = time.perf_counter()
+        with self.written:
+            if self.pendingBytes > 0 and self.pendingBytes + records.nbytes > self.maxBytes:
+                start = time.perf_counter()
+                self.nWaits += 1
+                while (self.pendingBytes > 0 and self.error is None
+                       and self.pendingBytes + records.nbytes > self.maxBytes):
+                    self.written.wait()
+                self.waited += time.perf_counter() - start
+            self.pending += 1
+            self.pendingBytes += records.nbytes
+            pending = self.pending
+            self.maxBytesSeen = max(self.maxBytesSeen, self.pendingBytes)
+        if self.error is not None:
+            raise self.error
+        self.maxPendingSeen = max(self.maxPendingSeen, pending)
+        self.nChunks += 1
+        if pending > self.maxPending:
+            # Compression is behind, store the chunk as it is
+            self.nStored += 1
+            future = concurrent.futures.Future()
+            future.set_result((CODEC_NONE, len(records))
+                              + compressChunk(records, self.writer.mode, CODEC_NONE))
+        else:
+            future = self.pool.submit(self._compress, records, self.writer.codec)
+        self.frames.put(future)
+
+    # close
+    # Waits until all chunks are written and closes the file.
+    def close(self):
+        if self.thread.is_alive():
+            self.frames.put(None)
+            self.thread.join()
+            self.pool.shutdown()
+            self.writer.close()
+            self.endTime = time.perf_counter()
+        if self.error is not None:
+            raise self.error
+
+    # summary
+    # Returns the compression statistics as dict: records and bytes in and
+    # out, ratio, throughput per worker and overall in raw MB/s (the latter
+    # from the first put to close), chunks stored uncompressed, the most
+    # chunks and raw bytes waiting at a time, the limit on the latter and
+    # how often and how long put waited for it.
+    def summary(self):
+        writer = self.writer
+        elapsed = ((self.endTime or time.perf_counter()) - self.startTime
+                   if self.startTime is not None else 0.0)
+        return {
+            "records": writer.recNum,
+            "rawBytes": writer.rawBytes,
+            "bytes": writer.nBytes,
+            "ratio": writer.rawBytes / writer.nBytes if writer.nBytes > 0 else 0.0,
+            "workerRate": writer.rawBytes / self.busy / 1e6 if self.busy > 0 else 0.0,
+            "rate": writer.rawBytes / elapsed / 1e6 if elapsed > 0 else 0.0,
+            "chunks": self.nChunks,
+            "stored": self.nStored,
+            "maxPending": self.maxPendingSeen,
+            "maxBytes": self.maxBytesSeen,
+            "limitBytes": self.maxBytes,
+            "waits": self.nWaits,
+            "waited": self.waited,
+        }
+
+    def report(self):
+        s = self.summary()
+        return ("Compression: %d records, %.1f MB -> %.1f MB (ratio %.1f), %.0f MB/s per "
+                "worker, %.0f MB/s overall, %d of %d chunks stored uncompressed, "
+                "%.1f of %.1f MB queued at most, put waited %d times %.3f s"
+                % (s["records"], s["rawBytes"] / 1e6, s["bytes"] / 1e6, s["ratio"],
+                   s["workerRate"], s["rate"], s["stored"], s["chunks"],
+                   s["maxBytes"] / 1e6, s["limitBytes"] / 1e6, s["waits"], s["waited"]))
+
+
+# CompressedReader
+# Random access to the frames of a compressed file.
+# filename: file written by CompressedWriter or BackgroundCompressor
+class CompressedReader:
+    def __init__(self, filename):
+        self.file = open(filename, "rb")
+        magic, self.mode = FILEHEADER.unpack(self.file.read(FILEHEADER.size))
+        if magic != FILEMAGIC:
+            raise ValueError("%s is not a compressed record file" % filename)
+        self.index = self._readIndex()
+        if self.index is None:
+            self.index = self._scan()
+        self.starts = self.index[:, 0]
+        self.nRecords = 0
+        if len(self.index) > 0:
+            self.file.seek(int(self.index[-1, 1]))
+            header = FRAMEHEADER.unpack(self.file.read(FRAMEHEADER.size))
+            self.nRecords = header[5] + header[2]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, exc, traceback):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    # Returns the index appended on close, None if there is none
+    def _readIndex(self):
+        self.file.seek(0, 2)
+        size = self.file.tell()
+        if size < FILEHEADER.size + TRAILER.size:
+            return None
+        self.file.seek(size - TRAILER.size)
+        magic, offset = TRAILER.unpack(self.file.read(TRAILER.size))
+        if magic != INDEXMAGIC:
+            return None
+        self.file.seek(offset)
+        magic, nFrames = INDEXHEADER.unpack(self.file.read(INDEXHEADER.size))
+        return np.frombuffer(self.file.read(24 * nFrames), dtype=np.int64).reshape(-1, 3)
+
+    # Walks the frame headers, up to the last complete frame
+    def _scan(self):
+        index = []
+        offset = FILEHEADER.size
+        self.file.seek(0, 2)
+        size = self.file.tell()
+        while offset + FRAMEHEADER.size <= size:
+            self.file.seek(offset)
+            header = FRAMEHEADER.unpack(self.file.read(FRAMEHEADER.size))
+            end = offset + FRAMEHEADER.size + header[3]
+            if header[0] != FRAMEMAGIC or end > size:
+                break
+            index.append((header[5], offset, header[6]))
+            offset = end
+        return np.array(index, dtype=np.int64).reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.index)
+
+    # frame
+    # Returns the records of frame i as uint32 array and the overflow
+    # correction at its start.
+    def frame(self, i):
+        self.file.seek(int(self.index[i, 1]))
+        magic, codec, nRecords, nBytes, crc, recNum, oflcorrection = FRAMEHEADER.unpack(
+            self.file.read(FRAMEHEADER.size))
+        payload = self.file.read(nBytes)
+        if magic != FRAMEMAGIC or zlib.crc32(payload) != crc:
+            raise ValueError("Frame %d is corrupt" % i)
+        return decompressChunk(payload, codec, nRecords, self.mode), oflcorrection
+
+    # __iter__
+    # Yields the records frame by frame.
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.frame(i)[0]
+
+    # read
+    # Returns count records from record number start on (as far as there
+    # are) and the overflow correction valid before the first of them, to
+    # decode them with TTTRDecoder(reader.mode, oflcorrection).
+    def read(self, start, count):
+        first = max(0, int(np.searchsorted(self.starts, start, side="right")) - 1)
+        chunks = []
+        oflcorrection = None
+        i = first
+        end = start + count
+        while i < len(self) and self.starts[i] < end:
+            records, frameOfl = self.frame(i)
+            skip = max(0, start - int(self.starts[i]))
+            if oflcorrection is None:
+                oflcorrection = frameOfl + countRecords(records[:skip], self.mode)[3]
+            chunks.append(records[skip:end - int(self.starts[i])])
+            i += 1
+        if not chunks:
+            return np.empty(0, dtype=np.uint32), 0
+        return np.concatenate(chunks), oflcorrection
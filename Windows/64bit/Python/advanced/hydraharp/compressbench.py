@@ -0,0 +1,93 @@
+# HydraHarp 400  HHLIB v3.0  Raw record compression benchmark.
+#
+# Compresses synthetic T2 and T3 streams of different rates chunk by chunk
+# with zlib and lzma, with and without the delta encoding, and shows the
+# compression ratio and the single thread throughput of each way.
+# Then runs a threaded acquisition on a SimulatedHydraHarp with a
+# BackgroundCompressor as stage and shows whether it ever held up the
+# reader.
+#
+# Usage: python -m hydraharp.compressbench [directory]
+
+import os
+import sys
+import tempfile
+import time
+import zlib
+import numpy as np
+
+from .compress import (BackgroundCompressor, compressChunk, CODEC_ZLIB, CODEC_LZMA,
+                       DEFAULTLEVEL)
+from .decode import TTREADMAX, MODE_T2, MODE_T3
+from .engine import AcquisitionEngine
+from .synth import SimulatedHydraHarp, syntheticRecords
+
+RATES = [1e4, 1e6, 1e7] # photons/s
+NCHUNKS = 8
+
+
+# plainZlib
+# zlib on the raw records as written by tttrmode.py, for comparison.
+def plainZlib(records, mode):
+    return (zlib.compress(records.tobytes(), DEFAULTLEVEL[CODEC_ZLIB]),)
+
+def deltaZlib(records, mode):
+    return compressChunk(records, mode, CODEC_ZLIB)
+
+def deltaLzma(records, mode):
+    return compressChunk(records, mode, CODEC_LZMA)
+
+WAYS = [("zlib raw", plainZlib), ("zlib delta", deltaZlib), ("lzma delta", deltaLzma)]
+
+
+# timeWay
+# Compresses the chunks with compress and returns the ratio and raw MB/s.
+def timeWay(chunks, mode, compress):
+    nBytes = 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        nBytes += len(compress(chunk, mode)[0])
+    elapsed = time.perf_counter() - start
+    rawBytes = sum(4 * len(chunk) for chunk in chunks)
+    return rawBytes / nBytes, rawBytes / elapsed / 1e6
+
+# acquire
+# Runs a tacq ms acquisition with a BackgroundCompressor stage and returns
+# the engine and the compressor.
+def acquire(filename, photonRate, tacq):
+    device = SimulatedHydraHarp(MODE_T2, photonRate=photonRate)
+    device.setup(MODE_T2)
+    compressor = BackgroundCompressor(filename, MODE_T2)
+    engine = AcquisitionEngine(device)
+    engine.addStage("compress", compressor.put)
+    engine.start(tacq)
+    engine.wait()
+    compressor.close()
+    return engine, compressor
+
+def main(directory):
+    print("%-4s %10s  " % ("mode", "photons/s")
+          + "  ".join("%-20s" % name for name, way in WAYS))
+    for mode in (MODE_T2, MODE_T3):
+        for photonRate in RATES:
+            records = syntheticRecords(mode, NCHUNKS * TTREADMAX, photonRate=photonRate)
+            chunks = np.split(records, NCHUNKS)
+            results = [timeWay(chunks, mode, way) for name, way in WAYS]
+            print("T%d   %10.0e  " % (mode, photonRate) + "  ".join(
+                "%4.2fx %6.0f MB/s    " % result for result in results))
+
+    print("\nBackground compression of a 3 s T2 acquisition")
+    filename = os.path.join(directory, "compressbench.hhz")
+    try:
+        for photonRate in (1e6, 1e7):
+            engine, compressor = acquire(filename, photonRate, 3000)
+            stage = engine.stats()[1]
+            print("%.0e photons/s: %s, reader waited %.3f s for the stage, overrun %s"
+                  % (photonRate, compressor.report(), stage["blocked"], engine.overrun))
+    finally:
+        if os.path.exists(filename):
+            os.remove(filename)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else tempfile.gettempdir()))
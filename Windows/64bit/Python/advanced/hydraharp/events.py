@@ -0,0 +1,60 @@
+# HydraHarp 400  HHLIB v3.0  Structured event arrays.
+#
+# Decoded TTTR events are kept in contiguous NumPy arrays of the compact
+# structured types below, one element per photon or marker, in the order
+# the records arrived. Overflow records only serve the decoding and do not
+# show up here. Histogramming, correlation or storage can then work on
+# whole blocks without creating any Python objects per event.
+
+import numpy as np
+
+# T2 event, 10 bytes
+# timetag: overflow-corrected arrival time in units of the base resolution
+# channel: 0 = Sync, 1..N = regular input channel, marker bitfield for markers
+# flags: EVENT_* bits below
+T2EVENT = np.dtype([("timetag", "<i8"), ("channel", "u1"), ("flags", "u1")])
+
+# T3 event, 12 bytes
+# nsync: overflow-corrected number of the sync period
+# dtime: arrival time after the last sync in units of the chosen resolution
+# channel: 1..N = regular input channel, marker bitfield for markers
+# flags: EVENT_* bits below
+T3EVENT = np.dtype([("nsync", "<i8"), ("dtime", "<u2"), ("channel", "u1"),
+                    ("flags", "u1")])
+
+# Event flags
+EVENT_MARKER = 0x01 # the event is a marker, channel holds the marker bitfield
+
+
+# toT2Events
+# Packs the output of decodeT2 into a T2EVENT array, dropping overflow
+# and unused special records.
+def toT2Events(channel, timetag, photon, marker):
+    keep = photon | marker
+    events = np.empty(int(np.count_nonzero(keep)), dtype=T2EVENT)
+    events["timetag"] = timetag[keep]
+    events["channel"] = channel[keep]
+    events["flags"] = marker[keep] # True becomes EVENT_MARKER
+    return events
+
+# toT3Events
+# Packs the output of decodeT3 into a T3EVENT array, dropping overflow
+# and unused special records. Markers get dtime 0.
+def toT3Events(nsync, dtime, channel, photon, marker):
+    keep = photon | marker
+    events = np.empty(int(np.count_nonzero(keep)), dtype=T3EVENT)
+    events["nsync"] = nsync[keep]
+    events["dtime"] = np.where(marker, 0, dtime)[keep]
+    events["channel"] = channel[keep]
+    events["flags"] = marker[keep]
+    return events
+
+# selectPhotons
+# Returns the photon events (including Sync in T2) of an event array.
+def selectPhotons(events):
+    return events[(events["flags"] & EVENT_MARKER) == 0]
+
+# selectMarkers
+# Returns the marker events of an event array.
+def selectMarkers(events):
+    return events[(events["flags"] & EVENT_MARKER) != 0]
@@ -0,0 +1,70 @@
+# HydraHarp 400  HHLIB v3.0  Multi-device acquisition benchmark.
+#
+# Acquires from 1 to 4 SimulatedHydraHarps at once through a
+# MultiDeviceEngine, every device decoded and histogrammed by channel in
+# its own threads, and shows the aggregate throughput. The simulated FiFos
+# are large enough never to overrun, so the throughput drops below the
+# photon rate times the number of devices exactly when the machine cannot
+# keep up.
+#
+# Usage: python -m hydraharp.multibench [photonRate]
+
+import os
+import sys
+import time
+import numpy as np
+
+from .decode import TTTRDecoder, MODE_T2
+from .multi import MultiDeviceEngine
+from .synth import SimulatedHydraHarp
+
+MAXDEVICES = 4
+
+
+# PreparedDevice
+# A SimulatedHydraHarp that generates its data before the measurement, so
+# that the generation does not count into the time measured.
+class PreparedDevice:
+    def __init__(self, device, tacq):
+        self.device = device
+        device.startMeas(tacq)
+
+    def startMeas(self, tacq):
+        self.device.startTime = time.perf_counter()
+        self.device.delivered = 0
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+
+# histogrammer
+# Returns a stage function histogramming the events of a chunk by channel.
+def histogrammer(device):
+    histogram = np.zeros(256, dtype=np.int64)
+    def histogramEvents(events):
+        histogram[:] += np.bincount(events["channel"], minlength=256)
+    return histogramEvents
+
+def main(photonRate, tacq=2000):
+    print("%d CPUs, %.0e photons/s per device, %d ms" % (os.cpu_count(), photonRate, tacq))
+    for nDevices in range(1, MAXDEVICES + 1):
+        devices = [PreparedDevice(SimulatedHydraHarp(MODE_T2, fifoSize=1 << 40,
+                                                     serial="SIM%05d" % (i + 1), seed=i,
+                                                     photonRate=photonRate), tacq)
+                   for i in range(nDevices)]
+        engine = MultiDeviceEngine(devices)
+        engine.setup(MODE_T2)
+        engine.addStage("decode", lambda device: TTTRDecoder(device.mode).feed)
+        engine.addStage("histogram", histogrammer)
+        start = time.perf_counter()
+        engine.run(tacq)
+        elapsed = time.perf_counter() - start
+        nRecords = sum(e.nRecords for e in engine.engines)
+        print("%d device%s: %10d records in %5.2f s, %6.2f M records/s, %5.1f%% of the "
+              "data rate" % (nDevices, "s" if nDevices > 1 else " ", nRecords, elapsed,
+                             nRecords / elapsed / 1e6, 100 * tacq / 1000.0 / elapsed))
+        engine.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(float(sys.argv[1]) if len(sys.argv) > 1 else 5e6))
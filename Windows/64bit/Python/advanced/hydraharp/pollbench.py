@@ -0,0 +1,95 @@
+# HydraHarp 400  HHLIB v3.0  FiFo polling benchmark.
+#
+# Runs the acquisition loop of tttrmode.py on a SimulatedHydraHarp at low
+# and high data rates, once polling back to back as the demo did and once
+# with a PollScheduler, and compares the driver calls, the CPU time and the
+# time between reads, which is how long a record can sit in the FiFo. Each
+# runs with a readFiFo that waits up to READTIMEOUT for data, as the driver
+# call, and with one that returns at once.
+#
+# Usage: python -m hydraharp.pollbench [tacq/ms]
+
+import ctypes as ct
+import sys
+import time
+
+from .decode import TTREADMAX, MODE_T2
+from .device import FLAG_FIFOFULL
+from .polling import PollScheduler
+from .synth import SimulatedHydraHarp, READTIMEOUT
+
+# photon rate, sync rate
+RATES = [(1e3, 1e3), (1e5, 1e5), (1e7, 1e5)]
+# readFiFo waits for data up to
+READTIMEOUTS = [("waits", READTIMEOUT), ("returns", 0.0)]
+
+
+# CountingDevice
+# Counts the driver calls the acquisition loop makes.
+class CountingDevice:
+    def __init__(self, device):
+        self.device = device
+        self.nCalls = 0
+
+    def getFlags(self):
+        self.nCalls += 1
+        return self.device.getFlags()
+
+    def readFiFo(self, buffer, count):
+        self.nCalls += 1
+        return self.device.readFiFo(buffer, count)
+
+    def ctcStatus(self):
+        self.nCalls += 1
+        return self.device.ctcStatus()
+
+# acquire
+# The tttrmode.py loop, with the reads paced by scheduler unless None.
+# Returns the records read, whether the FiFo overran and the times at which
+# reads returned data.
+def acquire(device, tacq, scheduler=None):
+    buffer = (ct.c_uint * TTREADMAX)()
+    readTimes = []
+    nRecordsTotal = 0
+    device.device.startMeas(tacq)
+    while True:
+        if scheduler is None or scheduler.checkFlags():
+            if device.getFlags() & FLAG_FIFOFULL:
+                device.device.stopMeas()
+                return nRecordsTotal, True, readTimes
+        nRecords = device.readFiFo(buffer, TTREADMAX)
+        if nRecords > 0:
+            nRecordsTotal += nRecords
+            readTimes.append(time.perf_counter())
+        elif device.ctcStatus():
+            device.device.stopMeas()
+            return nRecordsTotal, False, readTimes
+        if scheduler is not None:
+            scheduler.gotRecords(nRecords)
+            scheduler.wait()
+
+def main(argv):
+    tacq = int(argv[1]) if len(argv) > 1 else 3000
+    print("%-22s %-8s %-9s %12s %10s %9s %9s %9s  %s"
+          % ("photons/s, syncs/s", "read", "polling", "records", "calls/s", "CPU",
+             "mean gap", "max gap", "FiFo"))
+    for photonRate, syncRate in RATES:
+        for read, readTimeout in READTIMEOUTS:
+            for label, scheduler in [("spin", None), ("adaptive", PollScheduler())]:
+                device = CountingDevice(SimulatedHydraHarp(MODE_T2, photonRate=photonRate,
+                                                           syncRate=syncRate,
+                                                           readTimeout=readTimeout))
+                device.device.startMeas(tacq) # pregenerates, so that it is not timed below
+                cpu, wall = time.process_time(), time.perf_counter()
+                nRecords, overrun, readTimes = acquire(device, tacq, scheduler)
+                cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+                gaps = [b - a for a, b in zip(readTimes, readTimes[1:])] or [0.0]
+                print("%-22s %-8s %-9s %12d %10.0f %8.0f%% %7.1fms %7.1fms  %s"
+                      % ("%.0e, %.0e" % (photonRate, syncRate), read, label, nRecords,
+                         device.nCalls / wall, 100 * cpu / wall,
+                         1000 * sum(gaps) / len(gaps), 1000 * max(gaps),
+                         "overrun!" if overrun else "ok"))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
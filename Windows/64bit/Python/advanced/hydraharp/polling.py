@@ -0,0 +1,103 @@
+# HydraHarp 400  HHLIB v3.0  Adaptive FiFo polling.
+#
+# The demo loops call HH_GetFlags and HH_ReadFiFo (and HH_CTCStatus when
+# nothing came) back to back, as fast as the driver returns. At low count
+# rates nearly all of these calls come back empty and only cost CPU time.
+# PollScheduler adapts the time between reads to how full the chunks come
+# back: it backs off while they are nearly empty and reads again at once
+# when they are full. The time from the start of one read to the next
+# never grows beyond maxInterval, about the time HH_ReadFiFo itself waits
+# for data while little comes, and the time the read took counts towards
+# it. So the reads come no further apart than back to back and no latency
+# is added: a read that returns at once is followed by a wait instead of
+# the next call. The wait also never grows beyond the time the observed
+# data rate takes to fill half a chunk, so the backlog in the FiFo stays
+# small at any rate. HH_GetFlags is called before every read while the
+# chunks come back well filled or empty, and only on every flagEvery'th
+# read in between, when the FiFo is known to be nearly empty.
+#
+# Where HH_ReadFiFo waits for data while little comes, this only saves the
+# HH_GetFlags calls, the CPU time stays the same. Where a read returns at
+# once, the waits take the place of hundreds of thousands of calls a
+# second. python -m hydraharp.pollbench compares the two at low and high
+# rates, with either kind of read.
+
+import time
+
+from .decode import TTREADMAX
+
+MININTERVAL = 0.001 # s first wait when backing off
+MAXINTERVAL = 0.01  # s longest time from the start of one read to the next
+FLAGEVERY   = 8     # reads per flag check while backing off
+
+
+# PollScheduler
+# chunkSize: records requested per HH_ReadFiFo
+# maxInterval: longest time from the start of one read to the next in s,
+#              including the read
+# lowFill, highFill: fractions of chunkSize below which the scheduler backs
+#                    off and from which on it reads again at once
+# flagEvery: reads per HH_GetFlags while backing off
+class PollScheduler:
+    def __init__(self, chunkSize=TTREADMAX, maxInterval=MAXINTERVAL, lowFill=0.125,
+                 highFill=0.5, flagEvery=FLAGEVERY):
+        self.chunkSize = chunkSize
+        self.maxInterval = maxInterval
+        self.lowFill = lowFill
+        self.highFill = highFill
+        self.flagEvery = flagEvery
+        self.interval = 0.0 # s from the start of the last read to the next
+        self.readStart = None # time.perf_counter() the last read started
+        self.rate = 0.0 # records/s observed over the last read
+        self.lastRead = None
+        self.lastRecords = 0
+        self.sinceFlags = 0
+        self.nReads = 0
+        self.nFlagChecks = 0
+        self.nWaits = 0
+        self.waited = 0.0 # s spent waiting in total
+
+    # checkFlags
+    # Returns True if HH_GetFlags is due before the next read.
+    def checkFlags(self):
+        if (self.interval == 0.0 or self.lastRecords == 0
+                or self.sinceFlags + 1 >= self.flagEvery):
+            self.sinceFlags = 0
+            self.nFlagChecks += 1
+            return True
+        self.sinceFlags += 1
+        return False
+
+    # gotRecords
+    # To be called after every read with the number of records it returned.
+    # Returns the time in s from the start of that read to the next one.
+    def gotRecords(self, nRecords):
+        now = time.perf_counter()
+        if self.lastRead is not None and now > self.lastRead:
+            self.rate = nRecords / (now - self.lastRead)
+        self.lastRead = now
+        self.lastRecords = nRecords
+        self.nReads += 1
+        if nRecords >= self.highFill * self.chunkSize:
+            self.interval = 0.0
+        elif nRecords < self.lowFill * self.chunkSize:
+            self.interval = min(max(2 * self.interval, MININTERVAL), self.maxInterval)
+        elif self.interval < 2 * MININTERVAL:
+            self.interval = 0.0
+        else:
+            self.interval /= 2
+        # Never wait longer than the data takes to fill half a chunk
+        if self.rate > 0:
+            self.interval = min(self.interval, self.highFill * self.chunkSize / self.rate)
+        return self.interval
+
+    # wait
+    # Waits until the time gotRecords returned last has passed since the
+    # last read started. To be called right before the next read.
+    def wait(self):
+        start = time.perf_counter()
+        if self.readStart is not None and self.interval > start - self.readStart:
+            time.sleep(self.interval - (start - self.readStart))
+            self.nWaits += 1
+            self.waited += time.perf_counter() - start
+        self.readStart = time.perf_counter()
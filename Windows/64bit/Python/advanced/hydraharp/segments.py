@@ -0,0 +1,301 @@
+# HydraHarp 400  HHLIB v3.0  Segmented raw output for long runs.
+#
+# One raw file per run grows to hundreds of GB on long runs at high count
+# rates, can only be processed after the run and is lost as a whole if
+# anything goes wrong. SegmentedWriter instead rolls over to a new file
+# once a segment reaches a size or time limit:
+#
+#   tttrmode_0000.out  tttrmode_0000.json
+#   tttrmode_0001.out  tttrmode_0001.json  ...
+#
+# The JSON sidecar of each segment holds the decoder state at its start
+# (overflow correction and record counts, as TTTRDecoder.snapshot gives
+# it) and the time base (mode, resolution, sync period), so every segment
+# decodes on its own. The sidecar is written when the segment is opened
+# and again, marked complete, when it is closed. Complete segments can be
+# analysed, also in parallel processes, while the acquisition goes on:
+#
+#   python -m hydraharp.segments tttrmode [workers [timeout]]
+#
+# follows the segments of a run as they are completed and counts the
+# events per channel in a pool of processes. It stops at the last segment,
+# or once no segment file has changed for timeout s (IDLETIMEOUT by
+# default), as after a run that crashed before it could mark its last
+# segment.
+#
+# Where an AcquisitionEngine recovered from a FiFo overrun, gap() ends the
+# segment and the next one records the gap in its sidecar.
+
+import concurrent.futures
+import glob
+import json
+import os
+import sys
+import time
+import numpy as np
+
+from .decode import TTTRDecoder, countRecords, MODE_T2
+from .timebase import TimeBase
+from .view import RecordView
+from .writers import MappedWriter
+
+SEGMENTBYTES = 1024 * 1024 * 1024 # bytes per segment by default
+IDLETIMEOUT = 60.0 # s without a changed segment file before main gives up
+
+
+# segmentName
+# Returns the file name of segment number with the given extension.
+def segmentName(prefix, number, extension):
+    return "%s_%04d%s" % (prefix, number, extension)
+
+
+# SegmentedWriter
+# prefix: path and name the segment files start with
+# mode: MODE_T2 or MODE_T3
+# timeBase: TimeBase of the measurement, stored in every sidecar
+# maxBytes: a segment is closed once it holds at least this many bytes
+# maxSeconds: a segment is closed once it is this old, None for no limit
+# onSegment: called with the Segment of every completed segment, e.g. to
+#            submit it for analysis. It runs in the writing thread.
+# info: dict of further information for the sidecars, e.g. the settings
+# A segment is only closed between two writes, so the records of one
+# write always stay in one segment.
+class SegmentedWriter:
+    def __init__(self, prefix, mode, timeBase=None, maxBytes=SEGMENTBYTES, maxSeconds=None,
+                 onSegment=None, info=None):
+        self.prefix = prefix
+        self.mode = mode
+        self.timeBase = timeBase
+        self.maxBytes = maxBytes
+        self.maxSeconds = maxSeconds
+        self.onSegment = onSegment
+        self.info = info or {}
+        self.state = TTTRDecoder(mode).snapshot() # decoder state after the last write
+        self.file = None
+        self.sidecar = None # dict written to the sidecar of the open segment
+        self.opened = 0.0 # time.monotonic() the open segment was opened at
+        self.nSegments = 0 # segments opened so far
+        self.nextGap = None # gap to record in the sidecar of the next segment
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, exc, traceback):
+        self.close()
+
+    def _writeSidecar(self):
+        filename = segmentName(self.prefix, self.sidecar["segment"], ".json")
+        with open(filename + ".tmp", "w") as f:
+            json.dump(self.sidecar, f, indent=1)
+        os.replace(filename + ".tmp", filename) # readers never see half a sidecar
+
+    def _open(self):
+        filename = segmentName(self.prefix, self.nSegments, ".out")
+        self.file = MappedWriter(filename, extent=min(self.maxBytes, SEGMENTBYTES))
+        self.sidecar = {
+            "segment": self.nSegments,
+            "records": os.path.basename(filename),
+            "mode": self.mode,
+            "start": dict(self.state),
+            "end": None,
+            "timeBase": None if self.timeBase is None else self.timeBase.snapshot(),
+            "startTime": time.time(),
+            "endTime": None,
+            "complete": False,
+            "last": False,
+            "gap": self.nextGap,
+            "info": self.info,
+        }
+        self.nextGap = None
+        self._writeSidecar()
+        self.opened = time.monotonic()
+        self.nSegments += 1
+
+    def _close(self, last=False):
+        self.file.close()
+        self.file = None
+        self.sidecar.update(end=dict(self.state), endTime=time.time(), complete=True,
+                            last=last)
+        self._writeSidecar()
+        if self.onSegment is not None:
+            self.onSegment(Segment(segmentName(self.prefix, self.sidecar["segment"], ".json")))
+
+    # write
+    # records: block of raw records, e.g. pool.records(i, n) or the first
+    #          nRecords entries of the HH_ReadFiFo buffer
+    # Returns the number of records written.
+    def write(self, records):
+        records = np.asarray(records, dtype=np.uint32)
+        if self.file is None:
+            self._open()
+        self.file.write(records)
+        nPhotons, nMarkers, nOverflows, advance = countRecords(records, self.mode)
+        state = self.state
+        state["oflcorrection"] += advance
+        state["recNum"] += len(records)
+        state["nPhotons"] += nPhotons
+        state["nMarkers"] += nMarkers
+        state["nOverflows"] += nOverflows
+        if self.file.tell() >= self.maxBytes or (
+                self.maxSeconds is not None
+                and time.monotonic() - self.opened >= self.maxSeconds):
+            self._close()
+        return len(records)
+
+    # gap
+    # Marks a Gap (see engine.py): the open segment is completed, the next
+    # one gets number, elapsed, duration and latency of the gap in its
+    # sidecar. With a TimeBase the decoder state of the next segment
+    # continues at the restart, so that its times stay on the time axis of
+    # the first measurement.
+    def gap(self, gap):
+        if self.file is not None:
+            self._close()
+        if self.timeBase is not None:
+            self.state["oflcorrection"] = max(self.state["oflcorrection"],
+                                              gap.ticks(self.timeBase))
+        self.nextGap = {"number": gap.number, "elapsed": gap.elapsed,
+                        "duration": gap.duration, "latency": gap.latency}
+
+    # close
+    # Completes the open segment, if any, and marks it as the last one.
+    def close(self):
+        if self.file is not None:
+            self._close(last=True)
+        elif self.nSegments > 0 and self.sidecar is not None and not self.sidecar["last"]:
+            # The last segment was completed by its limit, mark it now
+            self.sidecar["last"] = True
+            self._writeSidecar()
+
+
+# Segment
+# One segment as described by its sidecar.
+# sidecar: file name of the sidecar (.json)
+class Segment:
+    def __init__(self, sidecar):
+        with open(sidecar) as f:
+            meta = json.load(f)
+        self.sidecar = sidecar
+        self.meta = meta
+        self.number = meta["segment"]
+        self.filename = os.path.join(os.path.dirname(sidecar), meta["records"])
+        self.mode = meta["mode"]
+        self.complete = meta["complete"]
+        self.last = meta["last"]
+        self.start = meta["start"]
+        self.end = meta["end"]
+        self.gap = meta.get("gap") # the Gap before the segment, if any
+        self.timeBase = (None if meta["timeBase"] is None
+                         else TimeBase.fromSnapshot(meta["timeBase"]))
+
+    def __len__(self):
+        if not self.complete:
+            raise ValueError("Segment %d is not complete" % self.number)
+        return self.end["recNum"] - self.start["recNum"]
+
+    # decoder
+    # Returns a TTTRDecoder ready to decode the records of the segment.
+    def decoder(self):
+        return TTTRDecoder.fromSnapshot(self.start)
+
+    # records
+    # Returns the raw records of a complete segment, memory mapped.
+    def records(self):
+        if len(self) == 0:
+            return np.empty(0, dtype=np.uint32)
+        return np.memmap(self.filename, dtype="<u4", mode="r", shape=(len(self),))
+
+    # view
+    # Returns a RecordView of the records of a complete segment.
+    def view(self):
+        return RecordView(self.records(), self.mode, self.start["oflcorrection"])
+
+    # events
+    # Decodes the whole segment into a T2EVENT or T3EVENT array.
+    def events(self):
+        return self.decoder().feed(self.records())
+
+
+# findSegments
+# Returns the Segments of the run written with prefix in order.
+# complete: only the complete ones, which may be analysed
+def findSegments(prefix, complete=True):
+    segments = [Segment(sidecar) for sidecar in
+                sorted(glob.glob(glob.escape(prefix) + "_[0-9][0-9][0-9][0-9].json"))]
+    return [s for s in segments if s.complete or not complete]
+
+
+# lastChange
+# Returns the time.time() any segment file (records or sidecar) of the run
+# written with prefix was last changed at, None if there is none.
+def lastChange(prefix):
+    changed = None
+    for filename in glob.glob(glob.escape(prefix) + "_[0-9][0-9][0-9][0-9].*"):
+        try:
+            mtime = os.path.getmtime(filename)
+        except OSError:
+            continue # a sidecar being replaced
+        changed = mtime if changed is None else max(changed, mtime)
+    return changed
+
+
+# channelCounts
+# Decodes the segment with the given sidecar on its own and returns the
+# segment number, the events per channel and the times of the first and
+# last event in s. Runs in the worker processes of main().
+def channelCounts(sidecar):
+    segment = Segment(sidecar)
+    events = segment.events()
+    counts = np.bincount(events["channel"], minlength=256)
+    span = (None, None)
+    if len(events) > 0 and segment.timeBase is not None:
+        ticks = events["timetag"] if segment.mode == MODE_T2 else events["nsync"]
+        seconds = segment.timeBase.toSeconds(ticks[[0, -1]])
+        span = (float(seconds[0]), float(seconds[1]))
+    return segment.number, counts, span
+
+
+def main(prefix, workers=None, timeout=IDLETIMEOUT):
+    submitted = set()
+    futures = []
+    total = np.zeros(256, dtype=np.int64)
+    done = False
+    started = time.time()
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        # Follow the run until its last segment is complete, or until no
+        # segment file has changed for timeout s
+        while not done:
+            for segment in findSegments(prefix):
+                if segment.number not in submitted:
+                    submitted.add(segment.number)
+                    futures.append(pool.submit(channelCounts, segment.sidecar))
+                done = done or segment.last
+            if done:
+                break
+            changed = lastChange(prefix)
+            if time.time() - max(changed or started, started) >= timeout:
+                break
+            time.sleep(1.0)
+        if not futures:
+            print("No complete segments found for %s" % prefix)
+            return 1
+        for future in futures:
+            number, counts, span = future.result()
+            total += counts
+            start, end = ("%10.4f s" % t if t is not None else " " * 12 for t in span)
+            print("Segment %4d  %s .. %s  %s" % (number, start, end, ", ".join(
+                "[%d] %d" % (ch, counts[ch]) for ch in np.flatnonzero(counts))))
+    print("Total         %s" % ", ".join(
+        "[%d] %d" % (ch, total[ch]) for ch in np.flatnonzero(total)))
+    if not done:
+        print("No segment changed for %.0f s and the last one is not marked, the run "
+              "ended early. Segments not completed are left out." % timeout)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m hydraharp.segments prefix [workers [timeout]]")
+        sys.exit(1)
+    sys.exit(main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None,
+                  float(sys.argv[3]) if len(sys.argv) > 3 else IDLETIMEOUT))
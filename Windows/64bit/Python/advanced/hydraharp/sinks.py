@@ -0,0 +1,154 @@
+# HydraHarp 400  HHLIB v3.0  Batched event sinks.
+#
+# Instead of calling GotPhoton/GotMarker functions once per event, the
+# EventDispatcher decodes each HH_ReadFiFo chunk and hands the resulting
+# event arrays to every registered sink in one call. The classic per event
+# functions can still be used through the PerEventAdapter.
+
+import numpy as np
+
+from .decode import MODE_T2
+from .events import EVENT_MARKER, selectPhotons, selectMarkers
+
+
+# EventSink
+# Base class for receivers of decoded event blocks. Subclasses override
+# gotPhotons and/or gotMarkers, which are called once per chunk with the
+# T2EVENT/T3EVENT arrays of that chunk (empty chunks are not passed on).
+# Sinks that need photons and markers in their mutual arrival order
+# override gotEvents instead.
+# Plain functions can be registered without subclassing by passing them
+# as gotPhotons/gotMarkers to the constructor.
+class EventSink:
+    def __init__(self, gotPhotons=None, gotMarkers=None):
+        if gotPhotons is not None:
+            self.gotPhotons = gotPhotons
+        if gotMarkers is not None:
+            self.gotMarkers = gotMarkers
+
+    def gotEvents(self, events):
+        photons = selectPhotons(events)
+        if len(photons) > 0:
+            self.gotPhotons(photons)
+        if len(photons) < len(events):
+            self.gotMarkers(selectMarkers(events))
+
+    def gotPhotons(self, photons):
+        pass
+
+    def gotMarkers(self, markers):
+        pass
+
+# EventDispatcher
+# decoder: TTTRDecoder of the stream
+# Decodes chunks of records and distributes the events to the sinks.
+class EventDispatcher:
+    def __init__(self, decoder):
+        self.decoder = decoder
+        self.sinks = []
+
+    def register(self, sink):
+        self.sinks.append(sink)
+        return sink
+
+    def unregister(self, sink):
+        self.sinks.remove(sink)
+
+    # process
+    # records: block of records from one HH_ReadFiFo call
+    # Returns the decoded event array.
+    def process(self, records):
+        events = self.decoder.feed(records)
+        if len(events) > 0:
+            for sink in self.sinks:
+                sink.gotEvents(events)
+        return events
+
+# PerEventAdapter
+# Drives the classic per event functions from the batched interface, so
+# existing code keeps working unchanged (but without the speed benefit).
+# mode: MODE_T2 or MODE_T3
+# gotPhoton: GotPhotonT2(timeTag, channel) or GotPhotonT3(truensync, channel, dTime)
+# gotMarker: GotMarkerT2(timeTag, markers) or GotMarkerT3(truensync, markers)
+class PerEventAdapter(EventSink):
+    def __init__(self, mode, gotPhoton, gotMarker):
+        EventSink.__init__(self)
+        self.mode = mode
+        self.gotPhoton = gotPhoton
+        self.gotMarker = gotMarker
+
+    def gotEvents(self, events):
+        gotPhoton, gotMarker = self.gotPhoton, self.gotMarker
+        if self.mode == MODE_T2:
+            for timeTag, channel, flags in events.tolist():
+                if flags & EVENT_MARKER:
+                    gotMarker(timeTag, channel)
+                else:
+                    gotPhoton(timeTag, channel)
+        else:
+            for truensync, dTime, channel, flags in events.tolist():
+                if flags & EVENT_MARKER:
+                    gotMarker(truensync, channel)
+                else:
+                    gotPhoton(truensync, channel, dTime)
+
+# TextWriter
+# Writes events as text lines in the format of the instant processing demo,
+# formatting a whole chunk at once.
+# outputfile: text file opened for writing
+# mode: MODE_T2 or MODE_T3
+# resolution: resolution in ps
+# syncPeriod: sync period in s (T3 only)
+# timebase: optional TimeBase. If given, times are converted exactly from
+#           the integer event times instead of via float multiplication,
+#           which matters for timetags beyond 2^53 ps (about 2.5 hours).
+class TextWriter(EventSink):
+    def __init__(self, outputfile, mode, resolution, syncPeriod=0.0,
+                 timebase=None):
+        EventSink.__init__(self)
+        self.outputfile = outputfile
+        self.mode = mode
+        self.resolution = resolution
+        self.syncPeriod = syncPeriod
+        self.timebase = timebase
+
+    def gotEvents(self, events):
+        isMarker = (events["flags"] & EVENT_MARKER) != 0
+        if self.mode == MODE_T2:
+            kinds = np.where(isMarker, "MK", "CH").tolist()
+            if self.timebase is None:
+                fmt = "%s %2d %14.0lf\n"
+                times = events["timetag"] * self.resolution
+            else:
+                fmt = "%s %2d %14d\n"
+                times = self.timebase.toPicoseconds(events["timetag"])
+            lines = [fmt % line for line in zip(
+                kinds, events["channel"].tolist(), times.tolist())]
+        else:
+            # Photons and markers have different formats, fill both into
+            # one list to keep the order of arrival
+            photons, markers = events[~isMarker], events[isMarker]
+            if self.timebase is None:
+                fmt = "CH %2d %10.8lf %8.0lf\n"
+                photonTimes = photons["nsync"] * self.syncPeriod
+                dtimes = photons["dtime"] * self.resolution
+                markerTimes = markers["nsync"] * self.syncPeriod
+            else:
+                fmt = "CH %2d %10.8lf %8d\n"
+                photonTimes = self.timebase.toSeconds(photons["nsync"])
+                dtimes = self.timebase.dtimeToPicoseconds(photons["dtime"])
+                markerTimes = self.timebase.toSeconds(markers["nsync"])
+            lines = np.empty(len(events), dtype=object)
+            lines[~isMarker] = [fmt % line for line in zip(
+                photons["channel"].tolist(), photonTimes.tolist(), dtimes.tolist())]
+            lines[isMarker] = ["MK %2d %10.8lf\n" % line for line in zip(
+                markers["channel"].tolist(), markerTimes.tolist())]
+            lines = lines.tolist()
+        self.outputfile.write("".join(lines))
+
+    # gotGap
+    # Marks a Gap of an AcquisitionEngine recovering from a FiFo overrun
+    # (see engine.py) with a line of its own.
+    def gotGap(self, gap):
+        self.outputfile.write("GAP FiFo overrun, no data for %.6f s, restart at %.6f s\n"
+                              % (gap.duration, gap.elapsed))
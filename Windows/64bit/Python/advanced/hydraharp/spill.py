@@ -0,0 +1,111 @@
+# HydraHarp 400  HHLIB v3.0  Spill to disk queue.
+#
+# When the analysis falls behind during a burst of high count rates, the
+# queue between the FiFo reader and the first stage fills up, the reader
+# has to wait and eventually the FiFo overruns. A SpillQueue takes the
+# place of that queue: up to maxsize chunks are kept in memory as usual,
+# further ones are written to a temporary spill file and their buffers go
+# straight back to the pool. Once the stage has worked off the chunks in
+# memory it reads the spilled ones back, in order, into pool buffers
+# again. So no data is lost, the memory used stays that of the pool and
+# the disk only has to keep up with the raw data rate. The spill file is
+# emptied whenever it has been read to the end and removed at the end of
+# the measurement.
+
+import collections
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+
+
+# SpillQueue
+# pool: BufferPool the chunks are in
+# maxsize: chunks kept in memory before further ones are spilled
+# directory: where to put the spill file, None for the temp directory
+class SpillQueue:
+    def __init__(self, pool, maxsize, directory=None):
+        self.pool = pool
+        self.maxsize = maxsize
+        self.memory = collections.deque()
+        self.spilled = collections.deque() # record counts, other items as they are
+        self.cond = threading.Condition()
+        fd, self.filename = tempfile.mkstemp(prefix="hhspill", suffix=".tmp", dir=directory)
+        os.close(fd)
+        self.writeFile = open(self.filename, "wb", buffering=0)
+        self.readFile = open(self.filename, "rb", buffering=0)
+        self.nSpilled = 0 # chunks spilled so far
+        self.spilledBytes = 0 # bytes spilled so far
+        self.spillBytes = 0 # bytes in the spill file not yet read back
+        self.maxSpillBytes = 0
+        self.spillTime = 0.0 # s the producer spent writing the spill file
+
+    # put
+    # Queues an item, spilling it if maxsize chunks are in memory already or
+    # earlier ones have been spilled. Items that are not chunks, the None end
+    # mark or a Gap, queue up in order without being spilled. Never waits for
+    # the consumer, timeout is accepted for compatibility with queue.Queue.
+    def put(self, item, timeout=None):
+        chunk = isinstance(item, np.ndarray)
+        with self.cond:
+            if not self.spilled and (not chunk or len(self.memory) < self.maxsize):
+                self.memory.append(item)
+            elif not chunk:
+                self.spilled.append(item)
+            else:
+                start = time.perf_counter()
+                data = memoryview(item).cast("B")
+                while len(data) > 0: # raw writes may be partial
+                    data = data[self.writeFile.write(data):]
+                self.spillTime += time.perf_counter() - start
+                self.spilled.append(len(item))
+                self.nSpilled += 1
+                self.spilledBytes += item.nbytes
+                self.spillBytes += item.nbytes
+                self.maxSpillBytes = max(self.maxSpillBytes, self.spillBytes)
+                self.pool.release(item)
+            self.cond.notify()
+
+    # get
+    # Returns the next item in order, waiting for one. Spilled chunks are
+    # read back into a buffer of the pool.
+    def get(self):
+        with self.cond:
+            while not self.memory and not self.spilled:
+                self.cond.wait()
+            if self.memory or not isinstance(self.spilled[0], int):
+                item = self.memory.popleft() if self.memory else self.spilled.popleft()
+                if item is None:
+                    self.close() # the end of the measurement
+                return item
+        # Only this thread takes spilled chunks, so the first one stays
+        # while we wait for a buffer
+        i = None
+        while i is None:
+            i = self.pool.acquire(0.1)
+        with self.cond:
+            nRecords = self.spilled.popleft()
+            records = self.pool.records(i, nRecords)
+            data = memoryview(records).cast("B")
+            while len(data) > 0:
+                data = data[self.readFile.readinto(data):]
+            self.spillBytes -= records.nbytes
+            if not self.spilled:
+                # Read to the end, start over with an empty file
+                self.writeFile.truncate(0)
+                self.writeFile.seek(0)
+                self.readFile.seek(0)
+            return records
+
+    def qsize(self):
+        with self.cond:
+            return len(self.memory) + len(self.spilled)
+
+    # close
+    # Removes the spill file.
+    def close(self):
+        if not self.writeFile.closed:
+            self.writeFile.close()
+            self.readFile.close()
+            os.remove(self.filename)
@@ -0,0 +1,390 @@
+# HydraHarp 400  HHLIB v3.0  Synthetic TTTR record streams.
+#
+# Generates T2 and T3 record streams as a HydraHarp would deliver them via
+# HH_ReadFiFo, so that decoding and processing can be exercised and timed
+# without a device (see also SimulatedHydraHarp below): Poisson distributed
+# photons on several channels, a periodic sync, Poisson distributed markers
+# and the overflow records that follow from the time running on.
+# Everything is generated with NumPy in blocks, so streams of any length
+# can be produced with bounded memory.
+
+import ctypes as ct
+import time
+import numpy as np
+
+from .decode import (T2WRAPAROUND_V2, T2TIMEMASK, T3WRAPAROUND, T3NSYNCMASK,
+                     T3DTIMESHIFT, T3DTIMEMASK, CHANNELSHIFT, SPECIALSHIFT,
+                     OVERFLOWRECORD, MAXMARKER, MODE_T2, MODE_T3, TTREADMAX)
+from .device import FLAG_FIFOFULL, MODE_HIST, MODE_CONT, MAXLENCODE, MAXHISTLEN
+from .contmode import MEASCTRL_SINGLESHOT_CTC, blockSize
+
+FIFOSIZE = 4 * 1024 * 1024 # default capacity of the simulated FiFo in records
+PREGENERATE = 32 * 1024 * 1024 # records SimulatedHydraHarp generates ahead
+READTIMEOUT = 0.01 # s readFiFo waits for the FiFo to fill the buffer
+
+
+# encodeRecords
+# coarse: sorted T2 timetags or T3 nsync values of the events, int64
+# payload: all other bits of the event records (special, channel, dtime)
+# wraparound: T2WRAPAROUND_V2 or T3WRAPAROUND
+# countMask: largest overflow count one record can hold
+# lastWrap: number of wraparounds before the first event
+# Returns the records with overflow records inserted wherever the coarse
+# time wraps around, and the number of wraparounds after the last event.
+def encodeRecords(coarse, payload, wraparound, countMask, lastWrap):
+    wrap = coarse // wraparound
+    steps = np.diff(wrap, prepend=lastWrap)
+    nOverflows = -(-steps // countMask) # overflow records before each event
+    total = nOverflows + 1
+    position = np.cumsum(total) - total
+    records = np.empty(int(total.sum()), dtype=np.uint32)
+    records[position + nOverflows] = payload | (coarse % wraparound).astype(np.uint32)
+
+    event = np.repeat(np.arange(len(coarse)), nOverflows)
+    index = np.arange(len(event)) - (np.cumsum(nOverflows) - nOverflows)[event]
+    last = index == nOverflows[event] - 1
+    counts = np.where(last, steps[event] - countMask * index, countMask)
+    records[position[event] + index] = (OVERFLOWRECORD << CHANNELSHIFT
+                                        | counts.astype(np.uint32))
+    return records, int(wrap[-1]) if len(wrap) > 0 else lastWrap
+
+
+# SyntheticStream
+# mode: MODE_T2 or MODE_T3
+# photonRate: photons per s, summed over all channels
+# syncRate: sync rate in Hz (after the divider), None for 80 MHz in T3 and
+#           100 kHz in T2, where every sync gives a record (0 for none)
+# markerRate: markers per s
+# nChannels: number of input channels the photons are spread over
+# resolution: T2 base resolution or T3 dtime bin width in ps
+# lifetime: T3 only, decay time of the photon dtime distribution in ps
+# seed: seed of the random generator, equal seeds give equal streams
+class SyntheticStream:
+    __slots__ = ("mode", "photonRate", "syncRate", "markerRate", "nChannels",
+                 "resolution", "lifetime", "rng", "time", "nextSync", "lastWrap",
+                 "pending")
+
+    def __init__(self, mode, photonRate=1e6, syncRate=None, markerRate=10.0, nChannels=8,
+                 resolution=1, lifetime=2000.0, seed=0):
+        if mode not in (MODE_T2, MODE_T3):
+            raise ValueError("SyntheticStream supports only MODE_T2 and MODE_T3, not %r" % mode)
+        if syncRate is None:
+            syncRate = 100e3 if mode == MODE_T2 else 80e6
+        if mode == MODE_T3 and syncRate <= 0:
+            raise ValueError("T3 mode needs a sync rate")
+        self.mode = mode
+        self.photonRate = photonRate
+        self.syncRate = syncRate
+        self.markerRate = markerRate
+        self.nChannels = nChannels
+        self.resolution = resolution
+        self.lifetime = lifetime
+        self.rng = np.random.default_rng(seed)
+        self.time = 0 # ps, end of what has been generated so far
+        self.nextSync = 0 # T2 only, number of the next sync record
+        self.lastWrap = 0
+        self.pending = np.empty(0, dtype=np.uint32)
+
+    # syncPeriod
+    # Sync period in ps, as HH_GetSyncPeriod would give it in s * 1e12.
+    def syncPeriod(self):
+        return 1e12 / self.syncRate
+
+    # read
+    # Returns the next nRecords records of the stream as uint32 array.
+    def read(self, nRecords):
+        blocks, have = [self.pending], len(self.pending)
+        while have < nRecords:
+            block = self._generate(max(nRecords - have, 4096))
+            blocks.append(block)
+            have += len(block)
+        records = np.concatenate(blocks)
+        self.pending = records[nRecords:]
+        return records[:nRecords]
+
+    # Poisson event times in ps in [start, end)
+    def _poisson(self, rate, start, end):
+        n = self.rng.poisson(rate * (end - start) * 1e-12)
+        return np.sort(self.rng.integers(start, end, n, dtype=np.int64))
+
+    # Generates the records of a time span holding about nRecords events
+    def _generate(self, nRecords):
+        rate = self.photonRate + self.markerRate
+        if self.mode == MODE_T2:
+            rate += self.syncRate
+        start = self.time
+        end = start + max(int(nRecords / rate * 1e12), 1)
+        self.time = end
+
+        photons = self._poisson(self.photonRate, start, end)
+        channels = self.rng.integers(0, self.nChannels, len(photons), dtype=np.uint32)
+        markers = self._poisson(self.markerRate, start, end)
+        markerBits = self.rng.integers(1, MAXMARKER + 1, len(markers), dtype=np.uint32)
+        photonBits = channels << CHANNELSHIFT
+        markerBits = (1 << SPECIALSHIFT) | (markerBits << CHANNELSHIFT)
+
+        if self.mode == MODE_T2:
+            times = [photons, markers]
+            bits = [photonBits, markerBits]
+            if self.syncRate > 0:
+                period = self.syncPeriod()
+                lastSync = int(np.ceil(end / period))
+                syncs = (np.arange(self.nextSync, lastSync) * period).astype(np.int64)
+                syncs = syncs[syncs < end]
+                self.nextSync += len(syncs)
+                times.append(syncs)
+                bits.append(np.full(len(syncs), 1 << SPECIALSHIFT, dtype=np.uint32))
+            times, bits = np.concatenate(times), np.concatenate(bits)
+            order = np.argsort(times, kind="stable")
+            coarse = times[order] // self.resolution
+            return self._encode(coarse, bits[order], T2WRAPAROUND_V2, T2TIMEMASK)
+
+        # T3: photons belong to the sync period they fall into and have a
+        # decay time after it, markers only carry the sync period
+        period = self.syncPeriod()
+        nsyncPhotons = (photons / period).astype(np.int64)
+        maxBin = min(int(period / self.resolution), T3DTIMEMASK)
+        dtime = (self.rng.exponential(self.lifetime, len(photons)) / self.resolution)
+        dtime = np.minimum(dtime.astype(np.int64), maxBin).astype(np.uint32)
+        nsyncMarkers = (markers / period).astype(np.int64)
+        coarse = np.concatenate([nsyncPhotons, nsyncMarkers])
+        bits = np.concatenate([photonBits | (dtime << T3DTIMESHIFT), markerBits])
+        sortKey = coarse * (T3DTIMEMASK + 1) + np.concatenate(
+            [dtime, np.zeros(len(markers), dtype=np.uint32)])
+        order = np.argsort(sortKey, kind="stable")
+        return self._encode(coarse[order], bits[order], T3WRAPAROUND, T3NSYNCMASK)
+
+    def _encode(self, coarse, bits, wraparound, countMask):
+        records, self.lastWrap = encodeRecords(coarse, bits, wraparound, countMask,
+                                               self.lastWrap)
+        return records
+
+
+# syntheticRecords
+# Returns nRecords records of a SyntheticStream with the given settings.
+def syntheticRecords(mode, nRecords, **settings):
+    return SyntheticStream(mode, **settings).read(nRecords)
+
+
+# SimulatedHydraHarp
+# Stands in for a HydraHarp (see device.py) in T2 or T3 mode. Between
+# startMeas and the end of the acquisition time, the records of a
+# SyntheticStream flow into a simulated FiFo at the rate they would arrive
+# at, readFiFo takes them out. If the FiFo is not emptied fast enough it
+# overruns like the real one: FLAG_FIFOFULL is set and no more records come.
+# The records are generated at startMeas, so that readFiFo costs no more
+# than a copy, as the driver call. Measurements longer than PREGENERATE
+# records repeat them.
+# In histogramming and continuous mode the histograms fill with the photons
+# of the stream as the time runs, with the T3 dtime distribution, and
+# getContModeBlock hands out a block every tacq ms until stopMeas.
+# mode: MODE_T2, MODE_T3, MODE_HIST or MODE_CONT
+# fifoSize: capacity of the simulated FiFo in records
+# readTimeout: s readFiFo waits for the FiFo to fill the buffer, 0 to
+#              return at once with what is there
+# streamSettings: passed on to SyntheticStream (photonRate, syncRate, ...)
+class SimulatedHydraHarp:
+    def __init__(self, mode=MODE_T2, fifoSize=FIFOSIZE, serial="SIM00001",
+                 readTimeout=READTIMEOUT, **streamSettings):
+        self.devidx = None
+        self.serial = serial
+        self.mode = mode
+        self.settings = None
+        self.numChannels = streamSettings.get("nChannels", 8)
+        self.histoLen = MAXHISTLEN
+        self.enabled = [True] * self.numChannels
+        self.measControl = MEASCTRL_SINGLESHOT_CTC
+        self.histograms = np.zeros((self.numChannels, MAXHISTLEN), dtype=np.uint32)
+        self.filled = 0.0 # s of the measurement already in the histograms
+        self.nBlocks = 0 # continuous mode blocks handed out
+        self.fifoSize = fifoSize
+        self.readTimeout = readTimeout
+        self.streamSettings = streamSettings
+        self.stream = None
+        self.records = None
+        self.recordsMode = None
+        self.recordRate = 0.0
+        self.startTime = None
+        self.tacq = 0
+        self.delivered = 0 # records read from the FiFo so far
+        self.overrun = False
+
+    def open(self):
+        return self.serial
+
+    def close(self):
+        self.stopMeas()
+
+    def initialize(self, mode, refSource=0):
+        self.mode = mode
+
+    def hardwareInfo(self):
+        return ("HydraHarp 400 (simulated)", "000000", "0.0")
+
+    def calibrate(self):
+        pass
+
+    def setup(self, mode, settings=None, refSource=0):
+        self.initialize(mode, refSource)
+        self.settings = dict(settings or {})
+
+    def getResolution(self):
+        return float(self.streamSettings.get("resolution", 1))
+
+    def getSyncRate(self):
+        return int(SyntheticStream(self._streamMode(), **self.streamSettings).syncRate)
+
+    def getCountRate(self, channel):
+        return int(self.streamSettings.get("photonRate", 1e6) / self.numChannels)
+
+    def getSyncPeriod(self):
+        return 1.0 / self.getSyncRate()
+
+    def getWarnings(self):
+        return ""
+
+    # startMeas
+    # tacq: acquisition time in ms
+    def startMeas(self, tacq):
+        self.stream = SyntheticStream(self._streamMode(), **self.streamSettings)
+        self.recordRate = expectedRecordRate(self.stream)
+        if self.mode in (MODE_T2, MODE_T3):
+            total = min(int(self.recordRate * tacq / 1000.0) + 1, PREGENERATE)
+            # Every measurement gets the same stream, so the records of an
+            # earlier one are used again, and a restart takes no time, as on
+            # the device
+            if (self.records is None or self.recordsMode != self.mode
+                    or len(self.records) < total):
+                self.records = self.stream.read(total)
+                self.recordsMode = self.mode
+        self.tacq = tacq
+        self.filled = 0.0
+        self.nBlocks = 0
+        self.delivered = 0
+        self.overrun = False
+        self.startTime = time.perf_counter()
+
+    def stopMeas(self):
+        if self.startTime is not None:
+            self.tacq = min(self.tacq, int(1000 * self.elapsed()))
+
+    # elapsed
+    # Seconds since startMeas, stopping at the end of the acquisition time.
+    def elapsed(self):
+        if self.mode == MODE_CONT:
+            return time.perf_counter() - self.startTime
+        return min(time.perf_counter() - self.startTime, self.tacq / 1000.0)
+
+    # Records waiting in the FiFo
+    def _backlog(self):
+        backlog = int(self.elapsed() * self.recordRate) - self.delivered
+        if backlog > self.fifoSize:
+            self.overrun = True
+        return min(backlog, self.fifoSize)
+
+    def getFlags(self):
+        if self.mode in (MODE_T2, MODE_T3):
+            self._backlog()
+        return FLAG_FIFOFULL if self.overrun else 0
+
+    # readFiFo
+    # Copies up to count waiting records into the ctypes buffer and returns
+    # their number. Like the driver call, waits up to readTimeout for the
+    # FiFo to hold count records.
+    def readFiFo(self, buffer, count=TTREADMAX):
+        deadline = time.perf_counter() + self.readTimeout
+        while (not self.overrun and self._backlog() < count
+               and time.perf_counter() < deadline and not self.ctcStatus()):
+            time.sleep(0.001)
+        nRecords = 0 if self.overrun else min(self._backlog(), count)
+        if nRecords == 0:
+            return 0
+        target = np.frombuffer(buffer, dtype=np.uint32, count=nRecords)
+        first = self.delivered % len(self.records)
+        part = min(nRecords, len(self.records) - first)
+        target[:part] = self.records[first:first + part]
+        target[part:] = self.records[:nRecords - part]
+        self.delivered += nRecords
+        return nRecords
+
+    def ctcStatus(self):
+        return time.perf_counter() - self.startTime >= self.tacq / 1000.0
+
+    # Histogramming and continuous mode
+
+    def _streamMode(self):
+        return self.mode if self.mode in (MODE_T2, MODE_T3) else MODE_T3
+
+    # The histograms collected over seconds s, shape (numChannels, histoLen)
+    def _collect(self, seconds):
+        stream = self.stream
+        bins = np.arange(self.histoLen) * float(stream.resolution)
+        shape = np.exp(-bins / stream.lifetime)
+        shape *= stream.photonRate / self.numChannels * seconds / shape.sum()
+        counts = stream.rng.poisson(shape, size=(self.numChannels, self.histoLen))
+        return counts.astype(np.uint32) * np.array(self.enabled, dtype=np.uint32)[:, None]
+
+    def setInputChannelEnable(self, channel, enable=True):
+        self.enabled[channel] = bool(enable)
+
+    def setMeasControl(self, control, startEdge=1, stopEdge=1):
+        self.measControl = control
+
+    def setHistoLen(self, lenCode=MAXLENCODE):
+        self.histoLen = 1024 << lenCode
+        self.histograms = np.zeros((self.numChannels, self.histoLen), dtype=np.uint32)
+        return self.histoLen
+
+    def setStopOverflow(self, stop, stopCount):
+        pass
+
+    def clearHistMem(self):
+        self.histograms[:] = 0
+
+    def getHistogram(self, channel, clear=0):
+        if self.startTime is not None and self.elapsed() > self.filled:
+            self.histograms += self._collect(self.elapsed() - self.filled)
+            self.filled = self.elapsed()
+        counts = self.histograms[channel].copy()
+        if clear:
+            self.histograms[channel] = 0
+        return counts
+
+    def getHistograms(self, clear=0):
+        return np.array([self.getHistogram(i, clear) for i in range(0, self.numChannels)],
+                        dtype=np.uint32).reshape(self.numChannels, self.histoLen)
+
+    def getElapsedMeasTime(self):
+        return 1000.0 * self.elapsed()
+
+    # getContModeBlock
+    # Fills block with the next block once its histogram time has passed and
+    # returns its size, else returns 0.
+    def getContModeBlock(self, block):
+        if self.elapsed() < (self.nBlocks + 1) * self.tacq / 1000.0:
+            return 0
+        channels = sum(self.enabled)
+        histograms = self._collect(self.tacq / 1000.0)[np.array(self.enabled)]
+        data = np.zeros((channels, self.histoLen + 2), dtype=np.uint32)
+        data[:, :self.histoLen] = histograms
+        data[:, self.histoLen:] = (histograms.sum(axis=1, dtype=np.uint64)
+                                   .reshape(channels, 1).view(np.uint32))
+        block.channels = channels
+        block.histoLen = self.histoLen
+        block.blockNum = self.nBlocks
+        block.startTime = self.nBlocks * self.tacq * 1000000
+        block.ctcTime = self.tacq * 1000000
+        ct.memmove(block.data, data.tobytes(), data.nbytes)
+        self.nBlocks += 1
+        return blockSize(channels, self.histoLen)
+
+
+# expectedRecordRate
+# Records per s a stream produces on average, overflow records included.
+def expectedRecordRate(stream):
+    rate = stream.photonRate + stream.markerRate
+    if stream.mode == MODE_T2:
+        rate += stream.syncRate + 1e12 / (T2WRAPAROUND_V2 * stream.resolution)
+    else:
+        rate += stream.syncRate / T3WRAPAROUND
+    return rate
@@ -0,0 +1,120 @@
+# HydraHarp 400  HHLIB v3.0  Exact integer time base.
+#
+# Decoded events carry their times as integers: T2 timetags in units of the
+# base resolution and T3 event times as sync index plus dtime. TimeBase
+# keeps resolution and sync period as exact fractions of a picosecond, so
+# that integer times can be turned into picoseconds without rounding, and
+# into seconds only on demand, vectorized over whole arrays.
+# Nothing here is needed in the acquisition hot path.
+
+from fractions import Fraction
+import numpy as np
+
+from .decode import MODE_T2, MODE_T3
+from .events import EVENT_MARKER
+
+INT64MAX = 2**63 - 1
+
+
+# toFraction
+# value: int, Fraction, decimal string or float (e.g. from HH_GetResolution)
+# maxDenominator: floats are approximated by the closest fraction with at
+#                 most this denominator, which removes binary noise such
+#                 as 12500.000000000002
+def toFraction(value, maxDenominator=1000000):
+    if isinstance(value, float):
+        return Fraction(value).limit_denominator(maxDenominator)
+    return Fraction(value)
+
+# scaleExact
+# Returns floor(ticks * ratio) and the remainder (in units of 1/denominator)
+# as integer arrays. Falls back to Python ints where int64 would overflow.
+def scaleExact(ticks, ratio):
+    ticks = np.asarray(ticks, dtype=np.int64)
+    num, den = ratio.numerator, ratio.denominator
+    if ticks.size > 0 and int(np.abs(ticks).max()) * num > INT64MAX:
+        ticks = ticks.astype(object)
+    scaled = ticks * num
+    return scaled // den, scaled % den
+
+
+# TimeBase
+# mode: MODE_T2 or MODE_T3
+# resolution: T2 base resolution or T3 dtime bin width in ps, as read by
+#             HH_GetResolution
+# syncPeriod: T3 only, sync period in ps (e.g. Fraction(10**12, syncRate)),
+#             see also fromDevice
+class TimeBase:
+    __slots__ = ("mode", "resolution", "syncPeriod")
+
+    def __init__(self, mode, resolution, syncPeriod=None):
+        if mode not in (MODE_T2, MODE_T3):
+            raise ValueError("TimeBase supports only MODE_T2 and MODE_T3, not %r" % mode)
+        if mode == MODE_T3 and syncPeriod is None:
+            raise ValueError("T3 mode needs the sync period")
+        self.mode = mode
+        self.resolution = toFraction(resolution)
+        self.syncPeriod = None if syncPeriod is None else toFraction(syncPeriod)
+
+    # fromDevice
+    # Builds the time base from the values the demos read from the library:
+    # resolution in ps (HH_GetResolution) and syncPeriod in s (HH_GetSyncPeriod).
+    @classmethod
+    def fromDevice(cls, mode, resolution, syncPeriod=None):
+        if mode == MODE_T3:
+            syncPeriod = toFraction(syncPeriod * 1e12)
+        else:
+            syncPeriod = None
+        return cls(mode, resolution, syncPeriod)
+
+    # tickPeriod
+    # Duration of one unit of the event time (T2 timetag or T3 nsync) in ps.
+    def tickPeriod(self):
+        return self.resolution if self.mode == MODE_T2 else self.syncPeriod
+
+    # toPicoseconds
+    # ticks: T2 timetags or T3 nsync values
+    # Returns the times in whole ps (rounded down if the tick period is not
+    # an integer number of ps), exact in integer arithmetic.
+    def toPicoseconds(self, ticks):
+        return scaleExact(ticks, self.tickPeriod())[0]
+
+    # toSeconds
+    # ticks: T2 timetags or T3 nsync values
+    # Returns the times in s as float64 array, computed from the exact value.
+    def toSeconds(self, ticks):
+        ratio = self.tickPeriod()
+        whole, rest = scaleExact(ticks, ratio)
+        seconds = np.asarray(whole, dtype=np.float64) / 1e12
+        seconds += np.asarray(rest, dtype=np.float64) / (ratio.denominator * 1e12)
+        return seconds
+
+    # dtimeToPicoseconds
+    # dtime: T3 dtime values, returns them in whole ps
+    def dtimeToPicoseconds(self, dtime):
+        return scaleExact(dtime, self.resolution)[0]
+
+    # eventPicoseconds
+    # events: T2EVENT or T3EVENT array
+    # Returns the absolute event times in whole ps, for T3 photons the sync
+    # time plus dtime. T3 markers have no dtime.
+    def eventPicoseconds(self, events):
+        if self.mode == MODE_T2:
+            return self.toPicoseconds(events["timetag"])
+        dtime = np.where(events["flags"] & EVENT_MARKER, 0, events["dtime"])
+        return self.toPicoseconds(events["nsync"]) + self.dtimeToPicoseconds(dtime)
+
+    # snapshot
+    # Returns the time base as a plain dict with the fractions as strings.
+    def snapshot(self):
+        return {
+            "mode": self.mode,
+            "resolution": str(self.resolution),
+            "syncPeriod": None if self.syncPeriod is None else str(self.syncPeriod),
+        }
+
+    # fromSnapshot
+    # Recreates a time base from a dict as returned by snapshot().
+    @classmethod
+    def fromSnapshot(cls, state):
+        return cls(state["mode"], state["resolution"], state["syncPeriod"])
@@ -0,0 +1,58 @@
+# HydraHarp 400  HHLIB v3.0  Measurement completion benchmark.
+#
+# Waits for the end of histogramming measurements on a SimulatedHydraHarp,
+# spinning on the CTC status as the demos did, with the doubling poll
+# interval and with a CompletionWaiter, blocking and awaited. Shows the
+# CTC status polls, the CPU time used while waiting and how late the end
+# was noticed.
+#
+# Usage: python -m hydraharp.waitbench [tacq/ms]
+
+import asyncio
+import sys
+import time
+
+from .completion import CompletionWaiter, MAXINTERVAL
+from .device import MODE_HIST
+from .pollbench import CountingDevice
+from .synth import SimulatedHydraHarp
+
+
+def spin(device, tacq):
+    while not device.ctcStatus():
+        pass
+
+def backoff(device, tacq):
+    pollInterval = 0.001
+    while not device.ctcStatus():
+        time.sleep(pollInterval)
+        pollInterval = min(2 * pollInterval, MAXINTERVAL, tacq / 20000.0)
+
+def blocking(device, tacq):
+    CompletionWaiter(device, tacq).wait()
+
+def awaited(device, tacq):
+    async def measure():
+        await CompletionWaiter(device, tacq)
+    asyncio.run(measure())
+
+WAYS = [("spin", spin), ("backoff", backoff), ("waiter", blocking), ("await", awaited)]
+
+def main(argv):
+    tacqs = [int(argv[1])] if len(argv) > 1 else [100, 1000, 3000]
+    print("%8s  %-8s %8s %8s %9s" % ("tacq", "waiting", "polls", "CPU", "late"))
+    for tacq in tacqs:
+        for label, wait in WAYS:
+            device = CountingDevice(SimulatedHydraHarp(MODE_HIST))
+            device.device.startMeas(tacq)
+            cpu = time.process_time()
+            wait(device, tacq)
+            ended = time.perf_counter()
+            cpu = time.process_time() - cpu
+            late = ended - device.device.startTime - tacq / 1000.0
+            print("%6dms  %-8s %8d %7.0f%% %7.2fms"
+                  % (tacq, label, device.nCalls, 100 * cpu / (tacq / 1000.0), 1000 * late))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,109 @@
+# HydraHarp 400  HHLIB v3.0  Raw output writers.
+#
+# The demos write their raw output through an ordinary buffered file. On
+# long runs the file then grows in many small steps, which fragments it,
+# and every so often a write stalls while the system flushes its cache.
+# MappedWriter instead preallocates the file in large extents and copies
+# the data into a memory mapped window of it, which moves on through the
+# file as the data comes. The system writes the mapped pages back in the
+# background. On close the file is truncated to the size of the data,
+# at the latest when the interpreter exits, so that a program ending
+# without close does not leave the preallocated extents behind.
+#
+# MappedWriter can be used wherever the demos use their output file, e.g.
+# outputfile.write(memoryview(buffer)[0:nRecords]) or outf.write(block).
+
+import atexit
+import mmap
+import os
+
+EXTENT = 256 * 1024 * 1024 # bytes the file is extended by at a time
+WINDOW = 32 * 1024 * 1024  # bytes mapped at a time
+
+
+# MappedWriter
+# filename: the output file, an existing file is overwritten
+# extent: bytes to preallocate at a time
+# window: bytes to map at a time, rounded to the allocation granularity
+class MappedWriter:
+    def __init__(self, filename, extent=EXTENT, window=WINDOW):
+        granularity = mmap.ALLOCATIONGRANULARITY
+        self.window = max(granularity, window - window % granularity)
+        self.extent = max(self.window, extent - extent % self.window)
+        self.file = open(filename, "wb+")
+        self.map = None
+        self.mapStart = 0 # file offset of the mapped window
+        self.allocated = 0 # bytes preallocated
+        self.size = 0 # bytes written
+        self.nExtents = 0
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, exc, traceback):
+        self.close()
+
+    # Grows the file by one extent, as one contiguous allocation where the
+    # system offers that
+    def _allocate(self):
+        newSize = self.allocated + self.extent
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(self.file.fileno(), self.allocated, self.extent)
+        else:
+            self.file.truncate(newSize)
+        self.allocated = newSize
+        self.nExtents += 1
+
+    # Maps the window starting at start, the file must not be resized while
+    # a window is mapped
+    def _map(self, start):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        while start + self.window > self.allocated:
+            self._allocate()
+        self.map = mmap.mmap(self.file.fileno(), self.window, offset=start)
+        self.mapStart = start
+
+    # write
+    # data: any bytes-like object, e.g. a memoryview of the FiFo buffer
+    # Returns the number of bytes written.
+    def write(self, data):
+        try:
+            data = memoryview(data).cast("B")
+        except TypeError:
+            data = memoryview(bytes(data))
+        n = len(data)
+        done = 0
+        while done < n:
+            offset = self.size - self.mapStart
+            if self.map is None or offset >= self.window:
+                self._map(self.size - self.size % self.window)
+                offset = self.size - self.mapStart
+            part = min(n - done, self.window - offset)
+            self.map[offset:offset + part] = data[done:done + part]
+            done += part
+            self.size += part
+        return n
+
+    def tell(self):
+        return self.size
+
+    # flush
+    # Writes the mapped window back to the file.
+    def flush(self):
+        if self.map is not None:
+            self.map.flush()
+
+    # close
+    # Unmaps the window and truncates the file to the data written.
+    def close(self):
+        if self.file.closed:
+            return
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.truncate(self.size)
+        self.file.close()
+        atexit.unregister(self.close)